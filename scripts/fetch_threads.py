@@ -3,35 +3,123 @@
 
 import json
 import os
-import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from github_client import (
+    GitHubError,
+    get_client,
+    run_gh,
+    suggested_concurrency,
+    use_gh_cli,
+)
+
+# GitHub caps connection pages at 100 nodes. Threads are paged sequentially;
+# each comes with its first 10 comments, and longer threads are completed
+# with concurrent follow-up requests.
+MAX_PAGE_SIZE = 100
+COMMENT_WORKERS = 8
+
+COMMENT_PAGE_FRAGMENT = """
+fragment CommentPage on PullRequestReviewCommentConnection {
+  totalCount
+  pageInfo {
+    hasNextPage
+    endCursor
+  }
+  nodes {
+    id
+    databaseId
+    author {
+      login
+    }
+    body
+    createdAt
+  }
+}
+"""
+
+THREAD_PAGE_FRAGMENT = (
+    """
+fragment ThreadPage on PullRequestReviewThreadConnection {
+  totalCount
+  pageInfo {
+    hasNextPage
+    endCursor
+  }
+  nodes {
+    id
+    isResolved
+    path
+    line
+    startLine
+    isOutdated
+    diffSide
+    viewerCanResolve
+    comments(first: 10) {
+      ...CommentPage
+    }
+  }
+}
+"""
+    + COMMENT_PAGE_FRAGMENT
+)
+
+# Thread listing without comment bodies, used with the thread cache. A thread
+# is refetched only if its comment count or newest comment changed.
+THREAD_INDEX_FRAGMENT = """
+fragment ThreadPage on PullRequestReviewThreadConnection {
+  totalCount
+  pageInfo {
+    hasNextPage
+    endCursor
+  }
+  nodes {
+    id
+    isResolved
+    path
+    line
+    startLine
+    isOutdated
+    diffSide
+    viewerCanResolve
+    comments(last: 1) {
+      totalCount
+      nodes {
+        updatedAt
+      }
+    }
+  }
+}
+"""
+
+THREADS_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!, $first: Int!, $after: String) {
+  repository(owner: $owner, name: $repo) {
+    pullRequest(number: $number) {
+      reviewThreads(first: $first, after: $after) {
+        ...ThreadPage
+      }
+    }
+  }
+}
+"""
 
+QUERY = THREADS_QUERY + THREAD_PAGE_FRAGMENT
+INDEX_QUERY = THREADS_QUERY + THREAD_INDEX_FRAGMENT
 
-QUERY = """
-query($owner: String!, $repo: String!, $number: Int!) {
+FILES_QUERY = """
+query($owner: String!, $repo: String!, $number: Int!, $after: String) {
   repository(owner: $owner, name: $repo) {
     pullRequest(number: $number) {
-      reviewThreads(first: 100) {
-        totalCount
+      files(first: 100, after: $after) {
+        pageInfo {
+          hasNextPage
+          endCursor
+        }
         nodes {
-          id
-          isResolved
           path
-          line
-          startLine
-          viewerCanResolve
-          comments(first: 10) {
-            totalCount
-            nodes {
-              id
-              databaseId
-              author {
-                login
-              }
-              body
-              createdAt
-            }
-          }
         }
       }
     }
@@ -39,9 +127,73 @@ query($owner: String!, $repo: String!, $number: Int!) {
 }
 """
 
+# Which threads reach the prompt: all of them, those on files the PR changes,
+# or those on the triggering inline comment's file
+THREAD_SCOPES = ("all", "changed_files", "diff_path")
+DEFAULT_THREAD_SCOPE = "all"
+
+CACHE_VERSION = 1
+
+# Budgeted summaries: threads that don't fit in full are listed as stubs
+STUB_BODY_CHARS = 80
+STUBS_HEADER = "### {count} more thread(s), summarized\n"
+OMITTED_LINE = "- ...and {count} more thread(s) not shown\n"
+
+COMMENTS_QUERY = (
+    """
+query($id: ID!, $first: Int!, $after: String) {
+  node(id: $id) {
+    ... on PullRequestReviewThread {
+      comments(first: $first, after: $after) {
+        ...CommentPage
+      }
+    }
+  }
+}
+"""
+    + COMMENT_PAGE_FRAGMENT
+)
+
+# First comment pages of up to MAX_PAGE_SIZE threads in one request, used to
+# refetch stale threads from the cache
+THREAD_COMMENTS_QUERY = (
+    """
+query($ids: [ID!]!, $first: Int!) {
+  nodes(ids: $ids) {
+    ... on PullRequestReviewThread {
+      id
+      comments(first: $first) {
+        ...CommentPage
+      }
+    }
+  }
+}
+"""
+    + COMMENT_PAGE_FRAGMENT
+)
+
+
+def run_graphql_http(query: str, variables: dict) -> dict | None:
+    """Execute a GraphQL request over HTTP, failing like gh does on errors."""
+    try:
+        response = get_client().graphql(query, variables)
+    except GitHubError as exc:
+        print(f"GraphQL error: {exc}", file=sys.stderr)
+        return None
+
+    errors = response.get("errors")
+    if errors:
+        messages = "; ".join(e.get("message", "") for e in errors)
+        print(f"GraphQL error: {messages}", file=sys.stderr)
+        return None
+    return response
+
 
 def run_graphql(query: str, variables: dict) -> dict | None:
-    """Execute a GraphQL query via gh api."""
+    """Execute a GraphQL query via the shared client or gh api."""
+    if not use_gh_cli():
+        return run_graphql_http(query, variables)
+
     cmd = [
         "gh",
         "api",
@@ -51,12 +203,17 @@ def run_graphql(query: str, variables: dict) -> dict | None:
     ]
 
     for key, value in variables.items():
-        if isinstance(value, int):
+        if value is None:
+            # Omitted variables are null, e.g. the cursor for the first page
+            continue
+        if isinstance(value, bool):
+            cmd.extend(["-F", f"{key}={str(value).lower()}"])
+        elif isinstance(value, int):
             cmd.extend(["-F", f"{key}={value}"])
         else:
             cmd.extend(["-f", f"{key}={value}"])
 
-    result = subprocess.run(cmd, capture_output=True, text=True, check=False)
+    result = run_gh(cmd)
 
     if result.returncode != 0:
         print(f"GraphQL error: {result.stderr}", file=sys.stderr)
@@ -69,81 +226,453 @@ def run_graphql(query: str, variables: dict) -> dict | None:
         return None
 
 
-def fetch_unresolved_threads(owner: str, repo: str, pr_number: int) -> list[dict]:
+def fetch_thread_nodes(
+    owner: str,
+    repo: str,
+    pr_number: int,
+    query: str = QUERY,
+    first_page: dict | None = None,
+) -> list[dict] | None:
+    """Page through all review threads, following the reviewThreads cursor.
+
+    Pages after the first are sized from totalCount so the last request asks
+    for exactly the threads that remain. first_page is a reviewThreads
+    connection that was already fetched (e.g. by prefetch_context.py).
+
+    Returns:
+        Thread nodes, or None if the first page couldn't be fetched
+    """
+    variables = {
+        "owner": owner,
+        "repo": repo,
+        "number": pr_number,
+        "first": MAX_PAGE_SIZE,
+        "after": None,
+    }
+    threads: list[dict] = []
+    while True:
+        if first_page is not None:
+            response = {
+                "data": {"repository": {"pullRequest": {"reviewThreads": first_page}}}
+            }
+            first_page = None
+        else:
+            response = run_graphql(query, variables)
+        if not response:
+            if not threads:
+                return None
+            print(
+                f"Warning: Stopped after {len(threads)} review threads",
+                file=sys.stderr,
+            )
+            return threads
+
+        try:
+            review_threads = response["data"]["repository"]["pullRequest"][
+                "reviewThreads"
+            ]
+            nodes = review_threads["nodes"]
+        except (KeyError, TypeError):
+            return threads or None
+
+        threads.extend(nodes)
+        page_info = review_threads.get("pageInfo") or {}
+        if not page_info.get("hasNextPage") or not nodes:
+            return threads
+
+        remaining = review_threads.get("totalCount", 0) - len(threads)
+        variables["first"] = max(1, min(MAX_PAGE_SIZE, remaining))
+        variables["after"] = page_info.get("endCursor")
+
+
+def fetch_remaining_comments(thread: dict) -> list[dict]:
+    """Fetch the comments of a thread beyond the first page.
+
+    Returns:
+        All comment nodes of the thread, in order
+    """
+    comments = thread.get("comments") or {}
+    nodes = list(comments.get("nodes") or [])
+    page_info = comments.get("pageInfo") or {}
+    total = comments.get("totalCount", len(nodes))
+
+    while page_info.get("hasNextPage"):
+        variables = {
+            "id": thread.get("id"),
+            "first": max(1, min(MAX_PAGE_SIZE, total - len(nodes))),
+            "after": page_info.get("endCursor"),
+        }
+        response = run_graphql(COMMENTS_QUERY, variables)
+        try:
+            page = response["data"]["node"]["comments"]
+        except (KeyError, TypeError):
+            print(
+                f"Warning: Only fetched {len(nodes)} of {total} comments "
+                f"for thread {thread.get('id')}",
+                file=sys.stderr,
+            )
+            break
+        nodes.extend(page.get("nodes") or [])
+        page_info = page.get("pageInfo") or {}
+
+    return nodes
+
+
+def has_more_comments(thread: dict) -> bool:
+    comments = thread.get("comments") or {}
+    return bool((comments.get("pageInfo") or {}).get("hasNextPage"))
+
+
+def fetch_comments_concurrently(threads: list[dict]) -> list[list[dict]]:
+    """Complete the comments of several threads in parallel, preserving order."""
+    if not threads:
+        return []
+    workers = suggested_concurrency(min(COMMENT_WORKERS, len(threads)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fetch_remaining_comments, threads))
+
+
+def fetch_first_comment_pages(threads: list[dict]) -> None:
+    """Fill in the first comment page of threads, MAX_PAGE_SIZE at a time.
+
+    Threads are updated in place. A chunk that fails keeps its placeholder
+    page, so fetch_comments_concurrently fetches those threads one by one.
+    """
+    for start in range(0, len(threads), MAX_PAGE_SIZE):
+        chunk = threads[start : start + MAX_PAGE_SIZE]
+        largest = max(thread_version(t)[0] for t in chunk)
+        variables = {
+            "ids": [t["id"] for t in chunk],
+            "first": max(1, min(MAX_PAGE_SIZE, largest)),
+        }
+        response = run_graphql(THREAD_COMMENTS_QUERY, variables)
+        try:
+            nodes = response["data"]["nodes"]
+        except (KeyError, TypeError):
+            continue
+        pages = {n.get("id"): n.get("comments") for n in nodes if n}
+        for thread in chunk:
+            if pages.get(thread["id"]):
+                thread["comments"] = pages[thread["id"]]
+
+
+def format_thread(thread: dict, comments: list[dict]) -> dict:
+    return {
+        "id": thread.get("id"),
+        "path": thread.get("path"),
+        "line": thread.get("line"),
+        "start_line": thread.get("startLine"),
+        "is_outdated": thread.get("isOutdated", False),
+        "diff_side": thread.get("diffSide"),
+        "can_resolve": thread.get("viewerCanResolve", False),
+        "comments": [
+            {
+                "id": c.get("id"),
+                "database_id": c.get("databaseId"),
+                "author": (c.get("author") or {}).get("login", "unknown"),
+                "body": c.get("body", ""),
+                "created_at": c.get("createdAt"),
+            }
+            for c in comments
+            if c
+        ],
+    }
+
+
+def fetch_changed_files(owner: str, repo: str, pr_number: int) -> set[str] | None:
+    """Paths changed by the pull request, or None if they couldn't be fetched."""
+    variables = {"owner": owner, "repo": repo, "number": pr_number, "after": None}
+    paths: set[str] = set()
+    while True:
+        response = run_graphql(FILES_QUERY, variables)
+        try:
+            files = response["data"]["repository"]["pullRequest"]["files"]
+        except (KeyError, TypeError):
+            return None
+        paths.update(f["path"] for f in files.get("nodes") or [] if f)
+        page_info = files.get("pageInfo") or {}
+        if not page_info.get("hasNextPage"):
+            return paths
+        variables["after"] = page_info.get("endCursor")
+
+
+def select_threads(
+    nodes: list[dict],
+    exclude_outdated: bool = False,
+    paths: set[str] | None = None,
+) -> list[dict]:
+    """Keep unresolved threads, optionally only current ones on the given paths."""
+    return [
+        t
+        for t in nodes
+        if t
+        and not t.get("isResolved", True)
+        and not (exclude_outdated and t.get("isOutdated"))
+        and (paths is None or t.get("path") in paths)
+    ]
+
+
+def fetch_unresolved_threads(
+    owner: str,
+    repo: str,
+    pr_number: int,
+    cache_dir: str | None = None,
+    first_page: dict | None = None,
+    exclude_outdated: bool = False,
+    paths: set[str] | None = None,
+) -> list[dict]:
     """Fetch all unresolved review threads for a pull request.
 
+    Threads are paged sequentially; threads with more comments than the first
+    page holds have the rest fetched concurrently.
+
     Args:
         owner: Repository owner
         repo: Repository name
         pr_number: Pull request number
+        cache_dir: Directory for the thread cache, or None to fetch everything
+        first_page: Prefetched first reviewThreads page, in the shape of
+            THREAD_INDEX_FRAGMENT when cache_dir is set or THREAD_PAGE_FRAGMENT
+            otherwise
+        exclude_outdated: Skip threads on lines the PR no longer changes
+        paths: Only keep threads on these files
 
     Returns:
         List of unresolved thread objects with their comments
     """
-    variables = {"owner": owner, "repo": repo, "number": pr_number}
-    response = run_graphql(QUERY, variables)
+    if cache_dir:
+        return fetch_unresolved_threads_cached(
+            owner, repo, pr_number, cache_dir, first_page, exclude_outdated, paths
+        )
 
-    if not response:
+    nodes = fetch_thread_nodes(owner, repo, pr_number, first_page=first_page)
+    if not nodes:
         return []
 
+    threads = select_threads(nodes, exclude_outdated, paths)
+
+    comments_by_id = {
+        t.get("id"): (t.get("comments") or {}).get("nodes") or [] for t in threads
+    }
+    long_threads = [t for t in threads if has_more_comments(t)]
+    for thread, comments in zip(
+        long_threads, fetch_comments_concurrently(long_threads)
+    ):
+        comments_by_id[thread.get("id")] = comments
+
+    return [format_thread(t, comments_by_id[t.get("id")]) for t in threads]
+
+
+def get_cache_path(cache_dir: str, owner: str, repo: str, pr_number: int) -> Path:
+    return Path(cache_dir) / f"{owner}-{repo}-{pr_number}.json"
+
+
+def load_thread_cache(path: Path) -> dict[str, dict]:
+    """Load cached threads keyed by thread ID, or {} if missing or stale."""
     try:
-        review_threads = response["data"]["repository"]["pullRequest"]["reviewThreads"]
-        threads = review_threads["nodes"]
-        total_threads = review_threads.get("totalCount", len(threads))
-    except (KeyError, TypeError):
-        return []
+        data = json.loads(path.read_text())
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if not isinstance(data, dict) or data.get("version") != CACHE_VERSION:
+        return {}
+    threads = data.get("threads")
+    return threads if isinstance(threads, dict) else {}
 
-    # Warn if pagination limits might be truncating data
-    if total_threads > 100:
-        print(
-            f"Warning: PR has {total_threads} review threads, but only fetching first 100",
-            file=sys.stderr,
-        )
 
-    unresolved = []
+def save_thread_cache(path: Path, threads: dict[str, dict]) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"version": CACHE_VERSION, "threads": threads}))
+        tmp_path.replace(path)
+    except OSError as exc:
+        print(f"Warning: Could not write thread cache: {exc}", file=sys.stderr)
+
+
+def thread_version(thread: dict) -> list:
+    """Comment count and newest comment's updatedAt, which change on activity."""
+    comments = thread.get("comments") or {}
+    last = (comments.get("nodes") or [None])[-1] or {}
+    return [comments.get("totalCount", 0), last.get("updatedAt")]
+
+
+def fetch_unresolved_threads_cached(
+    owner: str,
+    repo: str,
+    pr_number: int,
+    cache_dir: str,
+    first_page: dict | None = None,
+    exclude_outdated: bool = False,
+    paths: set[str] | None = None,
+) -> list[dict]:
+    """Fetch unresolved threads, reusing cached comments for unchanged threads.
+
+    Threads are listed without comment bodies; only threads that are new or
+    whose version changed since the last run have their comments fetched,
+    with their first pages batched into one request per MAX_PAGE_SIZE threads.
+    """
+    path = get_cache_path(cache_dir, owner, repo, pr_number)
+    cache = load_thread_cache(path)
+
+    nodes = fetch_thread_nodes(owner, repo, pr_number, INDEX_QUERY, first_page)
+    if not nodes:
+        return []
+    # Filtered-out threads never have their comments fetched
+    threads = select_threads(nodes, exclude_outdated, paths)
+
+    comments_by_id: dict[str, list[dict]] = {}
+    stale = []
     for thread in threads:
-        if thread and not thread.get("isResolved", True):
-            comments_data = thread.get("comments", {})
-            comments_nodes = comments_data.get("nodes", [])
-            comments_total = comments_data.get("totalCount", len(comments_nodes))
-
-            # Warn if this thread has more comments than we fetched
-            if comments_total > 10:
-                print(
-                    f"Warning: Thread {thread.get('id')} has {comments_total} "
-                    "comments, but only fetching first 10",
-                    file=sys.stderr,
-                )
-
-            unresolved.append(
+        thread_id = thread.get("id")
+        cached = cache.get(thread_id) or {}
+        if cached.get("version") == thread_version(thread):
+            comments_by_id[thread_id] = cached.get("comments", [])
+        elif thread_version(thread)[0] == 0:
+            comments_by_id[thread_id] = []
+        else:
+            total = thread_version(thread)[0]
+            stale.append(
                 {
-                    "id": thread.get("id"),
-                    "path": thread.get("path"),
-                    "line": thread.get("line"),
-                    "start_line": thread.get("startLine"),
-                    "can_resolve": thread.get("viewerCanResolve", False),
-                    "comments": [
-                        {
-                            "id": c.get("id"),
-                            "database_id": c.get("databaseId"),
-                            "author": c.get("author", {}).get("login", "unknown"),
-                            "body": c.get("body", ""),
-                            "created_at": c.get("createdAt"),
-                        }
-                        for c in comments_nodes
-                        if c
-                    ],
+                    "id": thread_id,
+                    "comments": {
+                        "totalCount": total,
+                        "nodes": [],
+                        "pageInfo": {"hasNextPage": total > 0, "endCursor": None},
+                    },
                 }
             )
 
-    return unresolved
+    print(
+        f"Thread cache: {len(threads) - len(stale)} reused, {len(stale)} refetched",
+        file=sys.stderr,
+    )
+    fetch_first_comment_pages(stale)
+    for thread in stale:
+        comments_by_id[thread["id"]] = thread["comments"].get("nodes") or []
+    long_threads = [t for t in stale if has_more_comments(t)]
+    for thread, comments in zip(
+        long_threads, fetch_comments_concurrently(long_threads)
+    ):
+        comments_by_id[thread["id"]] = comments
+
+    # Only selected threads are kept, so resolved ones drop out of the cache
+    save_thread_cache(
+        path,
+        {
+            t.get("id"): {
+                "version": thread_version(t),
+                "comments": comments_by_id[t.get("id")],
+            }
+            for t in threads
+            if len(comments_by_id[t.get("id")]) == thread_version(t)[0]
+        },
+    )
+
+    return [format_thread(t, comments_by_id[t.get("id")]) for t in threads]
+
+
+def thread_location(thread: dict) -> str:
+    path = thread.get("path", "unknown")
+    line = thread.get("line")
+    start_line = thread.get("start_line")
+
+    if start_line and start_line != line:
+        return f"{path}:{start_line}-{line}"
+    if line:
+        return f"{path}:{line}"
+    return path
+
+
+def format_thread_section(thread: dict, index: int) -> str:
+    """Format one thread with its comments."""
+    lines = [f"### Thread {index}: `{thread_location(thread)}`"]
+    lines.append(f"- **Thread ID**: `{thread.get('id')}`")
+    lines.append(f"- **Can Resolve**: {thread.get('can_resolve', False)}")
+    if thread.get("is_outdated"):
+        lines.append("- **Outdated**: the commented lines have since changed")
+
+    comments = thread.get("comments", [])
+    if comments:
+        lines.append("- **Comments**:")
+        for comment in comments:
+            author = comment.get("author", "unknown")
+            database_id = comment.get("database_id")
+            body = comment.get("body", "").strip()
+            # Truncate long comments in summary
+            if len(body) > 200:
+                body = body[:197] + "..."
+            lines.append(f"  - **Comment ID**: `{database_id}`")
+            lines.append(f"  - @{author}: {body}")
+
+    lines.append("")
+    return "\n".join(lines) + "\n"
+
+
+def format_thread_stub(thread: dict) -> str:
+    """Format a thread as one line: ID, location and the first comment."""
+    comments = thread.get("comments", [])
+    stub = f"- `{thread.get('id')}` `{thread_location(thread)}`"
+    if comments:
+        first = comments[0]
+        body = " ".join(first.get("body", "").split())
+        if len(body) > STUB_BODY_CHARS:
+            body = body[: STUB_BODY_CHARS - 3] + "..."
+        stub += f" @{first.get('author', 'unknown')}: {body}"
+    if len(comments) > 1:
+        stub += f" (+{len(comments) - 1} more)"
+    return stub + "\n"
+
+
+def rank_threads(
+    threads: list[dict],
+    trigger_comment_id: str | int | None = None,
+    diff_path: str | None = None,
+) -> list[dict]:
+    """Order threads by relevance.
+
+    The thread containing the triggering comment comes first, then threads on
+    diff_path, then the rest by most recent activity.
+    """
+
+    def last_activity(thread: dict) -> str:
+        return max(
+            (c.get("created_at") or "" for c in thread.get("comments", [])), default=""
+        )
 
+    def is_trigger(thread: dict) -> bool:
+        return trigger_comment_id is not None and any(
+            str(c.get("database_id")) == str(trigger_comment_id)
+            for c in thread.get("comments", [])
+        )
 
-def format_threads_for_prompt(threads: list[dict]) -> str:
+    by_recency = sorted(threads, key=last_activity, reverse=True)
+    return sorted(
+        by_recency,
+        key=lambda t: (
+            not is_trigger(t),
+            not (diff_path and t.get("path") == diff_path),
+        ),
+    )
+
+
+def format_threads_for_prompt(
+    threads: list[dict],
+    max_chars: int | None = None,
+    trigger_comment_id: str | int | None = None,
+    diff_path: str | None = None,
+) -> str:
     """Format threads as a human-readable summary for the prompt.
 
+    Threads are ranked by relevance (see rank_threads). Without a budget
+    every thread is included in full. With max_chars, threads are included in
+    full while they fit; the rest are listed as one-line stubs with their
+    IDs, and any that don't fit even as stubs are counted at the end.
+
     Args:
         threads: List of unresolved thread objects
+        max_chars: Character budget for the summary (about 4 per token)
+        trigger_comment_id: Database ID of the comment that triggered the run
+        diff_path: File of the inline comment that triggered the run
 
     Returns:
         Formatted string summary of threads
@@ -151,40 +680,71 @@ def format_threads_for_prompt(threads: list[dict]) -> str:
     if not threads:
         return "No unresolved review threads."
 
-    lines = [f"Found {len(threads)} unresolved review thread(s):\n"]
-
-    for i, thread in enumerate(threads, 1):
-        path = thread.get("path", "unknown")
-        line = thread.get("line")
-        start_line = thread.get("start_line")
-
-        if start_line and start_line != line:
-            location = f"{path}:{start_line}-{line}"
-        elif line:
-            location = f"{path}:{line}"
-        else:
-            location = path
-
-        lines.append(f"### Thread {i}: `{location}`")
-        lines.append(f"- **Thread ID**: `{thread.get('id')}`")
-        lines.append(f"- **Can Resolve**: {thread.get('can_resolve', False)}")
-
-        comments = thread.get("comments", [])
-        if comments:
-            lines.append("- **Comments**:")
-            for comment in comments:
-                author = comment.get("author", "unknown")
-                database_id = comment.get("database_id")
-                body = comment.get("body", "").strip()
-                # Truncate long comments in summary
-                if len(body) > 200:
-                    body = body[:197] + "..."
-                lines.append(f"  - **Comment ID**: `{database_id}`")
-                lines.append(f"  - @{author}: {body}")
+    header = f"Found {len(threads)} unresolved review thread(s):\n\n"
+    ranked = rank_threads(threads, trigger_comment_id, diff_path)
+    if max_chars is None:
+        sections = [format_thread_section(t, i) for i, t in enumerate(ranked, 1)]
+        return (header + "".join(sections)).rstrip("\n") + "\n"
+
+    parts = [header]
+    used = len(header)
+    # Leave room for the omitted-threads line
+    budget = max_chars - len(OMITTED_LINE.format(count=len(threads)))
+
+    full = 0
+    for thread in ranked:
+        section = format_thread_section(thread, full + 1)
+        # The most relevant thread is always shown in full
+        if full and used + len(section) > budget:
+            break
+        parts.append(section)
+        used += len(section)
+        full += 1
+
+    stubs = ranked[full:]
+    if stubs:
+        stubs_header = STUBS_HEADER.format(count=len(stubs))
+        parts.append(stubs_header)
+        used += len(stubs_header)
+    shown = 0
+    for thread in stubs:
+        stub = format_thread_stub(thread)
+        if used + len(stub) > budget:
+            break
+        parts.append(stub)
+        used += len(stub)
+        shown += 1
+
+    if shown < len(stubs):
+        parts.append(OMITTED_LINE.format(count=len(stubs) - shown))
+
+    return "".join(parts).rstrip("\n") + "\n"
+
+
+def parse_max_chars(value: str | None) -> int | None:
+    """Parse THREADS_MAX_CHARS; empty or 0 means no budget."""
+    if not value or not value.strip():
+        return None
+    try:
+        max_chars = int(value)
+    except ValueError:
+        print(f"Invalid THREADS_MAX_CHARS '{value}', ignoring", file=sys.stderr)
+        return None
+    return max_chars if max_chars > 0 else None
 
-        lines.append("")
 
-    return "\n".join(lines)
+def parse_thread_scope(value: str | None) -> str:
+    """Parse THREADS_SCOPE, falling back to the default."""
+    if not value or not value.strip():
+        return DEFAULT_THREAD_SCOPE
+    scope = value.strip().lower()
+    if scope not in THREAD_SCOPES:
+        print(
+            f"Invalid THREADS_SCOPE '{value}', using {DEFAULT_THREAD_SCOPE}",
+            file=sys.stderr,
+        )
+        return DEFAULT_THREAD_SCOPE
+    return scope
 
 
 def main() -> None:
@@ -205,13 +765,47 @@ def main() -> None:
         print(f"Invalid PR number: {sys.argv[3]}", file=sys.stderr)
         sys.exit(1)
 
-    threads = fetch_unresolved_threads(owner, repo, pr_number)
+    # Imported here because prefetch_context builds its query from ours
+    from prefetch_context import load_context
+
+    cache_dir = os.environ.get("THREAD_CACHE_DIR", "").strip() or None
+    context = load_context(f"{owner}/{repo}", pr_number)
+    first_page = None
+    if context.get("thread_fields") == ("index" if cache_dir else "full"):
+        first_page = context.get("review_threads")
+    scope = parse_thread_scope(os.environ.get("THREADS_SCOPE"))
+    diff_path = os.environ.get("DIFF_PATH") or None
+    paths = None
+    if scope == "diff_path" and diff_path:
+        paths = {diff_path}
+    elif scope == "changed_files":
+        paths = fetch_changed_files(owner, repo, pr_number)
+        if paths is None:
+            print(
+                "Warning: Could not fetch changed files, keeping all threads",
+                file=sys.stderr,
+            )
+
+    threads = fetch_unresolved_threads(
+        owner,
+        repo,
+        pr_number,
+        cache_dir,
+        first_page,
+        exclude_outdated=os.environ.get("THREADS_EXCLUDE_OUTDATED") == "true",
+        paths=paths,
+    )
 
     # Output JSON for machine consumption
     result = {
         "threads": threads,
         "count": len(threads),
-        "summary": format_threads_for_prompt(threads),
+        "summary": format_threads_for_prompt(
+            threads,
+            max_chars=parse_max_chars(os.environ.get("THREADS_MAX_CHARS")),
+            trigger_comment_id=os.environ.get("COMMENT_ID") or None,
+            diff_path=diff_path,
+        ),
     }
 
     github_output = os.environ.get("GITHUB_OUTPUT")
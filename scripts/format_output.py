@@ -1,10 +1,21 @@
 #!/usr/bin/env python3
 """Format opencode JSON output for GitHub Actions logs."""
 
+import gzip
 import json
+import math
+import os
+import queue
+import re
 import shutil
+import signal
 import subprocess
 import sys
+import threading
+import time
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
 from typing import IO, TextIO
 
 TOOL_ICONS = {
@@ -39,7 +50,10 @@ def format_tool_name(name: str) -> str:
     return name.replace("_", " ").title()
 
 
-def truncate_content(content: str, max_lines: int = 50) -> str:
+MAX_OUTPUT_LINES = 50
+
+
+def truncate_content(content: str, max_lines: int = MAX_OUTPUT_LINES) -> str:
     """Truncate content if too long."""
     lines = content.split("\n")
     if len(lines) <= max_lines:
@@ -73,12 +87,81 @@ def format_tool_input(tool_name: str, tool_input: dict) -> str:
     return ""
 
 
+# Buffered output is written out at group boundaries, once this many seconds
+# have passed since the first pending write, or when this much is pending.
+FLUSH_INTERVAL = 0.5
+MAX_PENDING_CHARS = 64 * 1024
+
+
+class LogBuffer:
+    """Collects log output and writes it to the underlying stream in batches.
+
+    A background thread flushes pending output every `interval` seconds so
+    that lines written between group boundaries, like agent text, still show
+    up in the live log promptly.
+    """
+
+    def __init__(
+        self,
+        output: TextIO,
+        interval: float = FLUSH_INTERVAL,
+        max_pending: int = MAX_PENDING_CHARS,
+    ):
+        self.output = output
+        self.interval = interval
+        self.max_pending = max_pending
+        self.written = 0
+        self._pending: list[str] = []
+        self._size = 0
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher: threading.Thread | None = None
+
+    def write(self, text: str) -> int:
+        with self._lock:
+            self._pending.append(text)
+            self._size += len(text)
+            self.written += len(text) if text.isascii() else len(text.encode())
+            if self._size >= self.max_pending:
+                self._flush_locked()
+        if self._flusher is None and self.interval > 0:
+            self._flusher = threading.Thread(target=self._flush_periodically)
+            self._flusher.daemon = True
+            self._flusher.start()
+        return len(text)
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if self._pending:
+            self.output.write("".join(self._pending))
+            self.output.flush()
+            self._pending.clear()
+            self._size = 0
+
+    def _flush_periodically(self) -> None:
+        while not self._closed.wait(self.interval):
+            self.flush()
+
+    def close(self) -> None:
+        """Flush what is pending and stop flushing. The stream stays open."""
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+
+
 def print_group_start(title: str, output: TextIO = sys.stdout) -> None:
-    print(f"::group::{title}", file=output, flush=True)
+    # Flush first so the previous output isn't folded into this group
+    output.flush()
+    print(f"::group::{title}", file=output)
 
 
 def print_group_end(output: TextIO = sys.stdout) -> None:
-    print("::endgroup::", file=output, flush=True)
+    print("::endgroup::", file=output)
+    output.flush()
 
 
 STATUS_ICONS = {
@@ -121,7 +204,116 @@ def format_tool_output(tool_name: str, tool_input: dict, tool_output: str) -> st
     return truncate_content(tool_output) if tool_output else ""
 
 
-def handle_tool_use(part: dict, output: TextIO = sys.stdout) -> None:
+# Without a limit in LOG_MAX_BYTES the log budget defaults to this
+DEFAULT_LOG_MAX_BYTES = 4 * 1024 * 1024
+TOOL_OUTPUT_INDEX = "index.json"
+
+
+class LogGovernor:
+    """Keeps the log within a byte budget by moving tool output to files.
+
+    Output the log would not show in full, because it is longer than
+    MAX_OUTPUT_LINES or PARTIAL_OUTPUT_CHARS or the budget is spent, is
+    written whole to a file per call in `directory` and replaced in the log by
+    a pointer to it. The directory's index.json maps call IDs to files.
+    """
+
+    def __init__(
+        self,
+        directory: str | None = None,
+        max_bytes: int | None = DEFAULT_LOG_MAX_BYTES,
+    ):
+        self.directory = Path(directory) if directory else None
+        self.max_bytes = max_bytes
+        self.index: list[dict] = []
+        self.exhausted = False
+
+    def govern(
+        self,
+        part: dict,
+        tool_name: str,
+        summary: str,
+        tool_output: str,
+        written: int,
+        output: TextIO = sys.stdout,
+    ) -> tuple[str, str]:
+        """Decide how a call's output appears in the log.
+
+        Returns the output to show, possibly empty, and a pointer line to
+        print after it, if any. `written` is what the log holds so far.
+        """
+        over_budget = (
+            self.max_bytes is not None
+            and written + len(tool_output.encode()) > self.max_bytes
+        )
+        if over_budget and not self.exhausted:
+            self.exhausted = True
+            where = (
+                f"; tool output is saved to {self.directory}" if self.directory else ""
+            )
+            print(
+                f"::warning::Log budget of {self.max_bytes} bytes reached{where}",
+                file=output,
+            )
+        too_long = len(tool_output) > PARTIAL_OUTPUT_CHARS
+        truncated = too_long or tool_output.count("\n") >= MAX_OUTPUT_LINES
+        if not (over_budget or truncated):
+            return tool_output, ""
+
+        if over_budget:
+            shown = ""
+        elif too_long:
+            shown = tool_output[:PARTIAL_OUTPUT_CHARS] + "\n... (output cut)"
+        else:
+            shown = tool_output
+        if self.directory is None:
+            return shown, "(output omitted: log budget reached)" if over_budget else ""
+
+        path = self.spill(self.directory, part, tool_name, summary, tool_output)
+        lines = tool_output.count("\n") + 1
+        # Output of a line longer than MAX_LINE_CHARS ends where the line was cut
+        if (part.get("state") or {}).get("truncated"):
+            return shown, f"Partial output ({lines} lines): {path}"
+        return shown, f"Full output ({lines} lines): {path}"
+
+    def spill(
+        self,
+        directory: Path,
+        part: dict,
+        tool_name: str,
+        summary: str,
+        tool_output: str,
+    ) -> Path:
+        """Write a call's output to its own file and add it to the index."""
+        directory.mkdir(parents=True, exist_ok=True)
+        call_id = str(part.get("callID") or part.get("id") or "")
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", call_id)[:64]
+        safe_tool = re.sub(r"[^A-Za-z0-9_.-]", "_", tool_name)[:32]
+        name = f"{len(self.index) + 1:04d}-{safe_tool}"
+        path = directory / (f"{name}-{safe_id}.txt" if safe_id else f"{name}.txt")
+        path.write_text(tool_output)
+        self.index.append(
+            {
+                "call_id": call_id,
+                "tool": tool_name,
+                "summary": summary,
+                "file": path.name,
+                "bytes": path.stat().st_size,
+            }
+        )
+        return path
+
+    def write_index(self) -> None:
+        if self.directory is None or not self.index:
+            return
+        (self.directory / TOOL_OUTPUT_INDEX).write_text(
+            json.dumps({"calls": self.index}, indent=2)
+        )
+
+
+def handle_tool_use(
+    part: dict, output: TextIO = sys.stdout, governor: LogGovernor | None = None
+) -> None:
     tool_name = part.get("tool", part.get("name", "unknown"))
     state = part.get("state", {})
     tool_input = state.get("input", part.get("input", {}))
@@ -136,21 +328,48 @@ def handle_tool_use(part: dict, output: TextIO = sys.stdout) -> None:
     else:
         title = f"{icon} {formatted_name}"
 
+    pointer = ""
+    if (
+        governor is not None
+        and tool_output
+        and tool_name.lower() not in SUPPRESS_OUTPUT_TOOLS
+    ):
+        tool_output, pointer = governor.govern(
+            part,
+            tool_name,
+            input_summary,
+            tool_output,
+            getattr(output, "written", 0),
+            output,
+        )
+
     print_group_start(title, output)
 
     formatted_output = format_tool_output(tool_name, tool_input, tool_output)
     if formatted_output:
-        print(formatted_output, file=output, flush=True)
+        print(formatted_output, file=output)
+    if pointer:
+        print(pointer, file=output)
 
     print_group_end(output)
 
 
-def handle_tool_result(part: dict, output: TextIO = sys.stdout) -> None:
+def handle_tool_result(
+    part: dict, output: TextIO = sys.stdout, governor: LogGovernor | None = None
+) -> None:
     content = part.get("content", "")
 
+    pointer = ""
+    if governor is not None and content:
+        content, pointer = governor.govern(
+            part, "result", "", content, getattr(output, "written", 0), output
+        )
+
     if content:
-        print("---", file=output, flush=True)
-        print(truncate_content(content), file=output, flush=True)
+        print("---", file=output)
+        print(truncate_content(content), file=output)
+    if pointer:
+        print(pointer, file=output)
 
     print_group_end(output)
 
@@ -158,42 +377,874 @@ def handle_tool_result(part: dict, output: TextIO = sys.stdout) -> None:
 def handle_text(part: dict, output: TextIO = sys.stdout) -> None:
     text = part.get("text", "")
     if text.strip():
-        print(text, file=output, flush=True)
+        print(text, file=output)
 
 
 SKIP_EVENT_TYPES = {"step_start", "step_finish"}
 
+# opencode writes the event type as the first key, so skipped events can be
+# recognized from the start of the line without parsing the rest of it.
+EVENT_TYPE_PREFIX = re.compile(r'\{\s*"type"\s*:\s*"([^"\\]*)"')
+
+
+def peek_event_type(line: str) -> str | None:
+    """Event type from the start of a JSON line, or None if it isn't there."""
+    match = EVENT_TYPE_PREFIX.match(line)
+    return match.group(1) if match else None
+
+
+# Lines are read at most MAX_LINE_CHARS at a time; the rest of a longer line
+# is read and dropped. tool_use lines longer than PARTIAL_PARSE_CHARS, or cut
+# at the limit, are parsed only as far as the tool name and input, and their
+# output is decoded up to PARTIAL_OUTPUT_CHARS when it is shown at all.
+MAX_LINE_CHARS = 1024 * 1024
+PARTIAL_PARSE_CHARS = 64 * 1024
+PARTIAL_OUTPUT_CHARS = 64 * 1024
+
+TOOL_NAME_KEY = re.compile(r'"tool"\s*:\s*"([^"\\]*)"')
+TOOL_INPUT_KEY = re.compile(r'"input"\s*:\s*')
+TOOL_OUTPUT_KEY = re.compile(r'"output"\s*:\s*"')
+CALL_ID_KEY = re.compile(r'"callID"\s*:\s*"([^"\\]*)"')
+TOOL_TIME = re.compile(r'"time"\s*:\s*\{\s*"start"\s*:\s*(\d+)\s*,\s*"end"\s*:\s*(\d+)')
+EVENT_TIMESTAMP = re.compile(r'"timestamp"\s*:\s*(\d+)')
+JSON_STRING_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*')
+
+_decoder = json.JSONDecoder()
+
+
+def read_lines(
+    stream: IO[str], max_chars: int = MAX_LINE_CHARS
+) -> Iterator[tuple[str, int]]:
+    """Yield each line, cut to max_chars, with the number of characters dropped."""
+    while True:
+        line = stream.readline(max_chars)
+        if not line:
+            return
+        dropped = 0
+        if not line.endswith("\n"):
+            while True:
+                rest = stream.readline(max_chars)
+                if not rest:
+                    break
+                if rest.endswith("\n"):
+                    dropped += len(rest) - 1
+                    break
+                dropped += len(rest)
+        yield line, dropped
+
+
+def decode_string_prefix(text: str, start: int, max_chars: int) -> tuple[str, bool]:
+    """Decode up to max_chars of the JSON string body starting at text[start].
+
+    Returns the decoded text and whether it is the whole string.
+    """
+    match = JSON_STRING_BODY.match(text, start, start + max_chars)
+    body = match.group()
+    complete = text[match.end() : match.end() + 1] == '"'
+    # Back off from an escape sequence that was cut in half
+    for trim in range(6):
+        try:
+            return json.loads(f'"{body[: len(body) - trim]}"'), complete
+        except json.JSONDecodeError:
+            continue
+    return "", False
+
+
+def parse_tool_use_head(
+    line: str, max_output: int = PARTIAL_OUTPUT_CHARS
+) -> dict | None:
+    """Extract a tool_use part from its leading fields, without decoding it all.
+
+    opencode writes the tool name and input before the output, so the title
+    can be rendered from the start of the line. Up to max_output characters
+    of output are decoded, and state["truncated"] is set if there was more.
+    Output of tools in SUPPRESS_OUTPUT_TOOLS is never decoded. Returns None
+    if the line isn't laid out that way.
+    """
+    tool = TOOL_NAME_KEY.search(line)
+    if not tool:
+        return None
+    tool_name = tool.group(1)
+
+    tool_input: dict = {}
+    position = tool.end()
+    input_key = TOOL_INPUT_KEY.search(line, position)
+    if input_key:
+        try:
+            value, position = _decoder.raw_decode(line, input_key.end())
+        except json.JSONDecodeError:
+            value, position = None, input_key.end()
+        if isinstance(value, dict):
+            tool_input = value
+
+    tool_output = ""
+    complete = True
+    output_key = TOOL_OUTPUT_KEY.search(line, position)
+    if output_key and tool_name.lower() not in SUPPRESS_OUTPUT_TOOLS:
+        tool_output, complete = decode_string_prefix(line, output_key.end(), max_output)
+        if not complete:
+            tool_output += "\n... (output cut)"
+
+    state: dict = {"input": tool_input, "output": tool_output}
+    if not complete:
+        state["truncated"] = True
+    part: dict = {"tool": tool_name, "state": state}
+    head_end = output_key.start() if output_key else len(line)
+    call_id = CALL_ID_KEY.search(line, 0, head_end)
+    if call_id:
+        part["callID"] = call_id.group(1)
+    # The timing comes after the output, so look for it from the end
+    times = TOOL_TIME.match(line, max(line.rfind('"time"'), 0))
+    if times:
+        state["time"] = {"start": int(times.group(1)), "end": int(times.group(2))}
+    return part
+
+
+def peek_timestamp(line: str) -> int | None:
+    """Top-level event timestamp from the start of a JSON line."""
+    match = EVENT_TIMESTAMP.search(line, 0, 200)
+    return int(match.group(1)) if match else None
+
+
+# Upper bounds in seconds of the latency histogram buckets; the last bucket
+# has no upper bound.
+LATENCY_BUCKETS = (0.1, 1.0, 10.0, 60.0)
+BUCKET_LABELS = ("<100ms", "<1s", "<10s", "<1m", ">=1m")
+TOP_SLOWEST = 10
+
+
+def format_duration(seconds: float) -> str:
+    if seconds < 1:
+        return f"{seconds * 1000:.0f}ms"
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    return f"{int(seconds // 60)}m{seconds % 60:02.0f}s"
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of sorted values."""
+    index = math.ceil(fraction * len(values)) - 1
+    return values[max(0, min(len(values) - 1, index))]
+
+
+@dataclass
+class ToolCall:
+    call_id: str
+    tool: str
+    summary: str
+    start: int | None = None
+    end: int | None = None
+
+    @property
+    def seconds(self) -> float | None:
+        if self.start is None or self.end is None:
+            return None
+        return max(0, self.end - self.start) / 1000
+
+
+class ToolTracer:
+    """Pairs tool events by call ID and collects their latencies.
+
+    opencode reports a finished call as one tool_use event whose state has
+    start and end times in milliseconds. A call seen first while pending or
+    running, or in the legacy tool_use/tool_result form, is completed by the
+    next event with the same call ID, using event timestamps where the state
+    has no times.
+    """
+
+    def __init__(self):
+        self.calls: list[ToolCall] = []
+        self._open: dict[str, ToolCall] = {}
+
+    def record(self, event: dict) -> None:
+        event_type = event.get("type", "")
+        part = event.get("part", {})
+        if not isinstance(part, dict):
+            return
+        timestamp = event.get("timestamp")
+        if event_type == "tool_use":
+            self.record_tool_use(part, timestamp)
+        elif event_type == "tool_result":
+            self.record_tool_result(part, timestamp)
+
+    def record_tool_use(self, part: dict, timestamp: int | None) -> None:
+        tool_name = part.get("tool", part.get("name", "unknown"))
+        state = part.get("state", {})
+        tool_input = state.get("input", part.get("input", {}))
+        times = state.get("time", {})
+        call_id = part.get("callID") or part.get("id") or ""
+
+        call = self._open.pop(call_id, None) if call_id else None
+        if call is None:
+            call = ToolCall(
+                call_id=call_id,
+                tool=tool_name,
+                summary=format_tool_input(tool_name, tool_input),
+                start=times.get("start", timestamp),
+            )
+        elif "start" in times:
+            call.start = times["start"]
+
+        if state.get("status") in ("pending", "running") or (
+            "status" not in state and "output" not in state
+        ):
+            self._open[call_id] = call
+            return
+        call.end = times.get("end", timestamp)
+        self.calls.append(call)
+
+    def record_tool_result(self, part: dict, timestamp: int | None) -> None:
+        call_id = part.get("callID") or part.get("tool_use_id") or part.get("id")
+        call = self._open.pop(call_id, None) if call_id else None
+        if call is None and len(self._open) == 1:
+            # Legacy results don't always carry an ID; pair with the only open call
+            call = self._open.popitem()[1]
+        if call is not None:
+            call.end = timestamp
+            self.calls.append(call)
+
+    def summary(self, top: int = TOP_SLOWEST) -> dict:
+        """Per-tool counts, latency percentiles and histograms, and the slowest calls."""
+        tools: dict[str, dict] = {}
+        for call in self.calls:
+            stats = tools.setdefault(
+                call.tool,
+                {
+                    "count": 0,
+                    "untimed": 0,
+                    "seconds": [],
+                    "histogram": dict.fromkeys(BUCKET_LABELS, 0),
+                },
+            )
+            stats["count"] += 1
+            seconds = call.seconds
+            if seconds is None:
+                stats["untimed"] += 1
+                continue
+            stats["seconds"].append(seconds)
+            bucket = sum(seconds >= bound for bound in LATENCY_BUCKETS)
+            stats["histogram"][BUCKET_LABELS[bucket]] += 1
+
+        for stats in tools.values():
+            values = sorted(stats.pop("seconds"))
+            stats["total_seconds"] = round(sum(values), 3)
+            if values:
+                stats["p50_seconds"] = percentile(values, 0.5)
+                stats["p90_seconds"] = percentile(values, 0.9)
+                stats["max_seconds"] = values[-1]
+
+        timed = [call for call in self.calls if call.seconds is not None]
+        timed.sort(key=lambda call: call.seconds or 0, reverse=True)
+        return {
+            "calls": len(self.calls),
+            "total_seconds": round(sum(call.seconds or 0 for call in timed), 3),
+            "tools": dict(
+                sorted(tools.items(), key=lambda item: -item[1]["total_seconds"])
+            ),
+            "slowest": [
+                {
+                    "call_id": call.call_id,
+                    "tool": call.tool,
+                    "summary": call.summary,
+                    "seconds": call.seconds,
+                }
+                for call in timed[:top]
+            ],
+        }
+
+
+def format_trace_markdown(summary: dict) -> str:
+    """Render a tool trace summary for GITHUB_STEP_SUMMARY."""
+    labels = BUCKET_LABELS
+    total = format_duration(summary["total_seconds"])
+    lines = [
+        "### Tool latency",
+        "",
+        f"{summary['calls']} tool calls, {total} in tools.",
+        "",
+        "| Tool | Calls | Total | p50 | p90 | Max | " + " | ".join(labels) + " |",
+        "| --- | ---: | ---: | ---: | ---: | ---: | "
+        + " | ".join(["---:"] * len(labels))
+        + " |",
+    ]
+    for tool, stats in summary["tools"].items():
+        timings = [
+            format_duration(stats[key]) if key in stats else "-"
+            for key in ("total_seconds", "p50_seconds", "p90_seconds", "max_seconds")
+        ]
+        counts = [str(stats["histogram"][label]) for label in labels]
+        lines.append(
+            f"| {get_tool_icon(tool)} {format_tool_name(tool)} | {stats['count']} | "
+            + " | ".join(timings + counts)
+            + " |"
+        )
+
+    if summary["slowest"]:
+        lines += [
+            "",
+            "#### Slowest calls",
+            "",
+            "| Tool | Call | Duration |",
+            "| --- | --- | ---: |",
+        ]
+        for call in summary["slowest"]:
+            detail = call["summary"].replace("|", "\\|").replace("\n", " ")
+            lines.append(
+                f"| {get_tool_icon(call['tool'])} {format_tool_name(call['tool'])} "
+                f"| {detail} | {format_duration(call['seconds'])} |"
+            )
+    return "\n".join(lines) + "\n"
+
+
+def write_tool_trace(tracer: ToolTracer) -> None:
+    """Publish the trace to TOOL_TRACE_FILE, the step summary and step outputs."""
+    summary = tracer.summary()
+    trace_file = os.environ.get("TOOL_TRACE_FILE", "").strip()
+    if trace_file:
+        calls = [
+            {
+                "call_id": call.call_id,
+                "tool": call.tool,
+                "summary": call.summary,
+                "start": call.start,
+                "end": call.end,
+                "seconds": call.seconds,
+            }
+            for call in tracer.calls
+        ]
+        Path(trace_file).write_text(
+            json.dumps({**summary, "all_calls": calls}, indent=2)
+        )
+
+    step_summary = os.environ.get("GITHUB_STEP_SUMMARY", "").strip()
+    if step_summary and tracer.calls:
+        with open(step_summary, "a") as f:
+            f.write(format_trace_markdown(summary))
+
+    github_output = os.environ.get("GITHUB_OUTPUT", "").strip()
+    if github_output:
+        with open(github_output, "a") as f:
+            f.write(f"tool_trace={json.dumps(summary, separators=(',', ':'))}\n")
+            if trace_file:
+                f.write(f"tool_trace_file={trace_file}\n")
+
+
+# After a hard budget limit, opencode gets this long to exit after SIGTERM
+# before it is killed. Runs stopped by the budget exit with BUDGET_EXIT_CODE.
+STOP_GRACE_SECONDS = 10.0
+BUDGET_EXIT_CODE = 1
+
+
+class BudgetGovernor:
+    """Accumulates token usage and cost from step_finish events.
+
+    Crossing a soft limit logs a warning once. Crossing a hard limit logs an
+    error and calls `stop`, which run_opencode sets to end the process.
+    Tokens are counted as everything the provider processed: input, output,
+    reasoning, and cache reads and writes.
+    """
+
+    def __init__(
+        self,
+        soft_tokens: int | None = None,
+        hard_tokens: int | None = None,
+        soft_cost: float | None = None,
+        hard_cost: float | None = None,
+    ):
+        self.soft_tokens = soft_tokens
+        self.hard_tokens = hard_tokens
+        self.soft_cost = soft_cost
+        self.hard_cost = hard_cost
+        self.tokens = dict.fromkeys(
+            ("input", "output", "reasoning", "cache_read", "cache_write"), 0
+        )
+        self.cost = 0.0
+        self.steps = 0
+        self.status = "ok"
+        self.stop: Callable[[], None] | None = None
 
-def process_event(event: dict, output: TextIO = sys.stdout) -> None:
+    @property
+    def total_tokens(self) -> int:
+        return sum(self.tokens.values())
+
+    @property
+    def limited(self) -> bool:
+        return any(
+            limit is not None
+            for limit in (
+                self.soft_tokens,
+                self.hard_tokens,
+                self.soft_cost,
+                self.hard_cost,
+            )
+        )
+
+    def record_step(self, part: dict, output: TextIO = sys.stdout) -> None:
+        tokens = part.get("tokens") or {}
+        cache = tokens.get("cache") or {}
+        for key, value in (
+            ("input", tokens.get("input")),
+            ("output", tokens.get("output")),
+            ("reasoning", tokens.get("reasoning")),
+            ("cache_read", cache.get("read")),
+            ("cache_write", cache.get("write")),
+        ):
+            if isinstance(value, int | float):
+                self.tokens[key] += int(value)
+        cost = part.get("cost")
+        if isinstance(cost, int | float):
+            self.cost += cost
+        self.steps += 1
+        self.check(output)
+
+    def exceeded(self, max_tokens: int | None, max_cost: float | None) -> str | None:
+        """Describe which of the limits has been reached, if any."""
+        if max_tokens is not None and self.total_tokens >= max_tokens:
+            return f"{self.total_tokens} tokens, limit {max_tokens}"
+        if max_cost is not None and self.cost >= max_cost:
+            return f"${self.cost:.4f}, limit ${max_cost:.2f}"
+        return None
+
+    def check(self, output: TextIO = sys.stdout) -> None:
+        if self.status == "hard":
+            return
+        hard = self.exceeded(self.hard_tokens, self.hard_cost)
+        if hard:
+            self.status = "hard"
+            print(f"::error::Budget exceeded ({hard}), stopping the agent", file=output)
+            output.flush()
+            if self.stop is not None:
+                self.stop()
+            return
+        soft = self.exceeded(self.soft_tokens, self.soft_cost)
+        if soft and self.status == "ok":
+            self.status = "soft"
+            print(f"::warning::Budget soft limit reached ({soft})", file=output)
+
+    def usage(self) -> dict:
+        return {
+            "steps": self.steps,
+            "tokens": {**self.tokens, "total": self.total_tokens},
+            "cost": round(self.cost, 6),
+            "budget_status": self.status,
+        }
+
+
+def write_usage(budget: BudgetGovernor) -> None:
+    """Publish token usage and cost as step outputs and in the step summary."""
+    usage = budget.usage()
+    github_output = os.environ.get("GITHUB_OUTPUT", "").strip()
+    if github_output:
+        with open(github_output, "a") as f:
+            f.write(f"usage={json.dumps(usage, separators=(',', ':'))}\n")
+            f.write(f"tokens_total={usage['tokens']['total']}\n")
+            f.write(f"cost_total={usage['cost']}\n")
+            f.write(f"budget_status={usage['budget_status']}\n")
+
+    step_summary = os.environ.get("GITHUB_STEP_SUMMARY", "").strip()
+    if step_summary and budget.steps:
+        tokens = usage["tokens"]
+        with open(step_summary, "a") as f:
+            f.write(
+                "### Usage\n\n"
+                f"{budget.steps} steps, {tokens['total']} tokens "
+                f"({tokens['input']} input, {tokens['output']} output, "
+                f"{tokens['cache_read']} cache read), ${usage['cost']:.4f}.\n"
+            )
+            if budget.status != "ok":
+                f.write(f"\nBudget {budget.status} limit reached.\n")
+
+
+def parse_limit(name: str, value: str | None, cast: type = int) -> int | float | None:
+    """Parse a budget limit from the environment; empty or 0 means no limit."""
+    if not value or not value.strip():
+        return None
+    try:
+        limit = cast(value)
+    except ValueError:
+        print(f"Invalid {name} '{value}', ignoring", file=sys.stderr)
+        return None
+    return limit if limit > 0 else None
+
+
+def load_governor() -> LogGovernor:
+    """Log budget from LOG_MAX_BYTES (0 for none) and spill directory TOOL_OUTPUT_DIR."""
+    value = os.environ.get("LOG_MAX_BYTES", "").strip()
+    max_bytes = parse_limit("LOG_MAX_BYTES", value) if value else DEFAULT_LOG_MAX_BYTES
+    directory = os.environ.get("TOOL_OUTPUT_DIR", "").strip()
+    return LogGovernor(directory or None, max_bytes)
+
+
+def load_budget() -> BudgetGovernor | None:
+    """Budget limits from BUDGET_TOKENS_SOFT/HARD and BUDGET_COST_SOFT/HARD.
+
+    Returns None when there are no limits and nowhere to publish usage, so
+    step_finish events aren't parsed for nothing.
+    """
+    env = os.environ.get
+    budget = BudgetGovernor(
+        soft_tokens=parse_limit("BUDGET_TOKENS_SOFT", env("BUDGET_TOKENS_SOFT")),
+        hard_tokens=parse_limit("BUDGET_TOKENS_HARD", env("BUDGET_TOKENS_HARD")),
+        soft_cost=parse_limit("BUDGET_COST_SOFT", env("BUDGET_COST_SOFT"), float),
+        hard_cost=parse_limit("BUDGET_COST_HARD", env("BUDGET_COST_HARD"), float),
+    )
+    publish = env("GITHUB_OUTPUT", "").strip() or env("GITHUB_STEP_SUMMARY", "").strip()
+    return budget if budget.limited or publish else None
+
+
+def process_event(
+    event: dict, output: TextIO = sys.stdout, governor: LogGovernor | None = None
+) -> None:
     event_type = event.get("type", "")
     part = event.get("part", {})
 
     if event_type in SKIP_EVENT_TYPES:
         return
     elif event_type == "tool_use":
-        handle_tool_use(part, output)
+        handle_tool_use(part, output, governor)
     elif event_type == "tool_result":
-        handle_tool_result(part, output)
+        handle_tool_result(part, output, governor)
     elif event_type == "text":
         handle_text(part, output)
     else:
-        print(json.dumps(event), file=output, flush=True)
+        print(json.dumps(event), file=output)
 
 
-def process_stream(stream: IO[str], output: TextIO = sys.stdout) -> None:
-    for line in stream:
-        line = line.strip()
-        if not line:
-            continue
+# Transcript lines waiting for the writer thread are capped at this many
+# characters; beyond it lines are dropped and counted instead of queued.
+TRANSCRIPT_QUEUE_CHARS = 16 * 1024 * 1024
+TRANSCRIPT_VERSION = 1
+
+
+class TranscriptRecorder:
+    """Tees raw stream lines to a gzip-compressed JSONL transcript.
+
+    Each entry has `t`, seconds since recording started on the monotonic
+    clock, and the raw `line`; `cut` counts characters dropped from lines over
+    the line limit. Compression and writes happen on a writer thread, so the
+    formatter only pays for a queue put.
+    """
+
+    def __init__(self, path: str, max_pending: int = TRANSCRIPT_QUEUE_CHARS):
+        self.path = path
+        self.max_pending = max_pending
+        self.clock = time.monotonic
+        self.started = self.clock()
+        self.lost = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write, daemon=True)
+        self._thread.start()
+
+    def record(self, line: str, cut: int = 0) -> None:
+        with self._lock:
+            if self._pending + len(line) > self.max_pending:
+                self.lost += 1
+                return
+            self._pending += len(line)
+        self._queue.put((self.clock() - self.started, line, cut))
+
+    def _write(self) -> None:
+        with gzip.open(self.path, "wt", encoding="utf-8", compresslevel=6) as f:
+            header = {"version": TRANSCRIPT_VERSION, "started_at": time.time()}
+            f.write(json.dumps(header) + "\n")
+            while (item := self._queue.get()) is not None:
+                offset, line, cut = item
+                with self._lock:
+                    self._pending -= len(line)
+                entry: dict = {"t": round(offset, 6), "line": line}
+                if cut:
+                    entry["cut"] = cut
+                f.write(json.dumps(entry) + "\n")
+            if self.lost:
+                f.write(json.dumps({"lost": self.lost}) + "\n")
+
+    def close(self) -> None:
+        """Write out what is queued and close the transcript."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def read_transcript(path: str) -> Iterator[tuple[float, str, int]]:
+    """Yield (seconds since start, raw line, characters cut) from a transcript."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for raw in f:
+            try:
+                entry = json.loads(raw)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(entry, dict) and isinstance(entry.get("line"), str):
+                yield (
+                    float(entry.get("t") or 0),
+                    entry["line"],
+                    int(entry.get("cut") or 0),
+                )
+
+
+class TranscriptStream:
+    """Serves transcript lines to process_stream like a live opencode pipe.
+
+    Lines come out of read_lines as they did in the recorded run, so a line
+    that was cut live is cut again, with the same count of dropped characters.
+    With speed 0 lines are served as fast as they are read; otherwise each
+    line is held back until its recorded time, divided by speed, has passed.
+    """
+
+    def __init__(self, entries: Iterator[tuple[float, str, int]], speed: float = 0.0):
+        self.entries = entries
+        self.speed = speed
+        self.clock = time.monotonic
+        self.sleep = time.sleep
+        self.started: float | None = None
+        self.lines = 0
+
+    def read_lines(self, max_chars: int = MAX_LINE_CHARS) -> Iterator[tuple[str, int]]:
+        for offset, line, cut in self.entries:
+            if self.started is None:
+                self.started = self.clock()
+            if self.speed > 0:
+                delay = self.started + offset / self.speed - self.clock()
+                if delay > 0:
+                    self.sleep(delay)
+            self.lines += 1
+            if len(line) > max_chars:
+                cut += len(line) - max_chars
+                line = line[:max_chars]
+            # Cut lines were read without their newline
+            yield (line, cut) if cut else (line + "\n", 0)
+
+
+def process_stream(
+    stream: IO[str] | TranscriptStream,
+    output: TextIO = sys.stdout,
+    max_line_chars: int = MAX_LINE_CHARS,
+    tracer: ToolTracer | None = None,
+    budget: BudgetGovernor | None = None,
+    recorder: TranscriptRecorder | None = None,
+    governor: LogGovernor | None = None,
+) -> None:
+    buffer = LogBuffer(output)
+    # With a spill directory, output the governor may spill is decoded whole
+    # for its file and the governor cuts what reaches the log
+    spilling = governor is not None and governor.directory is not None
+    if isinstance(stream, TranscriptStream):
+        lines = stream.read_lines(max_line_chars)
+    else:
+        lines = read_lines(stream, max_line_chars)
+    try:
+        for line, dropped in lines:
+            if recorder is not None:
+                recorder.record(line.rstrip("\n"), dropped)
+            line = line.strip()
+            if not line:
+                continue
+            event_type = peek_event_type(line)
+            if event_type in SKIP_EVENT_TYPES and not (
+                budget is not None and event_type == "step_finish"
+            ):
+                continue
+
+            if event_type == "tool_use" and (
+                dropped or len(line) > PARTIAL_PARSE_CHARS
+            ):
+                # Output of suppressed tools is never shown or spilled, so
+                # only other tools' lines are decoded whole when spilling
+                tool = TOOL_NAME_KEY.search(line)
+                spill = (
+                    spilling
+                    and tool is not None
+                    and tool.group(1).lower() not in SUPPRESS_OUTPUT_TOOLS
+                )
+                part = None
+                if dropped or not spill:
+                    part = parse_tool_use_head(
+                        line, max_line_chars if spill else PARTIAL_OUTPUT_CHARS
+                    )
+                if part is not None:
+                    if tracer is not None:
+                        tracer.record_tool_use(part, peek_timestamp(line))
+                    handle_tool_use(part, buffer, governor)
+                    continue
+            if dropped:
+                print(
+                    f"Skipped a {event_type or 'non-JSON'} line of "
+                    f"{len(line) + dropped} characters "
+                    f"(limit {max_line_chars})",
+                    file=buffer,
+                )
+                continue
+
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                print(line, file=buffer)
+                continue
+            if isinstance(event, dict):
+                if tracer is not None:
+                    tracer.record(event)
+                if budget is not None and event.get("type") == "step_finish":
+                    budget.record_step(event.get("part") or {}, buffer)
+            process_event(event, buffer, governor)
+    finally:
+        buffer.close()
+
+
+# Runs stopped by the watchdog exit with TIMEOUT_EXIT_CODE, like timeout(1),
+# after recording why in STATE_FILE.
+TIMEOUT_EXIT_CODE = 124
+STATE_FILE = ".dobbyphus-state.json"
+WATCHDOG_POLL_SECONDS = 1.0
 
-        try:
-            event = json.loads(line)
-            process_event(event, output)
-        except json.JSONDecodeError:
-            print(line, file=output, flush=True)
 
+class Watchdog:
+    """Stops the agent when it runs too long or stops producing events.
 
-def run_opencode(prompt: str, output: TextIO = sys.stdout) -> int:
+    `total` and `idle` are in seconds; None disables a limit. The first limit
+    to expire is recorded in `expired` and `stop` is called once.
+    """
+
+    def __init__(
+        self,
+        total: float | None = None,
+        idle: float | None = None,
+        poll: float = WATCHDOG_POLL_SECONDS,
+    ):
+        self.total = total
+        self.idle = idle
+        self.poll = poll
+        self.clock = time.monotonic
+        self.started = self.last_event = self.clock()
+        self.expired: str | None = None
+        self.stop: Callable[[], None] | None = None
+        self._done = threading.Event()
+
+    @property
+    def enabled(self) -> bool:
+        return self.total is not None or self.idle is not None
+
+    def touch(self) -> None:
+        self.last_event = self.clock()
+
+    def check(self) -> bool:
+        """Stop the agent if a limit has expired. Returns whether one has."""
+        if self.expired:
+            return True
+        now = self.clock()
+        if self.total is not None and now - self.started >= self.total:
+            self.expired = "total"
+        elif self.idle is not None and now - self.last_event >= self.idle:
+            self.expired = "idle"
+        else:
+            return False
+        if self.stop is not None:
+            self.stop()
+        return True
+
+    def start(self) -> None:
+        self.started = self.last_event = self.clock()
+        if not self.enabled:
+            return
+        thread = threading.Thread(target=self._watch, daemon=True)
+        thread.start()
+
+    def cancel(self) -> None:
+        self._done.set()
+
+    def _watch(self) -> None:
+        while not self._done.wait(self.poll):
+            if self.check():
+                return
+
+    def message(self) -> str:
+        if self.expired == "total":
+            return f"Agent reached the {format_duration(self.total or 0)} time limit"
+        return f"Agent produced no output for {format_duration(self.idle or 0)}"
+
+    def state(self) -> dict:
+        now = self.clock()
+        return {
+            "reason": self.expired,
+            "limit_seconds": self.total if self.expired == "total" else self.idle,
+            "elapsed_seconds": round(now - self.started, 1),
+            "idle_seconds": round(now - self.last_event, 1),
+        }
+
+
+class WatchedStream:
+    """Reports every line read from a stream to a watchdog."""
+
+    def __init__(self, stream: IO[str], watchdog: Watchdog):
+        self.stream = stream
+        self.watchdog = watchdog
+
+    def readline(self, size: int = -1) -> str:
+        line = self.stream.readline(size)
+        self.watchdog.touch()
+        return line
+
+
+def load_watchdog() -> Watchdog:
+    """Timeouts from AGENT_TIMEOUT_MINUTES and AGENT_IDLE_TIMEOUT_MINUTES."""
+    total = parse_limit(
+        "AGENT_TIMEOUT_MINUTES", os.environ.get("AGENT_TIMEOUT_MINUTES"), float
+    )
+    idle = parse_limit(
+        "AGENT_IDLE_TIMEOUT_MINUTES",
+        os.environ.get("AGENT_IDLE_TIMEOUT_MINUTES"),
+        float,
+    )
+    return Watchdog(
+        total=total * 60 if total is not None else None,
+        idle=idle * 60 if idle is not None else None,
+    )
+
+
+def write_run_state(updates: dict, path: str = STATE_FILE) -> None:
+    """Merge updates into the run state file, creating it if needed."""
+    state: dict = {}
+    try:
+        existing = json.loads(Path(path).read_text())
+        if isinstance(existing, dict):
+            state = existing
+    except (OSError, json.JSONDecodeError):
+        pass
+    state.update(updates)
+    tmp = f"{path}.tmp"
+    Path(tmp).write_text(json.dumps(state, indent=2))
+    os.replace(tmp, path)
+
+
+def signal_group(process: subprocess.Popen, sig: int) -> None:
+    try:
+        os.killpg(process.pid, sig)
+    except (ProcessLookupError, PermissionError):
+        pass
+
+
+def stop_process(process: subprocess.Popen, grace: float | None = None) -> None:
+    """SIGTERM opencode's process group, then SIGKILL it after grace seconds.
+
+    Signalling the group also stops tools opencode started, which may hold
+    its output pipe open after it exits.
+    """
+    if grace is None:
+        grace = STOP_GRACE_SECONDS
+    signal_group(process, signal.SIGTERM)
+    timer = threading.Timer(grace, signal_group, (process, signal.SIGKILL))
+    timer.daemon = True
+    timer.start()
+
+
+def run_opencode(
+    prompt: str,
+    output: TextIO = sys.stdout,
+    tracer: ToolTracer | None = None,
+    budget: BudgetGovernor | None = None,
+    watchdog: Watchdog | None = None,
+    recorder: TranscriptRecorder | None = None,
+    governor: LogGovernor | None = None,
+) -> int:
     base_cmd = ["opencode", "run", "--format", "json", prompt]
 
     # Use stdbuf to force line-buffered output from opencode
@@ -209,26 +1260,150 @@ def run_opencode(prompt: str, output: TextIO = sys.stdout) -> int:
         stderr=subprocess.STDOUT,
         text=True,
         bufsize=1,
+        # Own process group, so the whole tree can be stopped at once
+        start_new_session=True,
     )
 
-    if process.stdout:
-        process_stream(process.stdout, output)
+    # Signals meant for this step have to be passed on to the new group
+    def forward(signum, frame):
+        signal_group(process, signum)
+
+    previous_handlers = {
+        sig: signal.signal(sig, forward) for sig in (signal.SIGINT, signal.SIGTERM)
+    }
+
+    if budget is not None:
+        budget.stop = lambda: stop_process(process)
+
+    try:
+        if process.stdout:
+            stream = process.stdout
+            if watchdog is not None:
+                watchdog.stop = lambda: stop_process(process)
+                watchdog.start()
+                stream = WatchedStream(stream, watchdog)
+            process_stream(
+                stream,
+                output,
+                tracer=tracer,
+                budget=budget,
+                recorder=recorder,
+                governor=governor,
+            )
+        exit_code = process.wait()
+    finally:
+        if watchdog is not None:
+            watchdog.cancel()
+        for sig, handler in previous_handlers.items():
+            signal.signal(sig, handler)
+
+    if watchdog is not None and watchdog.expired:
+        print(f"::error::{watchdog.message()} and was stopped", file=output, flush=True)
+        state: dict = {"failed": True, "timeout": watchdog.state()}
+        if tracer is not None:
+            state["tool_calls"] = len(tracer.calls)
+        if budget is not None:
+            state["usage"] = budget.usage()
+        write_run_state(state)
+        return TIMEOUT_EXIT_CODE
+    if budget is not None and budget.status == "hard":
+        # Don't let a clean exit after SIGTERM pass for a finished run
+        return exit_code or BUDGET_EXIT_CODE
+    return exit_code
+
 
-    return process.wait()
+def replay_transcript(
+    path: str, output: TextIO = sys.stdout, speed: float = 0.0
+) -> tuple[int, float]:
+    """Feed a transcript through process_stream.
+
+    Returns the number of lines replayed and the seconds it took.
+    """
+    stream = TranscriptStream(read_transcript(path), speed)
+    start = time.perf_counter()
+    process_stream(stream, output, tracer=ToolTracer(), budget=BudgetGovernor())
+    return stream.lines, time.perf_counter() - start
+
+
+def main_replay(args: list[str]) -> None:
+    """Entry point for `replay`."""
+    try:
+        path = args[0]
+        speed = float(args[1]) if len(args) > 1 else 0.0
+    except (IndexError, ValueError):
+        print(
+            "Usage: format_output.py replay <transcript.jsonl.gz> [speed]\n"
+            "       speed 0 replays as fast as possible (default), 1 in real time",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    lines, seconds = replay_transcript(path, sys.stdout, speed)
+    rate = lines / seconds if seconds else 0
+    print(
+        f"Replayed {lines} lines in {seconds:.3f}s ({rate:,.0f} lines/s)",
+        file=sys.stderr,
+    )
 
 
 def main() -> None:
     if len(sys.argv) < 2:
         print("Usage: format_output.py <prompt>", file=sys.stderr)
         print("       opencode run --format json | format_output.py -", file=sys.stderr)
+        print(
+            "       format_output.py replay <transcript.jsonl.gz> [speed]",
+            file=sys.stderr,
+        )
         sys.exit(1)
 
-    if sys.argv[1] == "-":
-        process_stream(sys.stdin, sys.stdout)
-    else:
-        prompt = sys.argv[1]
-        exit_code = run_opencode(prompt, sys.stdout)
-        sys.exit(exit_code)
+    # A prompt is always a single argument, so this can't shadow one
+    if sys.argv[1] == "replay" and len(sys.argv) > 2:
+        main_replay(sys.argv[2:])
+        return
+
+    tracer = ToolTracer()
+    budget = load_budget()
+    governor = load_governor()
+    transcript = os.environ.get("DOBBYPHUS_TRANSCRIPT", "").strip()
+    recorder = TranscriptRecorder(transcript) if transcript else None
+    try:
+        if sys.argv[1] == "-":
+            process_stream(
+                sys.stdin,
+                sys.stdout,
+                tracer=tracer,
+                budget=budget,
+                recorder=recorder,
+                governor=governor,
+            )
+            exit_code = 0
+        else:
+            prompt = sys.argv[1]
+            exit_code = run_opencode(
+                prompt,
+                sys.stdout,
+                tracer,
+                budget,
+                load_watchdog(),
+                recorder,
+                governor,
+            )
+    finally:
+        if recorder is not None:
+            recorder.close()
+        governor.write_index()
+
+    write_tool_trace(tracer)
+    if budget is not None:
+        write_usage(budget)
+    github_output = os.environ.get("GITHUB_OUTPUT", "").strip()
+    if github_output:
+        with open(github_output, "a") as f:
+            if recorder is not None:
+                f.write(f"transcript_file={transcript}\n")
+            if governor.index:
+                f.write(f"tool_output_dir={governor.directory}\n")
+    sys.exit(exit_code)
 
 
 if __name__ == "__main__":
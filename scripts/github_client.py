@@ -0,0 +1,429 @@
+"""Shared GitHub API client that reuses keep-alive HTTPS connections."""
+
+import base64
+import http.client
+import json
+import os
+import random
+import subprocess
+import threading
+import time
+import urllib.parse
+import urllib.request
+from collections.abc import Callable, Iterable
+from dataclasses import dataclass, field
+
+DEFAULT_API_URL = "https://api.github.com"
+
+# "http" talks to the API directly, "gh" shells out to the gh CLI for every
+# request (the original behaviour). "auto" uses http when a token is set.
+TRANSPORTS = ("auto", "http", "gh")
+
+USER_AGENT = "dobbyphus-action"
+API_VERSION = "2022-11-28"
+
+# Rate limiting: how often a throttled request is retried, the longest we are
+# willing to sleep for one retry, and the initial backoff before jitter.
+MAX_RETRIES = 5
+MAX_RETRY_WAIT = 300.0
+BACKOFF_BASE = 1.0
+
+# Concurrency never exceeds MAX_IN_FLIGHT, and each concurrent worker should
+# have at least REQUESTS_PER_WORKER requests of remaining quota.
+MAX_IN_FLIGHT = 16
+REQUESTS_PER_WORKER = 50
+
+SECONDARY_LIMIT_MARKERS = ("secondary rate limit", "abuse detection")
+
+
+class GitHubError(Exception):
+    """Raised when a request can't be completed at the transport level."""
+
+
+@dataclass
+class Response:
+    status: int
+    body: str
+    headers: dict[str, str] = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return 200 <= self.status < 300
+
+    def json(self):
+        return json.loads(self.body) if self.body else None
+
+
+def is_secondary_limit(text: str) -> bool:
+    text = text.lower()
+    return any(marker in text for marker in SECONDARY_LIMIT_MARKERS)
+
+
+class RateLimiter:
+    """Tracks the API budget from response headers and paces requests.
+
+    Requests wait while a Retry-After or reset window is in effect. The number
+    of requests in flight is halved on secondary rate limits and grows back by
+    one per success (AIMD).
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT):
+        self.max_in_flight = max_in_flight
+        self.limit_in_flight = max_in_flight
+        self.in_flight = 0
+        self.remaining: int | None = None
+        self.reset_at: float | None = None
+        self.blocked_until = 0.0
+        self.clock = time.time
+        self.sleep = time.sleep
+        self._cond = threading.Condition()
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self.in_flight >= self.limit_in_flight:
+                self._cond.wait()
+            self.in_flight += 1
+            now = self.clock()
+            delay = self.blocked_until - now
+            if self.remaining == 0 and self.reset_at:
+                delay = max(delay, self.reset_at - now)
+        if delay > 0:
+            self.sleep(min(delay, MAX_RETRY_WAIT))
+
+    def release(self) -> None:
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def record(self, status: int, headers: dict[str, str], body: str = "") -> None:
+        """Update the budget from a response."""
+        with self._cond:
+            remaining = headers.get("x-ratelimit-remaining", "")
+            reset = headers.get("x-ratelimit-reset", "")
+            if remaining.isdigit():
+                self.remaining = int(remaining)
+            if reset.isdigit():
+                self.reset_at = float(reset)
+
+            if self.is_throttled(status, headers, body):
+                self.limit_in_flight = max(1, self.limit_in_flight // 2)
+            elif 200 <= status < 300 and self.limit_in_flight < self.max_in_flight:
+                self.limit_in_flight += 1
+                self._cond.notify()
+
+    def is_throttled(self, status: int, headers: dict[str, str], body: str) -> bool:
+        if status == 429:
+            return True
+        if status != 403:
+            return False
+        return (
+            headers.get("x-ratelimit-remaining") == "0"
+            or "retry-after" in headers
+            or is_secondary_limit(body)
+        )
+
+    def retry_delay(
+        self, status: int, headers: dict[str, str], body: str, attempt: int
+    ) -> float | None:
+        """How long to wait before retrying, or None if the request shouldn't be.
+
+        Retry-After wins, then the primary limit's reset time, then exponential
+        backoff with full jitter.
+        """
+        if attempt >= MAX_RETRIES or not self.is_throttled(status, headers, body):
+            return None
+
+        retry_after = headers.get("retry-after", "")
+        if retry_after.isdigit():
+            delay = float(retry_after)
+        elif headers.get("x-ratelimit-remaining") == "0" and self.reset_at:
+            delay = max(0.0, self.reset_at - self.clock()) + 1
+        else:
+            delay = random.uniform(0, BACKOFF_BASE * 2**attempt)
+
+        if delay > MAX_RETRY_WAIT:
+            return None
+
+        with self._cond:
+            self.blocked_until = max(self.blocked_until, self.clock() + delay)
+        return delay
+
+    def concurrency(self, requested: int) -> int:
+        """Scale a requested worker count to the remaining quota."""
+        with self._cond:
+            limit = min(requested, self.limit_in_flight)
+            if self.remaining is not None:
+                limit = min(limit, self.remaining // REQUESTS_PER_WORKER)
+            return max(1, limit)
+
+
+def run_gh(cmd: list[str], input_text: str | None = None):
+    """Run a gh command, backing off with jitter when it hits a rate limit."""
+    for attempt in range(MAX_RETRIES + 1):
+        result = subprocess.run(
+            cmd, input=input_text, capture_output=True, text=True, check=False
+        )
+        if (
+            result.returncode == 0
+            or attempt == MAX_RETRIES
+            or "rate limit" not in result.stderr.lower()
+        ):
+            return result
+        time.sleep(random.uniform(0, BACKOFF_BASE * 2**attempt))
+    return result
+
+
+def get_token() -> str:
+    return os.environ.get("GH_TOKEN") or os.environ.get("GITHUB_TOKEN") or ""
+
+
+def use_gh_cli() -> bool:
+    """Whether API calls should go through the gh CLI."""
+    transport = os.environ.get("GITHUB_API_TRANSPORT", "auto").strip().lower()
+    if transport == "gh":
+        return True
+    if transport == "http":
+        return False
+    return not get_token()
+
+
+def graphql_url(api_url: str) -> str:
+    """GraphQL endpoint for an API URL (GHES serves it from /api/graphql)."""
+    api_url = api_url.rstrip("/")
+    if api_url.endswith("/api/v3"):
+        return api_url[: -len("/v3")] + "/graphql"
+    return api_url + "/graphql"
+
+
+def get_proxy(scheme: str, netloc: str) -> urllib.parse.SplitResult | None:
+    """Proxy for a host from HTTPS_PROXY/HTTP_PROXY, unless NO_PROXY excludes it.
+
+    These are the variables gh and curl honour, so the direct transport
+    works on runners that can only reach the API through a proxy.
+    """
+    proxies = urllib.request.getproxies_environment()
+    proxy = proxies.get(scheme)
+    if not proxy:
+        return None
+    host = urllib.parse.urlsplit(f"//{netloc}").hostname or netloc
+    if urllib.request.proxy_bypass_environment(host, proxies):
+        return None
+    if "://" not in proxy:
+        proxy = f"http://{proxy}"
+    return urllib.parse.urlsplit(proxy)
+
+
+def proxy_headers(proxy: urllib.parse.SplitResult) -> dict[str, str]:
+    if not proxy.username:
+        return {}
+    credentials = (
+        f"{urllib.parse.unquote(proxy.username)}:"
+        f"{urllib.parse.unquote(proxy.password or '')}"
+    )
+    token = base64.b64encode(credentials.encode()).decode()
+    return {"Proxy-Authorization": f"Basic {token}"}
+
+
+class GitHubClient:
+    """Minimal REST and GraphQL client with one persistent connection per thread.
+
+    http.client connections aren't thread-safe, so each thread keeps its own
+    and reuses it across requests. HTTPS requests go through a proxy with a
+    CONNECT tunnel, plain HTTP ones by sending the absolute URL to it.
+    """
+
+    def __init__(self, token: str, api_url: str = DEFAULT_API_URL, timeout=60.0):
+        self.token = token
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.limiter = RateLimiter()
+        self._local = threading.local()
+
+    def _connection(self, scheme: str, netloc: str) -> http.client.HTTPConnection:
+        key = (scheme, netloc)
+        connections = self._local.__dict__.setdefault("connections", {})
+        conn = connections.get(key)
+        if conn is None:
+            proxy = get_proxy(scheme, netloc)
+            if proxy is not None:
+                proxy_netloc = f"{proxy.hostname}:{proxy.port or 80}"
+                if scheme == "https":
+                    conn = http.client.HTTPSConnection(
+                        proxy_netloc, timeout=self.timeout
+                    )
+                    conn.set_tunnel(netloc, headers=proxy_headers(proxy))
+                else:
+                    conn = http.client.HTTPConnection(
+                        proxy_netloc, timeout=self.timeout
+                    )
+            elif scheme == "https":
+                conn = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+            else:
+                conn = http.client.HTTPConnection(netloc, timeout=self.timeout)
+            connections[key] = conn
+        return conn
+
+    def _drop_connection(self, scheme: str, netloc: str) -> None:
+        connections = self._local.__dict__.get("connections", {})
+        conn = connections.pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def url_for(self, endpoint: str) -> str:
+        if endpoint.startswith(("http://", "https://")):
+            return endpoint
+        if endpoint.strip("/") == "graphql":
+            return graphql_url(self.api_url)
+        return f"{self.api_url}/{endpoint.lstrip('/')}"
+
+    def request(
+        self,
+        method: str,
+        endpoint: str,
+        body: bytes | Callable[[], Iterable[bytes]] | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> Response:
+        """Send a request, retrying when rate limited.
+
+        body may be a callable returning an iterable of chunks, which is called
+        again for every attempt so large bodies can be streamed.
+        """
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            try:
+                response = self._send(method, endpoint, body, headers)
+            finally:
+                self.limiter.release()
+
+            self.limiter.record(response.status, response.headers, response.body)
+            delay = self.limiter.retry_delay(
+                response.status, response.headers, response.body, attempt
+            )
+            if delay is None:
+                return response
+            attempt += 1
+
+    def _send(
+        self,
+        method: str,
+        endpoint: str,
+        body: bytes | Callable[[], Iterable[bytes]] | None = None,
+        headers: dict[str, str] | None = None,
+    ) -> Response:
+        """Send one request, reconnecting once if a kept-alive socket went stale."""
+        url = urllib.parse.urlsplit(self.url_for(endpoint))
+        path = url.path + (f"?{url.query}" if url.query else "")
+        request_headers = {
+            "Accept": "application/vnd.github+json",
+            "User-Agent": USER_AGENT,
+            "X-GitHub-Api-Version": API_VERSION,
+        }
+        if self.token:
+            request_headers["Authorization"] = f"Bearer {self.token}"
+        if body is not None:
+            request_headers["Content-Type"] = "application/json"
+        request_headers.update(headers or {})
+
+        proxy = get_proxy(url.scheme, url.netloc)
+        if proxy is not None and url.scheme == "http":
+            path = urllib.parse.urlunsplit(url._replace(fragment=""))
+            request_headers.update(proxy_headers(proxy))
+
+        for attempt in range(2):
+            conn = self._connection(url.scheme, url.netloc)
+            payload = body() if callable(body) else body
+            try:
+                conn.request(method, path, body=payload, headers=request_headers)
+                raw = conn.getresponse()
+                data = raw.read()
+            except (
+                http.client.RemoteDisconnected,
+                ConnectionResetError,
+                BrokenPipeError,
+            ) as exc:
+                self._drop_connection(url.scheme, url.netloc)
+                if attempt:
+                    raise GitHubError(f"{method} {endpoint}: {exc}") from exc
+                continue
+            except (OSError, http.client.HTTPException) as exc:
+                self._drop_connection(url.scheme, url.netloc)
+                raise GitHubError(f"{method} {endpoint}: {exc}") from exc
+
+            if raw.will_close:
+                self._drop_connection(url.scheme, url.netloc)
+            return Response(
+                status=raw.status,
+                body=data.decode("utf-8", errors="replace"),
+                headers={k.lower(): v for k, v in raw.getheaders()},
+            )
+
+        raise GitHubError(f"{method} {endpoint}: connection failed")
+
+    def rest(
+        self, endpoint: str, method: str = "GET", data: dict | None = None
+    ) -> Response:
+        body = json.dumps(data).encode() if data is not None else None
+        return self.request(method, endpoint, body)
+
+    def stream(
+        self,
+        method: str,
+        endpoint: str,
+        open_body: Callable[[], Iterable[bytes]],
+        length: int,
+    ) -> Response:
+        """Send a JSON body of known length chunk by chunk."""
+        return self.request(
+            method, endpoint, open_body, headers={"Content-Length": str(length)}
+        )
+
+    def graphql(self, query: str, variables: dict) -> dict:
+        """Run a GraphQL document and return the full payload (data and errors).
+
+        Raises GitHubError if the request fails or the body isn't JSON.
+        """
+        response = self.rest(
+            "graphql", method="POST", data={"query": query, "variables": variables}
+        )
+        try:
+            payload = response.json()
+        except json.JSONDecodeError as exc:
+            raise GitHubError(f"HTTP {response.status}: {response.body}") from exc
+        if not isinstance(payload, dict):
+            raise GitHubError(f"HTTP {response.status}: {response.body}")
+        if not response.ok and "data" not in payload:
+            raise GitHubError(payload.get("message") or f"HTTP {response.status}")
+        return payload
+
+
+_client: GitHubClient | None = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> GitHubClient:
+    """Get the process-wide client, creating it on first use."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            api_url = os.environ.get("GITHUB_API_URL") or DEFAULT_API_URL
+            _client = GitHubClient(get_token(), api_url)
+        return _client
+
+
+def suggested_concurrency(requested: int) -> int:
+    """Worker count for a burst of requests, given the remaining quota."""
+    if use_gh_cli():
+        return requested
+    return get_client().limiter.concurrency(requested)
+
+
+def select_path(value, path: str) -> str:
+    """Apply a simple jq path like `.a.b` and format it the way `gh --jq` does."""
+    for key in filter(None, path.strip().split(".")):
+        value = value.get(key) if isinstance(value, dict) else None
+    if value is None:
+        return "null"
+    if isinstance(value, str):
+        return value
+    return json.dumps(value)
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""Prefetch the context for a run with a single GraphQL query.
+
+The result is written to a JSON file that later steps read instead of
+calling the API again: the default branch, the issue or PR title, author,
+labels and head/base, the first page of review threads, and the latest
+opencode/oh-my-opencode releases.
+"""
+
+import json
+import os
+import sys
+from pathlib import Path
+
+from fetch_threads import (
+    THREAD_INDEX_FRAGMENT,
+    THREAD_PAGE_FRAGMENT,
+    run_graphql,
+)
+
+CONTEXT_QUERY = """
+query(
+  $owner: String!
+  $repo: String!
+  $number: Int!
+  $hasNumber: Boolean!
+  $opencode: Boolean!
+  $ohMyOpencode: Boolean!
+) {
+  repository(owner: $owner, name: $repo) {
+    defaultBranchRef {
+      name
+    }
+    item: issueOrPullRequest(number: $number) @include(if: $hasNumber) {
+      __typename
+      ... on Issue {
+        title
+        author {
+          login
+        }
+        labels(first: 100) {
+          nodes {
+            name
+          }
+        }
+      }
+      ... on PullRequest {
+        title
+        author {
+          login
+        }
+        labels(first: 100) {
+          nodes {
+            name
+          }
+        }
+        headRefName
+        headRefOid
+        baseRefName
+        baseRefOid
+        reviewThreads(first: 100) {
+          ...ThreadPage
+        }
+      }
+    }
+  }
+  opencode: repository(owner: "sst", name: "opencode") @include(if: $opencode) {
+    latestRelease {
+      tagName
+    }
+  }
+  ohMyOpencode: repository(owner: "code-yeongyu", name: "oh-my-opencode")
+    @include(if: $ohMyOpencode) {
+    latestRelease {
+      tagName
+    }
+  }
+}
+"""
+
+
+def build_query(thread_index: bool) -> str:
+    """The context query, with threads in the shape fetch_threads.py expects.
+
+    With the thread cache enabled, threads are listed without comment bodies.
+    """
+    return CONTEXT_QUERY + (
+        THREAD_INDEX_FRAGMENT if thread_index else THREAD_PAGE_FRAGMENT
+    )
+
+
+def latest_release(data: dict, alias: str) -> str | None:
+    release = (data.get(alias) or {}).get("latestRelease") or {}
+    return release.get("tagName")
+
+
+def prefetch_context(
+    owner: str,
+    repo: str,
+    number: int | None,
+    thread_index: bool = False,
+    releases: tuple[bool, bool] = (False, False),
+) -> dict | None:
+    """Fetch the run context.
+
+    Args:
+        owner: Repository owner
+        repo: Repository name
+        number: Issue or PR number, if the run has one
+        thread_index: Fetch threads in the thread-cache shape
+        releases: Whether to look up the latest opencode and oh-my-opencode
+            releases
+
+    Returns:
+        The context to write, or None if the query failed
+    """
+    variables = {
+        "owner": owner,
+        "repo": repo,
+        "number": number or 0,
+        "hasNumber": bool(number),
+        "opencode": releases[0],
+        "ohMyOpencode": releases[1],
+    }
+    response = run_graphql(build_query(thread_index), variables)
+    if not response:
+        return None
+
+    try:
+        data = response["data"]
+        repository = data["repository"]
+    except (KeyError, TypeError):
+        return None
+    if not repository:
+        return None
+
+    context: dict = {
+        "repository": f"{owner}/{repo}",
+        "number": number,
+        "default_branch": (repository.get("defaultBranchRef") or {}).get("name"),
+        "versions": {
+            "opencode": latest_release(data, "opencode"),
+            "oh_my_opencode": latest_release(data, "ohMyOpencode"),
+        },
+    }
+
+    item = repository.get("item")
+    if item:
+        context.update(
+            {
+                "type": item.get("__typename"),
+                "title": item.get("title"),
+                "author": (item.get("author") or {}).get("login"),
+                "labels": [
+                    label["name"]
+                    for label in (item.get("labels") or {}).get("nodes") or []
+                    if label
+                ],
+            }
+        )
+    if item and item.get("__typename") == "PullRequest":
+        context.update(
+            {
+                "head_ref": item.get("headRefName"),
+                "head_sha": item.get("headRefOid"),
+                "base_ref": item.get("baseRefName"),
+                "base_sha": item.get("baseRefOid"),
+                "thread_fields": "index" if thread_index else "full",
+                "review_threads": item.get("reviewThreads"),
+            }
+        )
+    return context
+
+
+def load_context(repo: str | None = None, number: int | str | None = None) -> dict:
+    """Read the prefetched context from DOBBYPHUS_CONTEXT_FILE.
+
+    Returns {} if there is no context file or it is for another repository
+    or issue, so callers fall back to querying the API.
+    """
+    path = os.environ.get("DOBBYPHUS_CONTEXT_FILE", "").strip()
+    if not path:
+        return {}
+    try:
+        context = json.loads(Path(path).read_text())
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if not isinstance(context, dict):
+        return {}
+    if repo is not None and context.get("repository") != repo:
+        return {}
+    if number is not None and str(context.get("number")) != str(number):
+        return {}
+    return context
+
+
+def main() -> None:
+    """Entry point - prefetches context and writes it to DOBBYPHUS_CONTEXT_FILE."""
+    if len(sys.argv) < 3:
+        print(
+            "Usage: prefetch_context.py <owner> <repo> [number]",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    owner = sys.argv[1]
+    repo = sys.argv[2]
+    number_arg = sys.argv[3] if len(sys.argv) > 3 else ""
+    try:
+        number = int(number_arg) if number_arg else None
+    except ValueError:
+        print(f"Invalid number: {number_arg}", file=sys.stderr)
+        sys.exit(1)
+
+    output_path = os.environ.get("DOBBYPHUS_CONTEXT_FILE", "").strip()
+    if not output_path:
+        print("DOBBYPHUS_CONTEXT_FILE not set", file=sys.stderr)
+        sys.exit(1)
+
+    releases = (
+        os.environ.get("OPENCODE_VERSION", "latest") == "latest",
+        os.environ.get("OH_MY_OPENCODE_VERSION", "latest") == "latest",
+    )
+    thread_index = bool(os.environ.get("THREAD_CACHE_DIR", "").strip())
+
+    context = prefetch_context(owner, repo, number, thread_index, releases)
+    if context is None:
+        # Later steps query the API themselves when the file is missing
+        print("Warning: Could not prefetch context", file=sys.stderr)
+        Path(output_path).unlink(missing_ok=True)
+        return
+
+    Path(output_path).write_text(json.dumps(context))
+    print(f"Prefetched context for {owner}/{repo}#{number or '-'}")
+
+
+if __name__ == "__main__":
+    main()
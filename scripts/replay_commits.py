@@ -2,13 +2,104 @@
 """Replay commits as signed via GitHub API and create PR if needed."""
 
 import base64
+import hashlib
 import json
 import os
 import subprocess
 import sys
 import tempfile
-from dataclasses import dataclass
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AbstractContextManager, contextmanager
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import BinaryIO
+
+from github_client import (
+    GitHubError,
+    get_client,
+    run_gh,
+    select_path,
+    suggested_concurrency,
+    use_gh_cli,
+)
+from prefetch_context import load_context
+
+# Blob uploads are independent requests, so a commit's blobs are uploaded in
+# parallel. Override with REPLAY_UPLOAD_WORKERS.
+DEFAULT_UPLOAD_WORKERS = 8
+
+# "objects" replays from git's object database without touching the working
+# tree; "worktree" cherry-picks each commit into the checkout.
+REPLAY_MODES = ("objects", "worktree", "local")
+DEFAULT_REPLAY_MODE = "objects"
+
+SUBMODULE_MODE = "160000"
+
+# Blobs are streamed to the API in chunks of this many raw bytes (a multiple
+# of 3, so each chunk base64-encodes without padding). Peak memory per upload
+# is about 2 x BLOB_CHUNK_SIZE regardless of file size.
+BLOB_CHUNK_SIZE = 3 * 256 * 1024
+BLOB_JSON_PREFIX = b'{"encoding": "base64", "content": "'
+BLOB_JSON_SUFFIX = b'"}'
+
+BinaryContext = AbstractContextManager[BinaryIO]
+
+# Local mode signs commits with git instead of the API. An ssh key is a
+# private key file or its contents; an openpgp key is a key ID in the keyring.
+SIGNING_FORMATS = ("ssh", "openpgp")
+DEFAULT_SIGNING_FORMAT = "ssh"
+
+# Replay progress is journaled here (relative to the git dir) so a failed
+# replay can resume. Override with REPLAY_JOURNAL.
+DEFAULT_JOURNAL_NAME = "dobbyphus-replay.jsonl"
+
+# Exit code for failures worth retrying, like EX_TEMPFAIL: a git or API call
+# that failed mid-replay. Configuration errors exit 1.
+RETRY_EXIT_CODE = 75
+
+# "auto" uses the GraphQL createCommitOnBranch mutation (one request per
+# commit) for small changesets and the REST git data API otherwise; "rest"
+# always uses the REST API.
+REPLAY_BACKENDS = ("auto", "rest")
+DEFAULT_REPLAY_BACKEND = "auto"
+
+# Commit OIDs checked per aliased signature query
+SIGNATURE_QUERY_CHUNK = 100
+
+SIGNATURE_QUERY = """
+query($owner: String!, $name: String!{params}) {{
+  repository(owner: $owner, name: $name) {{{fields}
+  }}
+}}
+"""
+
+SIGNATURE_FIELD = """
+    c{i}: object(oid: $c{i}) {{
+      ... on Commit {{
+        signature {{
+          isValid
+        }}
+      }}
+    }}"""
+
+# createCommitOnBranch sends file contents inline and cannot set file modes,
+# so it is only used for changesets within these limits.
+GRAPHQL_MAX_FILES = 100
+GRAPHQL_MAX_PAYLOAD_BYTES = 10 * 1024 * 1024
+
+CREATE_COMMIT_MUTATION = """
+mutation($input: CreateCommitOnBranchInput!) {
+  createCommitOnBranch(input: $input) {
+    commit {
+      oid
+      tree {
+        oid
+      }
+    }
+  }
+}
+"""
 
 
 def run(cmd: list[str], *, check: bool = True, capture: bool = True) -> str:
@@ -28,6 +119,11 @@ def gh_api(
     jq: str | None = None,
     check: bool = True,
 ) -> str:
+    if not use_gh_cli():
+        return http_api(
+            endpoint, method=method, input_data=input_data, jq=jq, check=check
+        )
+
     cmd = ["gh", "api", endpoint]
     if method != "GET":
         cmd.extend(["-X", method])
@@ -36,13 +132,7 @@ def gh_api(
 
     if input_data is not None:
         cmd.extend(["--input", "-"])
-        result = subprocess.run(
-            cmd,
-            input=json.dumps(input_data),
-            capture_output=True,
-            text=True,
-            check=False,
-        )
+        result = run_gh(cmd, json.dumps(input_data))
         if result.returncode != 0:
             print(f"gh api error: {result.stderr}", file=sys.stderr)
             if check:
@@ -51,7 +141,61 @@ def gh_api(
                 )
         return result.stdout.strip()
 
-    return run(cmd, check=check)
+    result = run_gh(cmd)
+    if check and result.returncode != 0:
+        raise subprocess.CalledProcessError(
+            result.returncode, cmd, result.stdout, result.stderr
+        )
+    return result.stdout.strip()
+
+
+def http_api(
+    endpoint: str,
+    *,
+    method: str = "GET",
+    input_data: dict | None = None,
+    jq: str | None = None,
+    check: bool = True,
+) -> str:
+    """gh_api over the shared HTTP client, with the same error semantics."""
+    cmd = ["gh", "api", endpoint]
+    try:
+        response = get_client().rest(endpoint, method=method, data=input_data)
+    except GitHubError as exc:
+        print(f"gh api error: {exc}", file=sys.stderr)
+        if check:
+            raise subprocess.CalledProcessError(1, cmd, "", str(exc)) from exc
+        return ""
+
+    if not response.ok:
+        print(f"gh api error: HTTP {response.status}: {response.body}", file=sys.stderr)
+        if check:
+            raise subprocess.CalledProcessError(
+                1, cmd, response.body, f"HTTP {response.status}"
+            )
+        return "" if jq else response.body.strip()
+
+    if jq:
+        try:
+            return select_path(response.json(), jq)
+        except json.JSONDecodeError:
+            return ""
+    return response.body.strip()
+
+
+def graphql(query: str, variables: dict) -> dict:
+    """Run a GraphQL query and return its data, raising on errors."""
+    response = json.loads(
+        gh_api(
+            "graphql",
+            method="POST",
+            input_data={"query": query, "variables": variables},
+        )
+    )
+    if response.get("errors"):
+        messages = "; ".join(e.get("message", "") for e in response["errors"])
+        raise RuntimeError(f"GraphQL error: {messages}")
+    return response["data"]
 
 
 @dataclass
@@ -63,6 +207,118 @@ class Config:
     default_branch: str
     issue_number: str
     issue_title: str
+    upload_workers: int = DEFAULT_UPLOAD_WORKERS
+    replay_mode: str = DEFAULT_REPLAY_MODE
+    replay_backend: str = DEFAULT_REPLAY_BACKEND
+    signing_key: str = ""
+    signing_format: str = DEFAULT_SIGNING_FORMAT
+
+
+@dataclass
+class FileChange:
+    path: str
+    mode: str
+    sha: str | None  # None when the file is deleted
+
+
+class ReplayJournal:
+    """Append-only record of replay progress, used to resume failed replays.
+
+    Each line is a JSON event: the branch header, which also records the
+    original HEAD, a signed commit created for an original commit on a given
+    parent, blobs uploaded, or the branch being created by this replay.
+    """
+
+    def __init__(self, path: Path, repo: str, branch: str):
+        self.path = path
+        self.repo = repo
+        self.branch = branch
+        self.head: str | None = None
+        self.commits: dict[tuple[str, str], tuple[str, str]] = {}
+        self.blobs: set[str] = set()
+        self.created_branch = False
+
+    @classmethod
+    def open(
+        cls, path: Path, repo: str, branch: str, head: str | None = None
+    ) -> "ReplayJournal":
+        """Load the journal at path, discarding it if it's for another branch."""
+        journal = cls(path, repo, branch)
+        try:
+            lines = path.read_text().splitlines()
+        except OSError:
+            lines = []
+
+        events = []
+        for line in lines:
+            try:
+                events.append(json.loads(line))
+            except json.JSONDecodeError:
+                # A crash can leave a partial last line
+                continue
+
+        header = events[0] if events else {}
+        if header.get("repo") == repo and header.get("branch") == branch:
+            journal.head = header.get("head")
+            for event in events[1:]:
+                kind = event.get("type")
+                if kind == "commit":
+                    key = (event["original"], event["parent"])
+                    journal.commits[key] = (event["signed"], event["tree"])
+                elif kind == "blobs":
+                    journal.blobs.update(event["shas"])
+                elif kind == "branch":
+                    journal.created_branch = True
+        else:
+            journal.clear()
+            header = {"type": "header", "repo": repo, "branch": branch}
+            if head:
+                header["head"] = head
+                journal.head = head
+            journal._append(header)
+        return journal
+
+    def _append(self, event: dict) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self.path.open("a") as f:
+            f.write(json.dumps(event) + "\n")
+
+    def record_commit(self, original: str, parent: str, signed: str, tree: str):
+        self.commits[(original, parent)] = (signed, tree)
+        self._append(
+            {
+                "type": "commit",
+                "original": original,
+                "parent": parent,
+                "signed": signed,
+                "tree": tree,
+            }
+        )
+
+    def record_blobs(self, shas: set[str]) -> None:
+        new = shas - self.blobs
+        if new:
+            self.blobs.update(new)
+            self._append({"type": "blobs", "shas": sorted(new)})
+
+    def record_created_branch(self) -> None:
+        self.created_branch = True
+        self._append({"type": "branch"})
+
+    def clear(self) -> None:
+        self.path.unlink(missing_ok=True)
+
+
+@dataclass
+class ReplayState:
+    """Progress of a replay."""
+
+    parent_sha: str
+    base_tree: str
+    # Where the remote branch currently points (None if it doesn't exist yet)
+    remote_head: str | None
+    known_blobs: set[str]
+    journal: ReplayJournal | None = field(default=None)
 
 
 def get_current_branch() -> str:
@@ -70,12 +326,18 @@ def get_current_branch() -> str:
 
 
 def get_default_branch(repo: str) -> str:
+    prefetched = load_context(repo).get("default_branch")
+    if prefetched:
+        return prefetched
     return gh_api(f"repos/{repo}", jq=".default_branch")
 
 
 def get_issue_title(repo: str, number: str) -> str:
     if not number:
         return ""
+    prefetched = load_context(repo, number).get("title")
+    if prefetched is not None:
+        return prefetched
     try:
         return gh_api(f"repos/{repo}/issues/{number}", jq=".title")
     except subprocess.CalledProcessError:
@@ -119,44 +381,156 @@ def is_commit_signed(repo: str, sha: str) -> bool:
     return result == "true"
 
 
-def filter_new_commits(repo: str, commits: list[str], remote_ref: str) -> list[str]:
+def get_signed_commits(repo: str, shas: list[str]) -> set[str]:
+    """Get which commits on remote are signed, with one GraphQL query per chunk.
+
+    Commits that can't be checked are treated as unsigned.
+    """
+    owner, _, name = repo.partition("/")
+    signed = set()
+    for start in range(0, len(shas), SIGNATURE_QUERY_CHUNK):
+        chunk = shas[start : start + SIGNATURE_QUERY_CHUNK]
+        params = "".join(f", $c{i}: GitObjectID!" for i in range(len(chunk)))
+        fields = "".join(SIGNATURE_FIELD.format(i=i) for i in range(len(chunk)))
+        query = SIGNATURE_QUERY.format(params=params, fields=fields)
+        variables: dict = {"owner": owner, "name": name}
+        variables.update({f"c{i}": sha for i, sha in enumerate(chunk)})
+        try:
+            repository = graphql(query, variables)["repository"]
+        except (RuntimeError, subprocess.CalledProcessError, KeyError, TypeError):
+            print("  Could not check commit signatures", file=sys.stderr)
+            continue
+        for i, sha in enumerate(chunk):
+            signature = (repository.get(f"c{i}") or {}).get("signature") or {}
+            if signature.get("isValid"):
+                signed.add(sha)
+    return signed
+
+
+def get_locally_signed_commits(shas: list[str]) -> set[str]:
+    """Commits that carry a signature header, read from the local object store.
+
+    Used for local replays, where GitHub only reports a commit as verified if
+    the signing key is registered to an account.
+    """
+    output = git("log", "--no-walk=unsorted", "--pretty=raw", *shas)
+    signed = set()
+    sha = ""
+    for line in output.splitlines():
+        if line.startswith("commit "):
+            sha = line.split()[1]
+        elif line.startswith("gpgsig"):
+            signed.add(sha)
+    return signed
+
+
+def filter_new_commits(
+    repo: str,
+    commits: list[str],
+    remote_ref: str,
+    base: str | None = None,
+    local_signatures: bool = False,
+) -> list[str]:
     """Filter commits, keeping those that need replaying.
 
     A commit needs replaying if it's either:
     - Not on the remote branch at all, OR
     - On the remote branch but unsigned (pushed directly, not via GitHub API)
+
+    Ancestry comes from one rev-list of remote_ref (limited to commits not
+    reachable from base) and signatures from one batched query, or from the
+    commits themselves when local_signatures is set.
     """
+    rev_args = [remote_ref, f"^{base}"] if base else [remote_ref]
+    output = git("rev-list", *rev_args, check=False)
+    on_remote = set(output.split())
+
+    remote_commits = [sha for sha in commits if sha in on_remote]
+    if not remote_commits:
+        signed = set()
+    elif local_signatures:
+        signed = get_locally_signed_commits(remote_commits)
+    else:
+        signed = get_signed_commits(repo, remote_commits)
+
     new_commits = []
     for sha in commits:
-        try:
-            # If this succeeds, sha is an ancestor of remote_ref (on remote)
-            git("merge-base", "--is-ancestor", sha, remote_ref)
-            # Commit is on remote - check if it's signed
-            if is_commit_signed(repo, sha):
-                print(f"  Skipping {sha[:7]} (already signed on remote)")
-            else:
-                print(f"  Including {sha[:7]} (on remote but unsigned)")
-                new_commits.append(sha)
-        except subprocess.CalledProcessError:
-            # sha is NOT an ancestor of remote_ref (new commit)
+        if sha not in on_remote:
+            new_commits.append(sha)
+        elif sha in signed:
+            print(f"  Skipping {sha[:7]} (already signed on remote)")
+        else:
+            print(f"  Including {sha[:7]} (on remote but unsigned)")
             new_commits.append(sha)
     return new_commits
 
 
-def get_commits(start_sha: str) -> list[str]:
+def get_commits(start_sha: str, head: str = "HEAD") -> list[str]:
     try:
-        output = git("rev-list", "--reverse", f"{start_sha}..HEAD")
+        output = git("rev-list", "--reverse", f"{start_sha}..{head}")
         return output.split() if output else []
     except subprocess.CalledProcessError:
         return []
 
 
+@dataclass
+class CommitInfo:
+    message: str
+    subject: str
+    body: str
+    author_name: str = ""
+    author_email: str = ""
+    author_date: str = ""
+
+
+# Commit metadata memo for this run, keyed by SHA
+_commit_info: dict[str, CommitInfo] = {}
+
+
+def load_commit_info(shas: list[str]) -> None:
+    """Load metadata for commits with a single git log pass."""
+    missing = [sha for sha in dict.fromkeys(shas) if sha not in _commit_info]
+    if not missing:
+        return
+
+    output = git(
+        "log",
+        "--no-walk=unsorted",
+        "-z",
+        "--format=%H%x00%an%x00%ae%x00%aI%x00%s%x00%b%x00%B",
+        *missing,
+    )
+    fields = output.split("\0")
+    for i in range(0, len(fields) - 6, 7):
+        sha, name, email, date, subject, body, message = (
+            f.strip() for f in fields[i : i + 7]
+        )
+        _commit_info[sha] = CommitInfo(
+            message=message,
+            subject=subject,
+            body=body,
+            author_name=name,
+            author_email=email,
+            author_date=date,
+        )
+
+    # Abbreviated SHAs and refs resolve to a single commit
+    if len(missing) == 1 and missing[0] not in _commit_info and len(fields) >= 7:
+        _commit_info[missing[0]] = _commit_info[fields[0].strip()]
+
+
+def get_commit_info(sha: str) -> CommitInfo:
+    if sha not in _commit_info:
+        load_commit_info([sha])
+    return _commit_info[sha]
+
+
 def get_commit_message(sha: str) -> str:
-    return git("log", "-1", "--format=%B", sha)
+    return get_commit_info(sha).message
 
 
 def get_commit_subject(sha: str) -> str:
-    return git("log", "-1", "--format=%s", sha)
+    return get_commit_info(sha).subject
 
 
 def get_changed_files() -> list[str]:
@@ -164,17 +538,149 @@ def get_changed_files() -> list[str]:
     return [f for f in output.split("\n") if f]
 
 
+def get_commit_changes(sha: str) -> list[FileChange]:
+    """Get a commit's file changes relative to its first parent.
+
+    Reads straight from the object database, so the working tree is untouched.
+    """
+    output = git("diff-tree", "-r", "-z", "--no-renames", f"{sha}^", sha)
+    fields = output.split("\0")
+    changes = []
+    for meta, path in zip(fields[::2], fields[1::2]):
+        # :<old mode> <new mode> <old sha> <new sha> <status>
+        _, new_mode, _, new_sha, status = meta.lstrip(":").split()
+        if status == "D":
+            changes.append(FileChange(path=path, mode="100644", sha=None))
+        else:
+            changes.append(FileChange(path=path, mode=new_mode, sha=new_sha))
+    return changes
+
+
+def get_blob_sizes(shas: list[str]) -> dict[str, int]:
+    """Get the size in bytes of each blob with a single git process."""
+    if not shas:
+        return {}
+    result = subprocess.run(
+        ["git", "cat-file", "--batch-check=%(objectname) %(objectsize)"],
+        input="\n".join(shas) + "\n",
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    sizes = {}
+    for line in result.stdout.splitlines():
+        parts = line.split()
+        if len(parts) == 2 and parts[1].isdigit():
+            sizes[parts[0]] = int(parts[1])
+    return sizes
+
+
+def read_blob(blob_sha: str) -> bytes:
+    return subprocess.run(
+        ["git", "cat-file", "blob", blob_sha], capture_output=True, check=True
+    ).stdout
+
+
+def get_tree_sha(sha: str) -> str:
+    return git("rev-parse", f"{sha}^{{tree}}")
+
+
+def blob_json_length(size: int) -> int:
+    """Length of the blob JSON body for size bytes of content."""
+    return len(BLOB_JSON_PREFIX) + (size + 2) // 3 * 4 + len(BLOB_JSON_SUFFIX)
+
+
+def iter_blob_json(
+    open_source: Callable[[], BinaryContext], chunk_size: int = BLOB_CHUNK_SIZE
+) -> Iterator[bytes]:
+    """Yield the blob creation JSON body, base64-encoding the source in chunks.
+
+    Reads may return short chunks (pipes do), so bytes are carried over until a
+    multiple of 3 is available and padding only appears at the very end.
+    """
+    yield BLOB_JSON_PREFIX
+    carry = b""
+    with open_source() as source:
+        while chunk := source.read(chunk_size):
+            data = carry + chunk
+            cut = len(data) - len(data) % 3
+            carry = data[cut:]
+            if cut:
+                yield base64.b64encode(data[:cut])
+    if carry:
+        yield base64.b64encode(carry)
+    yield BLOB_JSON_SUFFIX
+
+
+def post_blob(repo: str, open_source: Callable[[], BinaryContext], size: int) -> str:
+    """Create a blob, streaming its content instead of holding it in memory."""
+    endpoint = f"repos/{repo}/git/blobs"
+    cmd = ["gh", "api", endpoint, "-X", "POST", "--input", "-"]
+
+    if not use_gh_cli():
+        try:
+            response = get_client().stream(
+                "POST",
+                endpoint,
+                lambda: iter_blob_json(open_source),
+                blob_json_length(size),
+            )
+        except GitHubError as exc:
+            print(f"gh api error: {exc}", file=sys.stderr)
+            raise subprocess.CalledProcessError(1, cmd, "", str(exc)) from exc
+        if not response.ok:
+            print(
+                f"gh api error: HTTP {response.status}: {response.body}",
+                file=sys.stderr,
+            )
+            raise subprocess.CalledProcessError(
+                1, cmd, response.body, f"HTTP {response.status}"
+            )
+        return json.loads(response.body)["sha"]
+
+    process = subprocess.Popen(
+        cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    assert process.stdin is not None
+    try:
+        for chunk in iter_blob_json(open_source):
+            process.stdin.write(chunk)
+    except BrokenPipeError:
+        pass
+    stdout, stderr = process.communicate()
+    if process.returncode != 0:
+        print(f"gh api error: {stderr.decode(errors='replace')}", file=sys.stderr)
+        raise subprocess.CalledProcessError(process.returncode, cmd, stdout, stderr)
+    return json.loads(stdout)["sha"]
+
+
 def create_blob(repo: str, file_path: str) -> str | None:
     path = Path(file_path)
     if not path.exists():
         return None
-    content = base64.b64encode(path.read_bytes()).decode("ascii")
-    response = gh_api(
-        f"repos/{repo}/git/blobs",
-        method="POST",
-        input_data={"content": content, "encoding": "base64"},
+    return post_blob(repo, lambda: path.open("rb"), path.stat().st_size)
+
+
+@contextmanager
+def open_object(blob_sha: str) -> Iterator[BinaryIO]:
+    """Stream a blob's content out of the object database."""
+    process = subprocess.Popen(
+        ["git", "cat-file", "blob", blob_sha], stdout=subprocess.PIPE
     )
-    return json.loads(response)["sha"]
+    assert process.stdout is not None
+    try:
+        yield process.stdout
+    finally:
+        process.stdout.close()
+        if process.wait() != 0:
+            raise subprocess.CalledProcessError(
+                process.returncode, ["git", "cat-file", "blob", blob_sha]
+            )
+
+
+def create_blob_from_object(repo: str, blob_sha: str) -> str:
+    size = int(git("cat-file", "-s", blob_sha))
+    return post_blob(repo, lambda: open_object(blob_sha), size)
 
 
 def get_file_mode(file_path: str) -> str:
@@ -184,12 +690,95 @@ def get_file_mode(file_path: str) -> str:
     return "100644"
 
 
-def create_tree(repo: str, parent_sha: str, files: list[str]) -> str:
+def hash_blob(file_path: str) -> str | None:
+    """Compute the git blob SHA of a file, as `git hash-object` would."""
+    path = Path(file_path)
+    if not path.exists():
+        return None
+    digest = hashlib.sha1(f"blob {path.stat().st_size}\0".encode())
+    with path.open("rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_tree_blobs(commit_sha: str) -> set[str]:
+    """Get the SHAs of all blobs in a commit's tree."""
+    output = git("ls-tree", "-r", "-z", commit_sha, check=False)
+    blobs = set()
+    for entry in output.split("\0"):
+        meta, _, _ = entry.partition("\t")
+        parts = meta.split()
+        if len(parts) == 3 and parts[1] == "blob":
+            blobs.add(parts[2])
+    return blobs
+
+
+def run_uploads(
+    upload: Callable[[str], str | None], items: list[str], workers: int
+) -> list[str | None]:
+    """Run upload for each item with bounded concurrency, preserving order.
+
+    The worker count is scaled down when the remaining API quota is low.
+    """
+    workers = suggested_concurrency(workers)
+    if workers <= 1 or len(items) <= 1:
+        return [upload(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(upload, items))
+
+
+def upload_blobs(
+    repo: str,
+    files: list[str],
+    workers: int = DEFAULT_UPLOAD_WORKERS,
+    known_blobs: set[str] | None = None,
+) -> list[str | None]:
+    """Upload blobs for files concurrently, skipping content the remote has.
+
+    Blob SHAs are computed locally, so files whose content is already in
+    known_blobs (or appears twice in this commit) are not uploaded again.
+    known_blobs is updated with every blob uploaded here.
+
+    Returns blob SHAs in the same order as files (None for deleted files).
+    """
+    if known_blobs is None:
+        known_blobs = set()
+
+    local_shas = [hash_blob(file_path) for file_path in files]
+
+    pending: dict[str, str] = {}
+    for file_path, sha in zip(files, local_shas):
+        if sha and sha not in known_blobs and sha not in pending:
+            pending[sha] = file_path
+
+    paths = list(pending.values())
+    reused = sum(1 for sha in local_shas if sha) - len(paths)
+    if reused:
+        print(f"    Reusing {reused} blob(s) already on remote")
+
+    uploaded = run_uploads(
+        lambda file_path: create_blob(repo, file_path), paths, workers
+    )
+
+    remote_shas = dict(zip(pending, uploaded))
+    known_blobs.update(sha for sha in uploaded if sha)
+    return [remote_shas.get(sha) or sha for sha in local_shas]
+
+
+def create_tree(
+    repo: str,
+    parent_sha: str,
+    files: list[str],
+    workers: int = DEFAULT_UPLOAD_WORKERS,
+    known_blobs: set[str] | None = None,
+) -> str:
     parent_tree = gh_api(f"repos/{repo}/git/commits/{parent_sha}", jq=".tree.sha")
+    blob_shas = upload_blobs(repo, files, workers, known_blobs)
 
     tree_entries: list[dict] = []
-    for file_path in files:
-        blob_sha = create_blob(repo, file_path)
+    for file_path, blob_sha in zip(files, blob_shas):
         entry: dict = {
             "path": file_path,
             "mode": get_file_mode(file_path),
@@ -210,6 +799,58 @@ def create_tree(repo: str, parent_sha: str, files: list[str]) -> str:
     return json.loads(response)["sha"]
 
 
+def create_tree_from_changes(
+    repo: str,
+    base_tree: str,
+    changes: list[FileChange],
+    workers: int = DEFAULT_UPLOAD_WORKERS,
+    known_blobs: set[str] | None = None,
+) -> str:
+    """Create a tree from object database changes on top of base_tree."""
+    if known_blobs is None:
+        known_blobs = set()
+
+    missing = []
+    for change in changes:
+        if (
+            change.sha
+            and change.mode != SUBMODULE_MODE
+            and change.sha not in known_blobs
+            and change.sha not in missing
+        ):
+            missing.append(change.sha)
+
+    reused = sum(1 for c in changes if c.sha and c.mode != SUBMODULE_MODE)
+    reused -= len(missing)
+    if reused:
+        print(f"    Reusing {reused} blob(s) already on remote")
+
+    run_uploads(lambda sha: create_blob_from_object(repo, sha), missing, workers)
+    known_blobs.update(missing)
+
+    tree_entries: list[dict] = []
+    for change in changes:
+        if change.sha:
+            print(f"    + {change.path}")
+        else:
+            print(f"    - {change.path} (deleted)")
+        tree_entries.append(
+            {
+                "path": change.path,
+                "mode": change.mode,
+                "type": "commit" if change.mode == SUBMODULE_MODE else "blob",
+                "sha": change.sha,
+            }
+        )
+
+    response = gh_api(
+        f"repos/{repo}/git/trees",
+        method="POST",
+        input_data={"base_tree": base_tree, "tree": tree_entries},
+    )
+    return json.loads(response)["sha"]
+
+
 def create_commit(repo: str, message: str, tree_sha: str, parent_sha: str) -> str:
     response = gh_api(
         f"repos/{repo}/git/commits",
@@ -219,6 +860,65 @@ def create_commit(repo: str, message: str, tree_sha: str, parent_sha: str) -> st
     return json.loads(response)["sha"]
 
 
+def fits_graphql_commit(changes: list[FileChange]) -> bool:
+    """Check whether a changeset can be committed with createCommitOnBranch.
+
+    The mutation only writes regular files, so executables, symlinks and
+    submodules go through the REST API. Base64 inflates contents by 4/3.
+    """
+    if len(changes) > GRAPHQL_MAX_FILES:
+        return False
+
+    additions = [c for c in changes if c.sha]
+    if any(c.mode != "100644" for c in additions):
+        return False
+
+    sizes = get_blob_sizes([c.sha for c in additions if c.sha])
+    payload = sum((sizes.get(c.sha or "", 0) + 2) // 3 * 4 for c in additions)
+    return payload <= GRAPHQL_MAX_PAYLOAD_BYTES
+
+
+def create_commit_graphql(
+    repo: str,
+    branch: str,
+    message: str,
+    changes: list[FileChange],
+    parent_sha: str,
+) -> tuple[str, str]:
+    """Create a signed commit on branch in a single GraphQL request.
+
+    The branch must currently point at parent_sha. Returns the commit SHA and
+    its tree SHA.
+    """
+    headline, _, body = message.partition("\n")
+    additions = [
+        {
+            "path": c.path,
+            "contents": base64.b64encode(read_blob(c.sha)).decode("ascii"),
+        }
+        for c in changes
+        if c.sha
+    ]
+    deletions = [{"path": c.path} for c in changes if not c.sha]
+
+    data = graphql(
+        CREATE_COMMIT_MUTATION,
+        {
+            "input": {
+                "branch": {
+                    "repositoryNameWithOwner": repo,
+                    "branchName": branch,
+                },
+                "expectedHeadOid": parent_sha,
+                "message": {"headline": headline, "body": body.strip("\n")},
+                "fileChanges": {"additions": additions, "deletions": deletions},
+            }
+        },
+    )
+    commit = data["createCommitOnBranch"]["commit"]
+    return commit["oid"], commit["tree"]["oid"]
+
+
 def create_ref(repo: str, branch: str, sha: str) -> None:
     gh_api(
         f"repos/{repo}/git/refs",
@@ -235,7 +935,13 @@ def update_ref(repo: str, branch: str, sha: str) -> None:
     )
 
 
-def replay_commit(repo: str, original_sha: str, parent_sha: str) -> str | None:
+def replay_commit(
+    repo: str,
+    original_sha: str,
+    parent_sha: str,
+    workers: int = DEFAULT_UPLOAD_WORKERS,
+    known_blobs: set[str] | None = None,
+) -> str | None:
     message = get_commit_message(original_sha)
     subject = get_commit_subject(original_sha)
     print(f"\n==> {subject}")
@@ -252,7 +958,7 @@ def replay_commit(repo: str, original_sha: str, parent_sha: str) -> str | None:
         print("    No file changes, skipping")
         return None
 
-    tree_sha = create_tree(repo, parent_sha, files)
+    tree_sha = create_tree(repo, parent_sha, files, workers, known_blobs)
     commit_sha = create_commit(repo, message, tree_sha, parent_sha)
     print(f"    Signed: {commit_sha[:7]}")
 
@@ -262,9 +968,193 @@ def replay_commit(repo: str, original_sha: str, parent_sha: str) -> str | None:
     return commit_sha
 
 
+@contextmanager
+def signing_config(key: str, fmt: str) -> Iterator[list[str]]:
+    """Yield `git -c` options that make `commit-tree -S` sign with key."""
+    options = ["-c", f"gpg.format={fmt}"]
+    if fmt != "ssh" or os.path.isfile(key):
+        yield [*options, "-c", f"user.signingkey={key}"]
+        return
+
+    # ssh-keygen needs the private key in a file; mkstemp creates it as 0600
+    fd, key_path = tempfile.mkstemp(prefix="dobbyphus-signing-")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(key.strip() + "\n")
+        yield [*options, "-c", f"user.signingkey={key_path}"]
+    finally:
+        os.unlink(key_path)
+
+
+def write_tree_from_changes(base_tree: str, changes: list[FileChange]) -> str:
+    """Apply a commit's changes to base_tree in a scratch index."""
+    index_info = "".join(
+        f"{c.mode} {c.sha}\t{c.path}\0" if c.sha else f"0 {'0' * 40}\t{c.path}\0"
+        for c in changes
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        env = {**os.environ, "GIT_INDEX_FILE": os.path.join(tmp, "index")}
+        for cmd, stdin in (
+            (["read-tree", base_tree], None),
+            (["update-index", "-z", "--index-info"], index_info),
+        ):
+            subprocess.run(["git", *cmd], input=stdin, env=env, text=True, check=True)
+        result = subprocess.run(
+            ["git", "write-tree"],
+            env=env,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+    return result.stdout.strip()
+
+
+def replay_commit_local(
+    original_sha: str, state: ReplayState, signing: list[str]
+) -> bool:
+    """Re-sign one commit locally with `git commit-tree -S`.
+
+    The commit keeps its author and message and is created on top of
+    state.parent_sha; nothing is sent to GitHub until the branch is pushed.
+    """
+    info = get_commit_info(original_sha)
+    print(f"\n==> {info.subject}")
+
+    changes = get_commit_changes(original_sha)
+    if not changes:
+        print("    No file changes, skipping")
+        return False
+
+    tree_sha = write_tree_from_changes(state.base_tree, changes)
+    env = {
+        **os.environ,
+        "GIT_AUTHOR_NAME": info.author_name,
+        "GIT_AUTHOR_EMAIL": info.author_email,
+        "GIT_AUTHOR_DATE": info.author_date,
+    }
+    result = subprocess.run(
+        ["git", *signing, "commit-tree", "-S", tree_sha, "-p", state.parent_sha],
+        input=info.message + "\n",
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    commit_sha = result.stdout.strip()
+    print(f"    Signed: {commit_sha[:7]}")
+    state.parent_sha = commit_sha
+    state.base_tree = tree_sha
+    return True
+
+
+def push_branch(branch: str, state: ReplayState) -> None:
+    """Publish the replayed branch with a single push.
+
+    The lease makes the push fail, like a non-fast-forward ref update, if the
+    remote branch moved since the replay started.
+    """
+    if state.remote_head == state.parent_sha:
+        return
+    print(f"\nPushing {branch} -> {state.parent_sha[:7]}")
+    git(
+        "push",
+        f"--force-with-lease=refs/heads/{branch}:{state.remote_head or ''}",
+        "origin",
+        f"{state.parent_sha}:refs/heads/{branch}",
+    )
+    state.remote_head = state.parent_sha
+
+
+def sync_remote_ref(repo: str, branch: str, state: ReplayState) -> None:
+    """Point the remote branch at the current replay parent."""
+    if state.remote_head == state.parent_sha:
+        return
+    if state.remote_head is None:
+        print(f"\nCreating ref {branch} -> {state.parent_sha[:7]}")
+        create_ref(repo, branch, state.parent_sha)
+        if state.journal:
+            state.journal.record_created_branch()
+    else:
+        print(f"\nUpdating ref {branch} -> {state.parent_sha[:7]}")
+        update_ref(repo, branch, state.parent_sha)
+    state.remote_head = state.parent_sha
+
+
+def resume_commit(original_sha: str, state: ReplayState) -> bool:
+    """Reuse a signed commit from the journal if one exists for this parent."""
+    if not state.journal:
+        return False
+    recorded = state.journal.commits.get((original_sha, state.parent_sha))
+    if not recorded:
+        return False
+    state.parent_sha, state.base_tree = recorded
+    print(f"    Resumed: {state.parent_sha[:7]} (from journal)")
+    return True
+
+
+def replay_commit_objects(
+    config: Config, original_sha: str, state: ReplayState
+) -> bool:
+    """Replay a commit without touching the working tree.
+
+    Small changesets are committed with one GraphQL request, which moves the
+    remote branch; larger ones go through the REST git data API. Advances
+    state and returns True if a signed commit was created (or resumed from
+    the journal).
+    """
+    message = get_commit_message(original_sha)
+    subject = get_commit_subject(original_sha)
+    print(f"\n==> {subject}")
+
+    if resume_commit(original_sha, state):
+        return True
+
+    try:
+        changes = get_commit_changes(original_sha)
+    except subprocess.CalledProcessError:
+        print("    Could not read commit changes, skipping")
+        return False
+
+    if not changes:
+        print("    No file changes, skipping")
+        return False
+
+    if config.replay_backend == "auto" and fits_graphql_commit(changes):
+        sync_remote_ref(config.repo, config.current_branch, state)
+        for change in changes:
+            if change.sha:
+                print(f"    + {change.path}")
+            else:
+                print(f"    - {change.path} (deleted)")
+        commit_sha, tree_sha = create_commit_graphql(
+            config.repo, config.current_branch, message, changes, state.parent_sha
+        )
+        state.remote_head = commit_sha
+        state.known_blobs.update(c.sha for c in changes if c.sha)
+    else:
+        tree_sha = create_tree_from_changes(
+            config.repo,
+            state.base_tree,
+            changes,
+            config.upload_workers,
+            state.known_blobs,
+        )
+        commit_sha = create_commit(config.repo, message, tree_sha, state.parent_sha)
+
+    print(f"    Signed: {commit_sha[:7]}")
+    if state.journal:
+        state.journal.record_blobs(state.known_blobs - state.journal.blobs)
+        state.journal.record_commit(
+            original_sha, state.parent_sha, commit_sha, tree_sha
+        )
+    state.parent_sha = commit_sha
+    state.base_tree = tree_sha
+    return True
+
+
 def get_commit_body(sha: str) -> str:
     """Get the commit body (message without subject line)."""
-    return git("log", "-1", "--format=%b", sha).strip()
+    return get_commit_info(sha).body
 
 
 def body_has_issue_reference(body: str, issue_number: str) -> bool:
@@ -420,7 +1310,105 @@ def create_pull_request(config: Config, head_sha: str) -> str:
     return data["html_url"]
 
 
+def parse_upload_workers(value: str | None) -> int:
+    """Parse REPLAY_UPLOAD_WORKERS, falling back to the default."""
+    if not value or not value.strip():
+        return DEFAULT_UPLOAD_WORKERS
+    try:
+        workers = int(value)
+    except ValueError:
+        print(
+            f"Invalid REPLAY_UPLOAD_WORKERS '{value}', using {DEFAULT_UPLOAD_WORKERS}",
+            file=sys.stderr,
+        )
+        return DEFAULT_UPLOAD_WORKERS
+    return max(1, workers)
+
+
+def parse_replay_mode(value: str | None) -> str:
+    """Parse REPLAY_MODE, falling back to the default."""
+    if not value or not value.strip():
+        return DEFAULT_REPLAY_MODE
+    mode = value.strip().lower()
+    if mode not in REPLAY_MODES:
+        print(
+            f"Invalid REPLAY_MODE '{value}', using {DEFAULT_REPLAY_MODE}",
+            file=sys.stderr,
+        )
+        return DEFAULT_REPLAY_MODE
+    return mode
+
+
+def parse_replay_backend(value: str | None) -> str:
+    """Parse REPLAY_BACKEND, falling back to the default."""
+    if not value or not value.strip():
+        return DEFAULT_REPLAY_BACKEND
+    backend = value.strip().lower()
+    if backend not in REPLAY_BACKENDS:
+        print(
+            f"Invalid REPLAY_BACKEND '{value}', using {DEFAULT_REPLAY_BACKEND}",
+            file=sys.stderr,
+        )
+        return DEFAULT_REPLAY_BACKEND
+    return backend
+
+
+def parse_signing_format(value: str | None) -> str:
+    """Parse REPLAY_SIGNING_FORMAT, falling back to the default."""
+    if not value or not value.strip():
+        return DEFAULT_SIGNING_FORMAT
+    fmt = value.strip().lower()
+    if fmt == "gpg":
+        return "openpgp"
+    if fmt not in SIGNING_FORMATS:
+        print(
+            f"Invalid REPLAY_SIGNING_FORMAT '{value}', using {DEFAULT_SIGNING_FORMAT}",
+            file=sys.stderr,
+        )
+        return DEFAULT_SIGNING_FORMAT
+    return fmt
+
+
+def get_journal_path() -> Path:
+    """Journal location: REPLAY_JOURNAL, or a file in the git dir."""
+    configured = os.environ.get("REPLAY_JOURNAL", "").strip()
+    if configured:
+        return Path(configured)
+    return Path(git("rev-parse", "--git-dir")) / DEFAULT_JOURNAL_NAME
+
+
+def get_replay_head(journal: ReplayJournal) -> str:
+    """The last commit to replay: HEAD, unless a failed replay moved it.
+
+    Worktree replays reset HEAD to each signed commit, so after a failure
+    HEAD no longer reaches the agent's remaining commits. The journal keeps
+    the original HEAD; it is used unless HEAD has since moved past it.
+    """
+    head = git("rev-parse", "HEAD")
+    recorded = journal.head
+    if not recorded or recorded == head:
+        return head
+    try:
+        git("merge-base", "--is-ancestor", recorded, head)
+    except subprocess.CalledProcessError as exc:
+        # 1 means not an ancestor; anything else, e.g. an unknown commit,
+        # leaves nothing to resume from
+        if exc.returncode == 1:
+            print(f"Resuming from original HEAD {recorded[:7]}")
+            return recorded
+    return head
+
+
 def main() -> int:
+    """Run the replay, exiting RETRY_EXIT_CODE if a git or API call failed."""
+    try:
+        return replay_main()
+    except (subprocess.CalledProcessError, GitHubError, OSError) as exc:
+        print(f"\nReplay failed: {exc}", file=sys.stderr)
+        return RETRY_EXIT_CODE
+
+
+def replay_main() -> int:
     if len(sys.argv) < 3:
         print(
             "Usage: replay_commits.py <start_sha> <start_branch> [issue_number]",
@@ -449,30 +1437,52 @@ def main() -> int:
         default_branch=default_branch,
         issue_number=issue_number,
         issue_title=issue_title,
+        upload_workers=parse_upload_workers(os.environ.get("REPLAY_UPLOAD_WORKERS")),
+        replay_mode=parse_replay_mode(os.environ.get("REPLAY_MODE")),
+        replay_backend=parse_replay_backend(os.environ.get("REPLAY_BACKEND")),
+        signing_key=os.environ.get("REPLAY_SIGNING_KEY", ""),
+        signing_format=parse_signing_format(os.environ.get("REPLAY_SIGNING_FORMAT")),
     )
 
+    if config.replay_mode == "local" and not config.signing_key.strip():
+        print("REPLAY_SIGNING_KEY is required for local replay", file=sys.stderr)
+        return 1
+
     print(f"Current branch: {current_branch}")
     print(f"Start branch: {start_branch}")
     print(f"Default branch: {default_branch}")
 
-    commits = get_commits(start_sha)
+    journal = ReplayJournal.open(
+        get_journal_path(), repo, current_branch, git("rev-parse", "HEAD")
+    )
+    commits = get_commits(start_sha, get_replay_head(journal))
     if not commits:
         print("\nNo commits to replay")
+        journal.clear()
         return 0
 
+    load_commit_info(commits)
+
     if current_branch == default_branch:
         print(
             f"\nError: Cannot replay commits to default branch '{default_branch}'",
             file=sys.stderr,
         )
         print("Agent must create a branch for changes.", file=sys.stderr)
+        journal.clear()
         return 1
 
     remote_sha = get_remote_branch_sha(repo, current_branch)
     if remote_sha:
         print(f"Remote branch exists at {remote_sha[:7]}")
         git("fetch", "origin", current_branch, check=False)
-        commits = filter_new_commits(repo, commits, f"origin/{current_branch}")
+        commits = filter_new_commits(
+            repo,
+            commits,
+            f"origin/{current_branch}",
+            start_sha,
+            local_signatures=config.replay_mode == "local",
+        )
         replay_base = remote_sha
         if commits:
             try:
@@ -484,27 +1494,66 @@ def main() -> int:
 
     if not commits:
         print("\nNo new commits to replay")
+        journal.clear()
         return 0
 
     count = len(commits)
     print(f"\nReplaying {count} commit(s) as signed...")
 
-    git("reset", "--hard", replay_base)
-    parent_sha = replay_base
+    if journal.commits:
+        print(f"Resuming from journal with {len(journal.commits)} signed commit(s)")
 
-    for original_sha in commits:
-        new_sha = replay_commit(repo, original_sha, parent_sha)
-        if new_sha:
-            parent_sha = new_sha
+    # A previous attempt may have created the branch before failing
+    is_new_branch = remote_sha is None or journal.created_branch
 
-    is_new_branch = not branch_exists_on_remote(repo, current_branch)
+    # Every blob in the base tree already exists on the remote; blobs uploaded
+    # during the replay are added as we go.
+    state = ReplayState(
+        parent_sha=replay_base,
+        base_tree="",
+        remote_head=remote_sha,
+        known_blobs=get_tree_blobs(replay_base) | journal.blobs,
+        journal=journal,
+    )
 
-    if is_new_branch:
-        print(f"\nCreating ref {current_branch} -> {parent_sha[:7]}")
-        create_ref(repo, current_branch, parent_sha)
+    if config.replay_mode == "local":
+        state.base_tree = get_tree_sha(replay_base)
+        with signing_config(config.signing_key, config.signing_format) as signing:
+            for original_sha in commits:
+                replay_commit_local(original_sha, state, signing)
+        git("reset", "--hard", state.parent_sha)
+        push_branch(current_branch, state)
+    elif config.replay_mode == "objects":
+        state.base_tree = get_tree_sha(replay_base)
+        for original_sha in commits:
+            replay_commit_objects(config, original_sha, state)
+
+        # Sync the checkout once, now that all signed commits exist
+        if state.parent_sha != replay_base:
+            git("fetch", "origin", state.parent_sha, check=False)
+        git("reset", "--hard", state.parent_sha)
     else:
-        print(f"\nUpdating ref {current_branch} -> {parent_sha[:7]}")
-        update_ref(repo, current_branch, parent_sha)
+        git("reset", "--hard", replay_base)
+        for original_sha in commits:
+            parent_sha = state.parent_sha
+            if resume_commit(original_sha, state):
+                git("fetch", "origin", state.parent_sha, check=False)
+                git("reset", "--hard", state.parent_sha)
+                continue
+            new_sha = replay_commit(
+                repo,
+                original_sha,
+                parent_sha,
+                config.upload_workers,
+                state.known_blobs,
+            )
+            if new_sha:
+                state.parent_sha = new_sha
+                journal.record_blobs(state.known_blobs - journal.blobs)
+                journal.record_commit(original_sha, parent_sha, new_sha, "")
+
+    sync_remote_ref(repo, current_branch, state)
+    parent_sha = state.parent_sha
 
     print(f"Done! Replayed {count} commit(s) as signed.")
 
@@ -513,6 +1562,7 @@ def main() -> int:
         pr_url = create_pull_request(config, parent_sha)
         print(f"PR created: {pr_url}")
 
+    journal.clear()
     return 0
 
 
@@ -1,9 +1,11 @@
 #!/usr/bin/env python3
-"""Resolve a review thread via GraphQL mutation."""
+"""Resolve review threads via GraphQL mutations."""
 
 import json
-import subprocess
 import sys
+from collections.abc import Iterable
+
+from github_client import GitHubError, get_client, run_gh, use_gh_cli
 
 
 RESOLVE_MUTATION = """
@@ -28,9 +30,64 @@ mutation($threadId: ID!) {
 }
 """
 
+# Threads per batched mutation document. Each thread is one aliased
+# mutation field, e.g. `t0: resolveReviewThread(...)`.
+BATCH_SIZE = 100
+
+BATCH_FIELD = """
+  t{index}: {mutation}(input: {{ pullRequestReviewThreadId: $t{index} }}) {{
+    thread {{
+      id
+      isResolved
+    }}
+  }}"""
+
+# Reply then resolve, per thread. Mutation fields run in order, so the reply
+# is posted before the thread is resolved.
+REPLY_AND_RESOLVE_FIELDS = """
+  r{index}: addPullRequestReviewThreadReply(
+    input: {{ pullRequestReviewThreadId: $t{index}, body: $b{index} }}
+  ) {{
+    comment {{
+      databaseId
+    }}
+  }}
+  t{index}: resolveReviewThread(input: {{ pullRequestReviewThreadId: $t{index} }}) {{
+    thread {{
+      id
+      isResolved
+    }}
+  }}"""
+
+# Each thread takes two fields in a reply-and-resolve document
+REPLY_BATCH_SIZE = BATCH_SIZE // 2
+
+
+def run_graphql_http(query: str, variables: dict, partial: bool = False) -> dict | None:
+    """Execute a GraphQL request over HTTP, failing like gh does on errors.
+
+    With partial, a payload that has errors is still returned so callers can
+    use the fields that succeeded.
+    """
+    try:
+        response = get_client().graphql(query, variables)
+    except GitHubError as exc:
+        print(f"GraphQL error: {exc}", file=sys.stderr)
+        return None
+
+    errors = response.get("errors")
+    if errors and not partial:
+        messages = "; ".join(e.get("message", "") for e in errors)
+        print(f"GraphQL error: {messages}", file=sys.stderr)
+        return None
+    return response
+
+
+def run_graphql(query: str, variables: dict, partial: bool = False) -> dict | None:
+    """Execute a GraphQL query/mutation via the shared client or gh api."""
+    if not use_gh_cli():
+        return run_graphql_http(query, variables, partial)
 
-def run_graphql(query: str, variables: dict) -> dict | None:
-    """Execute a GraphQL query/mutation via gh api."""
     cmd = [
         "gh",
         "api",
@@ -42,9 +99,10 @@ def run_graphql(query: str, variables: dict) -> dict | None:
     for key, value in variables.items():
         cmd.extend(["-f", f"{key}={value}"])
 
-    result = subprocess.run(cmd, capture_output=True, text=True, check=False)
+    result = run_gh(cmd)
 
-    if result.returncode != 0:
+    # gh exits non-zero on GraphQL errors but still prints the payload
+    if result.returncode != 0 and not (partial and result.stdout.strip()):
         print(f"GraphQL error: {result.stderr}", file=sys.stderr)
         return None
 
@@ -106,29 +164,224 @@ def unresolve_thread(thread_id: str) -> bool:
         return False
 
 
-def main() -> None:
-    """Entry point - resolve or unresolve a thread."""
-    if len(sys.argv) < 2:
+def build_batch_mutation(mutation: str, count: int) -> str:
+    """Build a document running mutation once per thread, aliased t0..tN."""
+    params = ", ".join(f"$t{i}: ID!" for i in range(count))
+    fields = "".join(
+        BATCH_FIELD.format(index=i, mutation=mutation) for i in range(count)
+    )
+    return f"mutation({params}) {{{fields}\n}}\n"
+
+
+def set_threads_resolved(
+    thread_ids: list[str], resolved: bool = True
+) -> dict[str, bool]:
+    """Resolve or unresolve many threads with batched, aliased mutations.
+
+    Args:
+        thread_ids: GraphQL node IDs of the review threads
+        resolved: True to resolve, False to unresolve
+
+    Returns:
+        Success per thread ID
+    """
+    mutation = "resolveReviewThread" if resolved else "unresolveReviewThread"
+    thread_ids = list(dict.fromkeys(thread_ids))
+    results: dict[str, bool] = {}
+
+    for start in range(0, len(thread_ids), BATCH_SIZE):
+        chunk = thread_ids[start : start + BATCH_SIZE]
+        variables = {f"t{i}": thread_id for i, thread_id in enumerate(chunk)}
+        response = run_graphql(
+            build_batch_mutation(mutation, len(chunk)), variables, partial=True
+        )
+        report_errors(response, variables)
+        data = (response or {}).get("data") or {}
+
+        for alias, thread_id in variables.items():
+            thread = (data.get(alias) or {}).get("thread") or {}
+            results[thread_id] = thread.get("isResolved") is resolved
+
+    return results
+
+
+def report_errors(response: dict | None, variables: dict) -> None:
+    """Print GraphQL errors, naming the thread an aliased field was for."""
+    for error in (response or {}).get("errors") or []:
+        alias = str((error.get("path") or [""])[0])
+        thread_id = variables.get(f"t{alias[1:]}", "") if alias else ""
         print(
-            "Usage: resolve_thread.py <thread_id> [--unresolve]",
+            f"GraphQL error{f' for {thread_id}' if thread_id else ''}: "
+            f"{error.get('message')}",
             file=sys.stderr,
         )
+
+
+def build_reply_and_resolve_mutation(count: int) -> str:
+    """Build a document replying to and resolving count threads."""
+    params = ", ".join(f"$t{i}: ID!, $b{i}: String!" for i in range(count))
+    fields = "".join(REPLY_AND_RESOLVE_FIELDS.format(index=i) for i in range(count))
+    return f"mutation({params}) {{{fields}\n}}\n"
+
+
+def reply_and_resolve_threads(
+    replies: list[tuple[str, str]],
+) -> dict[str, dict[str, bool]]:
+    """Reply to and resolve many threads, one request per chunk.
+
+    A thread that was resolved but whose reply failed is unresolved again,
+    in one extra request, so it isn't closed without an answer.
+
+    Args:
+        replies: (thread ID, reply body) pairs
+
+    Returns:
+        Per thread ID, whether the reply was posted and the thread resolved
+    """
+    results: dict[str, dict[str, bool]] = {}
+
+    for start in range(0, len(replies), REPLY_BATCH_SIZE):
+        chunk = replies[start : start + REPLY_BATCH_SIZE]
+        variables: dict[str, str] = {}
+        for i, (thread_id, body) in enumerate(chunk):
+            variables[f"t{i}"] = thread_id
+            variables[f"b{i}"] = body
+        response = run_graphql(
+            build_reply_and_resolve_mutation(len(chunk)), variables, partial=True
+        )
+        report_errors(response, variables)
+        data = (response or {}).get("data") or {}
+
+        for i, (thread_id, _) in enumerate(chunk):
+            reply = (data.get(f"r{i}") or {}).get("comment")
+            thread = (data.get(f"t{i}") or {}).get("thread") or {}
+            results[thread_id] = {
+                "replied": bool(reply),
+                "resolved": thread.get("isResolved") is True,
+            }
+
+    unanswered = [
+        thread_id
+        for thread_id, result in results.items()
+        if result["resolved"] and not result["replied"]
+    ]
+    if unanswered:
+        for thread_id, reopened in set_threads_resolved(
+            unanswered, resolved=False
+        ).items():
+            results[thread_id]["resolved"] = not reopened
+
+    return results
+
+
+def reply_and_resolve(thread_id: str, body: str) -> bool:
+    """Reply to a review thread and resolve it in one request.
+
+    Args:
+        thread_id: The GraphQL node ID of the review thread
+        body: Markdown body of the reply
+
+    Returns:
+        True if the reply was posted and the thread resolved
+    """
+    result = reply_and_resolve_threads([(thread_id, body)])[thread_id]
+    return result["replied"] and result["resolved"]
+
+
+def read_replies(stdin: str) -> list[tuple[str, str]]:
+    """Parse a JSON list of {"thread_id": ..., "body": ...} objects."""
+    try:
+        items = json.loads(stdin)
+    except json.JSONDecodeError as exc:
+        raise ValueError(f"Invalid JSON on stdin: {exc}") from exc
+    if not isinstance(items, list):
+        raise TypeError("Expected a JSON list of replies")
+    replies = []
+    for item in items:
+        if (
+            not isinstance(item, dict)
+            or not item.get("thread_id")
+            or "body" not in item
+        ):
+            raise ValueError(f"Expected thread_id and body, got: {item!r}")
+        replies.append((str(item["thread_id"]), str(item["body"])))
+    return replies
+
+
+def main_reply_and_resolve(args: list[str]) -> None:
+    """Entry point for `reply-and-resolve`."""
+    if len(args) == 2:
+        replies = [(args[0], args[1])]
+    elif args == ["-"]:
+        try:
+            replies = read_replies(sys.stdin.read())
+        except (TypeError, ValueError) as exc:
+            print(str(exc), file=sys.stderr)
+            sys.exit(1)
+    else:
+        print(
+            "Usage: resolve_thread.py reply-and-resolve <thread_id> <body>\n"
+            '       resolve_thread.py reply-and-resolve - < [{"thread_id", "body"}]',
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
+    results = reply_and_resolve_threads(replies)
+    for thread_id, result in results.items():
+        if result["replied"] and result["resolved"]:
+            print(f"Replied and resolved thread: {thread_id}")
+        else:
+            done = [k for k in ("replied", "resolved") if result[k]]
+            state = f" (only {', '.join(done)})" if done else ""
+            print(
+                f"Failed to reply and resolve thread: {thread_id}{state}",
+                file=sys.stderr,
+            )
+
+    if not all(r["replied"] and r["resolved"] for r in results.values()):
         sys.exit(1)
 
-    thread_id = sys.argv[1]
+
+def read_thread_ids(args: list[str], stdin: Iterable[str]) -> list[str]:
+    """Thread IDs from arguments, or whitespace-separated on stdin for `-`."""
+    ids: list[str] = []
+    for arg in args:
+        if arg == "-":
+            ids.extend(word for line in stdin for word in line.split())
+        else:
+            ids.append(arg)
+    return ids
+
+
+def main() -> None:
+    """Entry point - resolve or unresolve one or more threads."""
+    if sys.argv[1:2] == ["reply-and-resolve"]:
+        main_reply_and_resolve(sys.argv[2:])
+        return
+
+    args = [arg for arg in sys.argv[1:] if arg != "--unresolve"]
     unresolve = "--unresolve" in sys.argv
+    thread_ids = read_thread_ids(args, sys.stdin)
 
-    if unresolve:
-        success = unresolve_thread(thread_id)
-        action = "Unresolved"
-    else:
-        success = resolve_thread(thread_id)
-        action = "Resolved"
+    if not thread_ids:
+        print(
+            "Usage: resolve_thread.py <thread_id>... [--unresolve]\n"
+            "       resolve_thread.py - [--unresolve] < thread_ids.txt\n"
+            "       resolve_thread.py reply-and-resolve <thread_id> <body>",
+            file=sys.stderr,
+        )
+        sys.exit(1)
 
-    if success:
-        print(f"{action} thread: {thread_id}")
-    else:
-        print(f"Failed to {action.lower()} thread: {thread_id}", file=sys.stderr)
+    action = "Unresolved" if unresolve else "Resolved"
+    results = set_threads_resolved(thread_ids, resolved=not unresolve)
+
+    for thread_id, success in results.items():
+        if success:
+            print(f"{action} thread: {thread_id}")
+        else:
+            print(f"Failed to {action.lower()} thread: {thread_id}", file=sys.stderr)
+
+    if not all(results.values()):
         sys.exit(1)
 
 
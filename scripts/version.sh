@@ -1,14 +1,28 @@
 #!/bin/bash
 set -euo pipefail
 
+# Release tags looked up by prefetch_context.py, if it ran
+prefetched() {
+  local file="${DOBBYPHUS_CONTEXT_FILE:-}"
+  if [[ -n "$file" && -f "$file" ]]; then
+    jq -r --arg key "$1" '.versions[$key] // empty' "$file"
+  fi
+}
+
 if [[ "${OPENCODE_VERSION:-latest}" == "latest" ]]; then
-  OPENCODE=$(gh api repos/sst/opencode/releases/latest --jq '.tag_name')
+  OPENCODE=$(prefetched opencode)
+  if [[ -z "$OPENCODE" ]]; then
+    OPENCODE=$(gh api repos/sst/opencode/releases/latest --jq '.tag_name')
+  fi
 else
   OPENCODE="${OPENCODE_VERSION}"
 fi
 
 if [[ "${OH_MY_OPENCODE_VERSION:-latest}" == "latest" ]]; then
-  OMO=$(gh api repos/code-yeongyu/oh-my-opencode/releases/latest --jq '.tag_name')
+  OMO=$(prefetched oh_my_opencode)
+  if [[ -z "$OMO" ]]; then
+    OMO=$(gh api repos/code-yeongyu/oh-my-opencode/releases/latest --jq '.tag_name')
+  fi
 else
   OMO="${OH_MY_OPENCODE_VERSION}"
 fi
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""Benchmark format_output.process_stream over opencode JSON streams.
+
+Usage: bench_format_output.py [stream.jsonl | transcript.jsonl.gz ...]
+
+Each stream is formatted with the original loop (a json.loads for every line
+and a flush for every print), with bare process_stream, and with
+process_stream set up as the action runs it: tool tracer, token budget and
+log governor spilling to a temporary directory. Output goes to a pipe that is
+drained by another thread, like the runner reading the step's stdout.
+Without arguments a synthetic session shaped like `opencode run --format
+json` output is used. Transcripts recorded with record_transcript (.gz) are
+read with their timestamps stripped.
+"""
+
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+
+from format_output import (
+    BudgetGovernor,
+    LogGovernor,
+    ToolTracer,
+    process_event,
+    process_stream,
+    read_transcript,
+)
+
+SYNTHETIC_STEPS = 2000
+ROUNDS = 3
+
+
+class FlushEachPrint(io.TextIOBase):
+    """Flushes after every print, like the original print(..., flush=True)."""
+
+    def __init__(self, output):
+        self.output = output
+
+    def write(self, text):
+        self.output.write(text)
+        if text.endswith("\n"):
+            self.output.flush()
+        return len(text)
+
+
+def process_stream_before(stream, output) -> None:
+    output = FlushEachPrint(output)
+    for line in stream:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            event = json.loads(line)
+            process_event(event, output)
+        except json.JSONDecodeError:
+            print(line, file=output, flush=True)
+
+
+def process_stream_production(stream, output) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        process_stream(
+            stream,
+            output,
+            tracer=ToolTracer(),
+            budget=BudgetGovernor(soft_tokens=10**12, hard_cost=10**6),
+            governor=LogGovernor(directory),
+        )
+
+
+def synthetic_session(steps: int = SYNTHETIC_STEPS) -> list[str]:
+    """A session of steps that each run a tool and say something."""
+    rng = random.Random(0)
+    session = "ses_bench"
+    lines = []
+    now = 1_700_000_000_000
+
+    def event(event_type: str, part: dict) -> str:
+        nonlocal now
+        now += rng.randint(5, 500)
+        return json.dumps(
+            {"type": event_type, "timestamp": now, "sessionID": session, "part": part}
+        )
+
+    for step in range(steps):
+        lines.append(event("step_start", {"type": "step-start", "snapshot": "a" * 40}))
+        tool = rng.choice(["read", "bash", "grep", "edit", "todowrite"])
+        if tool == "read":
+            tool_input = {"filePath": f"src/module_{step}.py"}
+            output = "\n".join(f"{n}: code line {n}" for n in range(200))
+        elif tool == "bash":
+            tool_input = {"command": "pytest -q", "description": "Run tests"}
+            output = "\n".join(f"test_{n} PASSED" for n in range(80))
+        elif tool == "grep":
+            tool_input = {"pattern": "def main"}
+            output = "\n".join(f"src/m{n}.py:1: def main" for n in range(30))
+        elif tool == "edit":
+            tool_input = {"filePath": f"src/module_{step}.py", "oldString": "a"}
+            output = ""
+        else:
+            tool_input = {"todos": [{"content": "Fix it", "status": "in_progress"}]}
+            output = ""
+        lines.append(
+            event(
+                "tool_use",
+                {
+                    "type": "tool",
+                    "callID": f"call_{step}",
+                    "tool": tool,
+                    "state": {
+                        "status": "completed",
+                        "input": tool_input,
+                        "output": output,
+                    },
+                },
+            )
+        )
+        lines.append(event("text", {"type": "text", "text": f"Step {step} done."}))
+        lines.append(
+            event(
+                "step_finish",
+                {
+                    "type": "step-finish",
+                    "reason": "tool-calls",
+                    "cost": 0.001,
+                    "tokens": {"input": 1200, "output": 80, "reasoning": 0},
+                },
+            )
+        )
+    return lines
+
+
+def drain(fd: int) -> None:
+    with open(fd, "rb", buffering=0) as reader:
+        while reader.read(65536):
+            pass
+
+
+def lines_per_second(process, lines: list[str]) -> float:
+    text = "\n".join(lines) + "\n"
+    best = float("inf")
+    for _ in range(ROUNDS):
+        read_fd, write_fd = os.pipe()
+        reader = threading.Thread(target=drain, args=(read_fd,))
+        reader.start()
+        with open(write_fd, "w") as pipe:
+            start = time.perf_counter()
+            process(io.StringIO(text), pipe)
+            best = min(best, time.perf_counter() - start)
+        reader.join()
+    return len(lines) / best
+
+
+def load_stream(path: str) -> list[str]:
+    if path.endswith(".gz"):
+        return [line for _, line, _ in read_transcript(path)]
+    return Path(path).read_text().splitlines()
+
+
+def main() -> None:
+    if len(sys.argv) > 1:
+        streams = {path: load_stream(path) for path in sys.argv[1:]}
+    else:
+        streams = {"synthetic": synthetic_session()}
+
+    for name, lines in streams.items():
+        before = lines_per_second(process_stream_before, lines)
+        after = lines_per_second(process_stream, lines)
+        production = lines_per_second(process_stream_production, lines)
+        print(
+            f"{name}: {len(lines)} lines, "
+            f"before {before:,.0f} lines/s, after {after:,.0f} lines/s "
+            f"({after / before:.2f}x), production {production:,.0f} lines/s "
+            f"({production / before:.2f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
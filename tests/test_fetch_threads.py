@@ -1,11 +1,27 @@
 """Tests for fetch_threads.py"""
 
+import json
+import re
 import sys
+import threading
 from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
 
-from fetch_threads import fetch_unresolved_threads, format_threads_for_prompt
+from fetch_threads import (
+    COMMENTS_QUERY,
+    FILES_QUERY,
+    INDEX_QUERY,
+    QUERY,
+    THREAD_COMMENTS_QUERY,
+    fetch_changed_files,
+    fetch_unresolved_threads,
+    format_threads_for_prompt,
+    parse_max_chars,
+    parse_thread_scope,
+    rank_threads,
+    run_graphql_http,
+)
 
 
 class TestFetchUnresolvedThreads:
@@ -197,6 +213,349 @@ class TestFetchUnresolvedThreads:
         assert result[0]["id"] == "thread1"
 
 
+def make_comment(n: int) -> dict:
+    return {
+        "id": f"c{n}",
+        "databaseId": n,
+        "author": {"login": "reviewer"},
+        "body": f"comment {n}",
+        "createdAt": "2025-01-01T00:00:00Z",
+        "updatedAt": "2025-01-01T00:00:00Z",
+    }
+
+
+def page(items: list, start: int, first: int) -> tuple[list, dict]:
+    end = start + first
+    info = {"hasNextPage": end < len(items), "endCursor": str(end)}
+    return items[start:end], info
+
+
+class FakeReviewThreads:
+    """Serves paginated thread and comment queries for a PR."""
+
+    def __init__(self, thread_count: int, comment_counts: dict[int, int]):
+        self.comments = {
+            f"t{i}": [make_comment(n) for n in range(comment_counts.get(i, 1))]
+            for i in range(thread_count)
+        }
+        self.resolved: set[str] = set()
+        self.outdated: set[str] = set()
+        self.paths: dict[str, str] = {}
+        self.calls: list[tuple[str, dict]] = []
+        self.lock = threading.Lock()
+
+    def comment_page(self, thread_id: str, start: int, first: int) -> dict:
+        nodes, info = page(self.comments[thread_id], start, first)
+        return {
+            "totalCount": len(self.comments[thread_id]),
+            "pageInfo": info,
+            "nodes": nodes,
+        }
+
+    def __call__(self, query: str, variables: dict) -> dict:
+        with self.lock:
+            self.calls.append((query, dict(variables)))
+        start = int(variables.get("after") or 0)
+        if query == COMMENTS_QUERY:
+            comments = self.comment_page(variables["id"], start, variables["first"])
+            return {"data": {"node": {"comments": comments}}}
+        if query == THREAD_COMMENTS_QUERY:
+            nodes = [
+                {"id": i, "comments": self.comment_page(i, 0, variables["first"])}
+                for i in variables["ids"]
+            ]
+            return {"data": {"nodes": nodes}}
+
+        nodes, info = page(list(self.comments), start, variables["first"])
+        threads = []
+        for thread_id in nodes:
+            if query == INDEX_QUERY:
+                comments = self.comments[thread_id]
+                comment_page = {
+                    "totalCount": len(comments),
+                    "nodes": [{"updatedAt": c["updatedAt"]} for c in comments[-1:]],
+                }
+            else:
+                assert query == QUERY
+                comment_page = self.comment_page(thread_id, 0, 10)
+            threads.append(
+                {
+                    "id": thread_id,
+                    "isResolved": thread_id in self.resolved,
+                    "isOutdated": thread_id in self.outdated,
+                    "path": self.paths.get(thread_id, "file.py"),
+                    "line": 1,
+                    "startLine": None,
+                    "viewerCanResolve": True,
+                    "comments": comment_page,
+                }
+            )
+        review_threads = {
+            "totalCount": len(self.comments),
+            "pageInfo": info,
+            "nodes": threads,
+        }
+        return {
+            "data": {"repository": {"pullRequest": {"reviewThreads": review_threads}}}
+        }
+
+
+def comment_calls(fake) -> list[str]:
+    """IDs of the threads whose comments were requested, once per request."""
+    ids = []
+    for query, variables in fake.calls:
+        if query == COMMENTS_QUERY:
+            ids.append(variables["id"])
+        elif query == THREAD_COMMENTS_QUERY:
+            ids.extend(variables["ids"])
+    return ids
+
+
+class TestPagination:
+    """Tests for cursor pagination of threads and comments."""
+
+    def fetch(self, monkeypatch, fake):
+        monkeypatch.setattr("fetch_threads.run_graphql", fake)
+        monkeypatch.setattr("fetch_threads.suggested_concurrency", lambda n: n)
+        return fetch_unresolved_threads("owner", "repo", 1)
+
+    def test_fetches_all_threads(self, monkeypatch):
+        """Test later thread pages are sized from totalCount."""
+        fake = FakeReviewThreads(thread_count=250, comment_counts={})
+        result = self.fetch(monkeypatch, fake)
+
+        assert [t["id"] for t in result] == [f"t{i}" for i in range(250)]
+        firsts = [variables["first"] for _, variables in fake.calls]
+        assert firsts == [100, 100, 50]
+
+    def test_fetches_remaining_comments(self, monkeypatch):
+        """Test long threads get the rest of their comments in order."""
+        fake = FakeReviewThreads(thread_count=3, comment_counts={0: 150, 2: 12})
+        result = self.fetch(monkeypatch, fake)
+
+        assert [c["database_id"] for c in result[0]["comments"]] == list(range(150))
+        assert len(result[1]["comments"]) == 1
+        assert [c["database_id"] for c in result[2]["comments"]] == list(range(12))
+
+        comment_calls = [v for q, v in fake.calls if q == COMMENTS_QUERY]
+        assert sorted((v["id"], v["first"]) for v in comment_calls) == [
+            ("t0", 40),
+            ("t0", 100),
+            ("t2", 2),
+        ]
+
+    def test_partial_comment_failure_keeps_first_page(self, monkeypatch, capsys):
+        """Test a failed follow-up keeps the comments already fetched."""
+        fake = FakeReviewThreads(thread_count=1, comment_counts={0: 15})
+
+        def flaky(query, variables):
+            return None if query == COMMENTS_QUERY else fake(query, variables)
+
+        result = self.fetch(monkeypatch, flaky)
+
+        assert len(result[0]["comments"]) == 10
+        assert "Only fetched 10 of 15 comments" in capsys.readouterr().err
+
+
+class TestThreadCache:
+    """Tests for the incremental thread cache."""
+
+    def fetch(self, monkeypatch, fake, cache_dir):
+        monkeypatch.setattr("fetch_threads.run_graphql", fake)
+        monkeypatch.setattr("fetch_threads.suggested_concurrency", lambda n: n)
+        fake.calls.clear()
+        return fetch_unresolved_threads("owner", "repo", 1, str(cache_dir))
+
+    def comment_calls(self, fake) -> list[str]:
+        return comment_calls(fake)
+
+    def test_unchanged_threads_not_refetched(self, monkeypatch, tmp_path):
+        """Test a second run only lists threads."""
+        fake = FakeReviewThreads(thread_count=3, comment_counts={1: 120})
+        first = self.fetch(monkeypatch, fake, tmp_path)
+        assert sorted(self.comment_calls(fake)) == ["t0", "t1", "t1", "t2"]
+
+        second = self.fetch(monkeypatch, fake, tmp_path)
+
+        assert second == first
+        assert self.comment_calls(fake) == []
+        assert [q for q, _ in fake.calls] == [INDEX_QUERY]
+        assert (tmp_path / "owner-repo-1.json").exists()
+
+    def test_new_comment_refetches_thread(self, monkeypatch, tmp_path):
+        """Test only threads with new activity are refetched."""
+        fake = FakeReviewThreads(thread_count=3, comment_counts={})
+        self.fetch(monkeypatch, fake, tmp_path)
+
+        reply = make_comment(99)
+        reply["updatedAt"] = "2025-01-02T00:00:00Z"
+        fake.comments["t2"].append(reply)
+        result = self.fetch(monkeypatch, fake, tmp_path)
+
+        assert self.comment_calls(fake) == ["t2"]
+        assert [c["database_id"] for c in result[2]["comments"]] == [0, 99]
+
+    def test_resolved_threads_dropped(self, monkeypatch, tmp_path):
+        """Test resolved threads leave the results and the cache."""
+        fake = FakeReviewThreads(thread_count=2, comment_counts={})
+        self.fetch(monkeypatch, fake, tmp_path)
+
+        fake.resolved.add("t0")
+        result = self.fetch(monkeypatch, fake, tmp_path)
+
+        assert [t["id"] for t in result] == ["t1"]
+        cache = json.loads((tmp_path / "owner-repo-1.json").read_text())
+        assert list(cache["threads"]) == ["t1"]
+
+    def test_cold_cache_batches_comments(self, monkeypatch, tmp_path):
+        """Test stale threads share one comment request per 100 threads."""
+        fake = FakeReviewThreads(thread_count=250, comment_counts={7: 130})
+
+        result = self.fetch(monkeypatch, fake, tmp_path)
+
+        assert len(result) == 250
+        assert [c["database_id"] for c in result[7]["comments"]] == list(range(130))
+        queries = [q for q, _ in fake.calls]
+        assert queries.count(INDEX_QUERY) == 3
+        assert queries.count(THREAD_COMMENTS_QUERY) == 3
+        # Only the thread longer than a page needs a follow-up
+        assert [v["id"] for q, v in fake.calls if q == COMMENTS_QUERY] == ["t7"]
+
+    def test_failed_batch_falls_back_per_thread(self, monkeypatch, tmp_path):
+        fake = FakeReviewThreads(thread_count=2, comment_counts={})
+
+        def flaky(query, variables):
+            if query == THREAD_COMMENTS_QUERY:
+                fake.calls.append((query, dict(variables)))
+                return None
+            return fake(query, variables)
+
+        monkeypatch.setattr("fetch_threads.run_graphql", flaky)
+        monkeypatch.setattr("fetch_threads.suggested_concurrency", lambda n: n)
+        result = fetch_unresolved_threads("owner", "repo", 1, str(tmp_path))
+
+        assert [len(t["comments"]) for t in result] == [1, 1]
+        assert sorted(comment_calls(fake)) == ["t0", "t0", "t1", "t1"]
+
+    def test_corrupt_cache_ignored(self, monkeypatch, tmp_path):
+        """Test an unreadable cache falls back to fetching everything."""
+        (tmp_path / "owner-repo-1.json").write_text("{not json")
+        fake = FakeReviewThreads(thread_count=1, comment_counts={})
+
+        result = self.fetch(monkeypatch, fake, tmp_path)
+
+        assert len(result[0]["comments"]) == 1
+        assert self.comment_calls(fake) == ["t0"]
+
+
+class TestThreadFilters:
+    """Tests for outdated and path filtering."""
+
+    def setup_fake(self, monkeypatch) -> FakeReviewThreads:
+        fake = FakeReviewThreads(thread_count=4, comment_counts={})
+        fake.outdated = {"t1"}
+        fake.paths = {"t2": "other.py"}
+        monkeypatch.setattr("fetch_threads.run_graphql", fake)
+        monkeypatch.setattr("fetch_threads.suggested_concurrency", lambda n: n)
+        return fake
+
+    def test_no_filters(self, monkeypatch):
+        self.setup_fake(monkeypatch)
+        result = fetch_unresolved_threads("owner", "repo", 1)
+        assert [t["id"] for t in result] == ["t0", "t1", "t2", "t3"]
+        assert result[1]["is_outdated"] is True
+
+    def test_exclude_outdated(self, monkeypatch):
+        self.setup_fake(monkeypatch)
+        result = fetch_unresolved_threads("owner", "repo", 1, exclude_outdated=True)
+        assert [t["id"] for t in result] == ["t0", "t2", "t3"]
+
+    def test_paths(self, monkeypatch):
+        self.setup_fake(monkeypatch)
+        result = fetch_unresolved_threads("owner", "repo", 1, paths={"other.py"})
+        assert [t["id"] for t in result] == ["t2"]
+
+    def test_filtered_threads_comments_not_fetched(self, monkeypatch, tmp_path):
+        fake = self.setup_fake(monkeypatch)
+        result = fetch_unresolved_threads(
+            "owner",
+            "repo",
+            1,
+            str(tmp_path),
+            exclude_outdated=True,
+            paths={"file.py"},
+        )
+        assert [t["id"] for t in result] == ["t0", "t3"]
+        assert sorted(comment_calls(fake)) == ["t0", "t3"]
+
+    def test_outdated_marked_in_summary(self):
+        thread = {"id": "t1", "path": "a.py", "line": 1, "is_outdated": True}
+        assert "**Outdated**" in format_threads_for_prompt([thread])
+
+
+class TestFetchChangedFiles:
+    """Tests for fetch_changed_files function."""
+
+    def test_pages_through_files(self, monkeypatch):
+        pages = {
+            None: (["a.py", "b.py"], {"hasNextPage": True, "endCursor": "2"}),
+            "2": (["c.py"], {"hasNextPage": False, "endCursor": "3"}),
+        }
+
+        def mock_run_graphql(query, variables):
+            assert query == FILES_QUERY
+            paths, info = pages[variables["after"]]
+            files = {"pageInfo": info, "nodes": [{"path": p} for p in paths]}
+            return {"data": {"repository": {"pullRequest": {"files": files}}}}
+
+        monkeypatch.setattr("fetch_threads.run_graphql", mock_run_graphql)
+        assert fetch_changed_files("owner", "repo", 1) == {"a.py", "b.py", "c.py"}
+
+    def test_failure_returns_none(self, monkeypatch):
+        monkeypatch.setattr("fetch_threads.run_graphql", lambda q, v: None)
+        assert fetch_changed_files("owner", "repo", 1) is None
+
+
+class TestParseThreadScope:
+    """Tests for parse_thread_scope function."""
+
+    def test_default(self):
+        assert parse_thread_scope(None) == "all"
+
+    def test_valid(self):
+        assert parse_thread_scope("Changed_Files") == "changed_files"
+
+    def test_invalid(self):
+        assert parse_thread_scope("nearby") == "all"
+
+
+class TestRunGraphqlHttp:
+    """Tests for run_graphql_http function."""
+
+    class FakeClient:
+        def __init__(self, payload):
+            self.payload = payload
+
+        def graphql(self, query, variables):
+            return self.payload
+
+    def test_returns_payload(self, monkeypatch):
+        """Test successful responses are returned as-is."""
+        payload = {"data": {"repository": None}}
+        monkeypatch.setattr(
+            "fetch_threads.get_client", lambda: self.FakeClient(payload)
+        )
+        assert run_graphql_http("query", {}) == payload
+
+    def test_errors_return_none(self, monkeypatch):
+        """Test GraphQL errors fail the same way gh api does."""
+        payload = {"data": None, "errors": [{"message": "boom"}]}
+        monkeypatch.setattr(
+            "fetch_threads.get_client", lambda: self.FakeClient(payload)
+        )
+        assert run_graphql_http("query", {}) is None
+
+
 class TestFormatThreadsForPrompt:
     """Tests for format_threads_for_prompt function."""
 
@@ -294,3 +653,104 @@ class TestFormatThreadsForPrompt:
         assert "Thread 2" in result
         assert "file1.py" in result
         assert "file2.py" in result
+
+
+def make_thread(n: int, path: str = "file.py", day: int = 1, body: str = "") -> dict:
+    return {
+        "id": f"thread{n}",
+        "path": path,
+        "line": n,
+        "start_line": None,
+        "can_resolve": True,
+        "comments": [
+            {
+                "author": "reviewer",
+                "database_id": 1000 + n,
+                "body": body or f"Comment on thread {n}",
+                "created_at": f"2025-01-{day:02d}T00:00:00Z",
+            }
+        ],
+    }
+
+
+class TestRankThreads:
+    """Tests for rank_threads function."""
+
+    def test_most_recent_first(self):
+        threads = [make_thread(1, day=1), make_thread(2, day=3), make_thread(3, day=2)]
+        ranked = rank_threads(threads)
+        assert [t["id"] for t in ranked] == ["thread2", "thread3", "thread1"]
+
+    def test_trigger_then_diff_path(self):
+        threads = [
+            make_thread(1, day=9),
+            make_thread(2, path="src/app.py", day=1),
+            make_thread(3, day=2),
+            make_thread(4, path="src/app.py", day=5),
+        ]
+        ranked = rank_threads(
+            threads, trigger_comment_id="1003", diff_path="src/app.py"
+        )
+        assert [t["id"] for t in ranked] == ["thread3", "thread4", "thread2", "thread1"]
+
+
+class TestBudgetedFormat:
+    """Tests for format_threads_for_prompt with a character budget."""
+
+    def test_fits_in_full(self):
+        threads = [make_thread(1), make_thread(2)]
+        result = format_threads_for_prompt(threads, max_chars=10_000)
+        assert "### Thread 2" in result
+        assert "more thread(s)" not in result
+
+    def test_rest_become_stubs(self):
+        threads = [make_thread(n, day=n, body="x" * 150) for n in range(1, 21)]
+        result = format_threads_for_prompt(threads, max_chars=2_000)
+
+        assert len(result) <= 2_000
+        assert "Found 20 unresolved review thread(s)" in result
+        # The most recent thread is shown in full
+        assert "### Thread 1: `file.py:20`" in result
+        assert "more thread(s), summarized" in result
+        assert re.search(
+            r"^- `thread\d+` `file.py:\d+` @reviewer: x+\.\.\.$", result, re.MULTILINE
+        )
+
+    def test_trigger_thread_first_without_budget(self):
+        """Test the ranking also applies with threads_max_chars: 0."""
+        threads = [make_thread(n, day=n) for n in range(1, 4)]
+        result = format_threads_for_prompt(threads, trigger_comment_id=1002)
+
+        assert "### Thread 1: `file.py:2`" in result
+        assert result.index("`file.py:3`") < result.index("`file.py:1`")
+
+    def test_summary_stays_bounded(self):
+        threads = [make_thread(n, body="x" * 150) for n in range(1, 400)]
+        result = format_threads_for_prompt(threads, max_chars=3_000)
+
+        assert len(result) <= 3_000
+        assert "more thread(s) not shown" in result
+
+    def test_trigger_thread_shown_in_full(self):
+        threads = [make_thread(n, day=n) for n in range(1, 6)]
+        result = format_threads_for_prompt(
+            threads, max_chars=300, trigger_comment_id=1002
+        )
+        assert result.count("### Thread") == 1
+        assert "### Thread 1: `file.py:2`" in result
+
+
+class TestParseMaxChars:
+    """Tests for parse_max_chars function."""
+
+    def test_empty(self):
+        assert parse_max_chars("") is None
+
+    def test_zero_disables(self):
+        assert parse_max_chars("0") is None
+
+    def test_value(self):
+        assert parse_max_chars("12000") == 12000
+
+    def test_invalid(self):
+        assert parse_max_chars("lots") is None
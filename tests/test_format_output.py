@@ -1,25 +1,54 @@
 #!/usr/bin/env python3
 
+import gzip
 import io
+import json
+import subprocess
 import sys
+import time
 from pathlib import Path
 
+import pytest
+
 sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
 
 from format_output import (
+    PARTIAL_PARSE_CHARS,
+    TIMEOUT_EXIT_CODE,
+    BudgetGovernor,
+    LogBuffer,
+    LogGovernor,
+    ToolTracer,
+    TranscriptRecorder,
+    TranscriptStream,
+    Watchdog,
+    WatchedStream,
+    decode_string_prefix,
+    format_todos,
     format_tool_input,
     format_tool_name,
     format_tool_output,
-    format_todos,
+    format_trace_markdown,
     get_tool_icon,
     handle_text,
     handle_tool_result,
     handle_tool_use,
+    load_budget,
+    parse_limit,
+    parse_tool_use_head,
+    peek_event_type,
     print_group_end,
     print_group_start,
     process_event,
     process_stream,
+    read_lines,
+    read_transcript,
+    replay_transcript,
+    run_opencode,
     truncate_content,
+    write_run_state,
+    write_tool_trace,
+    write_usage,
 )
 
 
@@ -385,3 +414,827 @@ class TestProcessStream:
         result = output.getvalue()
         assert "plain text line" in result
         assert "Valid JSON" in result
+
+    def test_skipped_events_not_parsed(self):
+        # A truncated step event would be passed through if it were parsed
+        stream = io.StringIO(
+            '{"type":"step_start","part":{"id":\n'
+            '{"type": "step_finish", "part": {}}\n'
+            '{"type":"text","part":{"text":"Done"}}\n'
+        )
+        output = io.StringIO()
+        process_stream(stream, output)
+        assert output.getvalue() == "Done\n"
+
+
+class TestPeekEventType:
+    def test_type_first(self):
+        assert peek_event_type('{"type":"step_start","part":{}}') == "step_start"
+
+    def test_whitespace(self):
+        assert peek_event_type('{ "type" : "text" }') == "text"
+
+    def test_type_not_first(self):
+        assert peek_event_type('{"part":{"type":"step-start"},"type":"x"}') is None
+
+    def test_not_json(self):
+        assert peek_event_type("plain text") is None
+
+
+class FlushCounter(io.StringIO):
+    def __init__(self):
+        super().__init__()
+        self.writes = 0
+        self.flushes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+    def flush(self):
+        self.flushes += 1
+        super().flush()
+
+
+class TestLogBuffer:
+    def test_batches_until_group_end(self):
+        output = FlushCounter()
+        buffer = LogBuffer(output, interval=0)
+        print_group_start("Title", buffer)
+        print("line 1", file=buffer)
+        print("line 2", file=buffer)
+        assert output.getvalue() == ""
+        print_group_end(buffer)
+        assert output.getvalue() == "::group::Title\nline 1\nline 2\n::endgroup::\n"
+        assert output.writes == 1
+
+    def test_group_start_flushes_previous_output(self):
+        output = io.StringIO()
+        buffer = LogBuffer(output, interval=0)
+        print("text", file=buffer)
+        print_group_start("Title", buffer)
+        assert output.getvalue() == "text\n"
+
+    def test_flushes_when_pending_is_large(self):
+        output = io.StringIO()
+        buffer = LogBuffer(output, interval=0, max_pending=10)
+        print("0123456789", file=buffer)
+        assert output.getvalue() == "0123456789"
+
+    def test_timer_flushes(self):
+        output = io.StringIO()
+        buffer = LogBuffer(output, interval=0.01)
+        print("text", file=buffer)
+        deadline = time.monotonic() + 2
+        while not output.getvalue() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert output.getvalue() == "text\n"
+
+    def test_close_flushes(self):
+        output = io.StringIO()
+        buffer = LogBuffer(output, interval=60)
+        print("text", file=buffer)
+        buffer.close()
+        assert output.getvalue() == "text\n"
+
+
+def tool_use_line(tool: str, tool_input: dict, tool_output: str) -> str:
+    event = {
+        "type": "tool_use",
+        "part": {
+            "type": "tool",
+            "tool": tool,
+            "state": {
+                "status": "completed",
+                "input": tool_input,
+                "output": tool_output,
+            },
+        },
+    }
+    return json.dumps(event) + "\n"
+
+
+class LineSizeRecorder(io.StringIO):
+    def __init__(self, text):
+        super().__init__(text)
+        self.longest = 0
+
+    def readline(self, size=-1):
+        line = super().readline(size)
+        self.longest = max(self.longest, len(line))
+        return line
+
+
+class TestReadLines:
+    def test_short_lines(self):
+        stream = io.StringIO("a\nbb\n")
+        assert list(read_lines(stream, 10)) == [("a\n", 0), ("bb\n", 0)]
+
+    def test_long_line_cut(self):
+        stream = LineSizeRecorder("x" * 25 + "\nnext\n")
+        assert list(read_lines(stream, 10)) == [("x" * 10, 15), ("next\n", 0)]
+        assert stream.longest == 10
+
+    def test_last_line_without_newline(self):
+        assert list(read_lines(io.StringIO("tail"), 10)) == [("tail", 0)]
+
+
+class TestDecodeStringPrefix:
+    def test_whole_string(self):
+        text = '"a\\nb" rest'
+        assert decode_string_prefix(text, 1, 100) == ("a\nb", True)
+
+    def test_cut_string(self):
+        text = '"abcdef"'
+        assert decode_string_prefix(text, 1, 3) == ("abc", False)
+
+    def test_cut_inside_escape(self):
+        text = '"ab\\u00e9"'
+        assert decode_string_prefix(text, 1, 5) == ("ab", False)
+
+
+class TestParseToolUseHead:
+    def test_suppressed_output_not_decoded(self, monkeypatch):
+        line = tool_use_line("read", {"filePath": "big.txt"}, "x" * 1000)
+
+        def fail(*args, **kwargs):
+            raise AssertionError("output decoded")
+
+        monkeypatch.setattr("format_output.json.loads", fail)
+        part = parse_tool_use_head(line)
+        assert part == {
+            "tool": "read",
+            "state": {"input": {"filePath": "big.txt"}, "output": ""},
+        }
+
+    def test_output_prefix(self):
+        line = tool_use_line("bash", {"command": "cat log"}, "line\n" * 3)
+        part = parse_tool_use_head(line)
+        assert part["state"]["output"] == "line\n" * 3
+
+    def test_not_a_tool_line(self):
+        assert parse_tool_use_head('{"type":"tool_use","part":{"name":"x"}}') is None
+
+
+class TestGiantLines:
+    def test_large_suppressed_output(self, monkeypatch):
+        monkeypatch.setattr("format_output.PARTIAL_PARSE_CHARS", 100)
+        line = tool_use_line("read", {"filePath": "big.txt"}, "x" * 1000)
+        output = io.StringIO()
+        process_stream(io.StringIO(line), output)
+        assert output.getvalue() == "::group::📄 Read: big.txt\n::endgroup::\n"
+
+    def test_overflowing_bash_output_cut(self):
+        line = tool_use_line("bash", {"command": "dump"}, "y" * 5000)
+        stream = LineSizeRecorder(line)
+        output = io.StringIO()
+        process_stream(stream, output, max_line_chars=1000)
+        result = output.getvalue()
+        assert "::group::🔨 Bash: dump" in result
+        assert "(output cut)" in result
+        assert "::endgroup::" in result
+        assert stream.longest <= 1000
+
+    def test_overflowing_other_line_skipped(self):
+        stream = io.StringIO("z" * 50 + "\n" + '{"type":"text","part":{"text":"ok"}}\n')
+        output = io.StringIO()
+        process_stream(stream, output, max_line_chars=40)
+        assert output.getvalue() == (
+            "Skipped a non-JSON line of 50 characters (limit 40)\nok\n"
+        )
+
+
+def timed_tool_use(call_id: str, tool: str, start: int, end: int, **tool_input) -> dict:
+    return {
+        "type": "tool_use",
+        "timestamp": end,
+        "part": {
+            "callID": call_id,
+            "tool": tool,
+            "state": {
+                "status": "completed",
+                "input": tool_input,
+                "output": "",
+                "time": {"start": start, "end": end},
+            },
+        },
+    }
+
+
+class TestToolTracer:
+    def test_completed_calls(self):
+        tracer = ToolTracer()
+        tracer.record(timed_tool_use("c1", "bash", 0, 45_000, command="pytest"))
+        tracer.record(timed_tool_use("c2", "read", 1000, 1050, filePath="a.py"))
+        tracer.record(timed_tool_use("c3", "read", 2000, 2500, filePath="b.py"))
+
+        summary = tracer.summary(top=2)
+
+        assert summary["calls"] == 3
+        assert list(summary["tools"]) == ["bash", "read"]
+        read = summary["tools"]["read"]
+        assert read["count"] == 2
+        assert read["p50_seconds"] == 0.05
+        assert read["max_seconds"] == 0.5
+        assert read["histogram"]["<100ms"] == 1
+        assert read["histogram"]["<1s"] == 1
+        assert summary["tools"]["bash"]["histogram"]["<1m"] == 1
+        assert [call["call_id"] for call in summary["slowest"]] == ["c1", "c3"]
+        assert summary["slowest"][0]["summary"] == "pytest"
+
+    def test_running_then_completed(self):
+        tracer = ToolTracer()
+        running = {
+            "type": "tool_use",
+            "timestamp": 1000,
+            "part": {"callID": "c1", "tool": "bash", "state": {"status": "running"}},
+        }
+        tracer.record(running)
+        assert tracer.calls == []
+        done = timed_tool_use("c1", "bash", 0, 3000)
+        del done["part"]["state"]["time"]
+        tracer.record(done)
+        assert tracer.calls[0].seconds == 2.0
+
+    def test_legacy_tool_result_pairing(self):
+        tracer = ToolTracer()
+        tracer.record(
+            {
+                "type": "tool_use",
+                "timestamp": 100,
+                "part": {"name": "read", "input": {}},
+            }
+        )
+        tracer.record(
+            {"type": "tool_result", "timestamp": 400, "part": {"content": ""}}
+        )
+        assert tracer.calls[0].tool == "read"
+        assert tracer.calls[0].seconds == 0.3
+
+    def test_untimed_call(self):
+        tracer = ToolTracer()
+        tracer.record(
+            {"type": "tool_use", "part": {"tool": "bash", "state": {"output": "x"}}}
+        )
+        summary = tracer.summary()
+        assert summary["tools"]["bash"]["untimed"] == 1
+        assert summary["slowest"] == []
+
+    def test_partial_parse_keeps_timing(self, monkeypatch):
+        monkeypatch.setattr("format_output.PARTIAL_PARSE_CHARS", 100)
+        event = timed_tool_use("c1", "read", 0, 250, filePath="big.txt")
+        event["part"]["state"]["output"] = "x" * 1000
+        tracer = ToolTracer()
+        process_stream(
+            io.StringIO(json.dumps(event) + "\n"), io.StringIO(), tracer=tracer
+        )
+        assert tracer.calls[0].call_id == "c1"
+        assert tracer.calls[0].seconds == 0.25
+
+
+class TestWriteToolTrace:
+    def test_markdown(self):
+        tracer = ToolTracer()
+        tracer.record(timed_tool_use("c1", "bash", 0, 90_000, command="make | tee"))
+        markdown = format_trace_markdown(tracer.summary())
+        assert "### Tool latency" in markdown
+        assert "| 🔨 Bash | 1 | 1m30s |" in markdown
+        assert "| make \\| tee | 1m30s |" in markdown
+
+    def test_outputs(self, tmp_path, monkeypatch):
+        trace_file = tmp_path / "trace.json"
+        step_summary = tmp_path / "summary.md"
+        github_output = tmp_path / "output"
+        monkeypatch.setenv("TOOL_TRACE_FILE", str(trace_file))
+        monkeypatch.setenv("GITHUB_STEP_SUMMARY", str(step_summary))
+        monkeypatch.setenv("GITHUB_OUTPUT", str(github_output))
+        tracer = ToolTracer()
+        tracer.record(timed_tool_use("c1", "grep", 0, 20, pattern="x"))
+
+        write_tool_trace(tracer)
+
+        trace = json.loads(trace_file.read_text())
+        assert trace["calls"] == 1
+        assert trace["all_calls"][0]["seconds"] == 0.02
+        assert "Tool latency" in step_summary.read_text()
+        outputs = dict(
+            line.split("=", 1) for line in github_output.read_text().splitlines()
+        )
+        assert json.loads(outputs["tool_trace"])["tools"]["grep"]["count"] == 1
+        assert outputs["tool_trace_file"] == str(trace_file)
+
+
+def step_finish(tokens: int, cost: float) -> dict:
+    return {
+        "type": "step_finish",
+        "part": {
+            "type": "step-finish",
+            "cost": cost,
+            "tokens": {
+                "input": tokens,
+                "output": 0,
+                "reasoning": 0,
+                "cache": {"read": 0, "write": 0},
+            },
+        },
+    }
+
+
+# Stands in for `opencode run`: reports a step of 100 tokens every 50ms
+FAKE_OPENCODE = f"""
+import json, time
+while True:
+    print(json.dumps({step_finish(100, 0.01)!r}), flush=True)
+    time.sleep(0.05)
+"""
+
+
+class TestBudgetGovernor:
+    def test_accumulates_usage(self):
+        budget = BudgetGovernor()
+        part = step_finish(0, 0.5)["part"]
+        part["tokens"] = {
+            "input": 100,
+            "output": 20,
+            "reasoning": 5,
+            "cache": {"read": 1000, "write": 10},
+        }
+        budget.record_step(part, io.StringIO())
+        budget.record_step(step_finish(50, 0.25)["part"], io.StringIO())
+        usage = budget.usage()
+        assert usage["steps"] == 2
+        assert usage["tokens"]["input"] == 150
+        assert usage["tokens"]["cache_read"] == 1000
+        assert usage["tokens"]["total"] == 1185
+        assert usage["cost"] == 0.75
+        assert usage["budget_status"] == "ok"
+
+    def test_soft_limit_warns_once(self):
+        budget = BudgetGovernor(soft_tokens=100)
+        output = io.StringIO()
+        for _ in range(3):
+            budget.record_step(step_finish(60, 0)["part"], output)
+        assert budget.status == "soft"
+        assert output.getvalue().count("::warning::") == 1
+
+    def test_hard_cost_limit_stops(self):
+        stops = []
+        budget = BudgetGovernor(soft_cost=1.0, hard_cost=2.0)
+        budget.stop = lambda: stops.append(True)
+        output = io.StringIO()
+        for _ in range(4):
+            budget.record_step(step_finish(0, 0.75)["part"], output)
+        assert budget.status == "hard"
+        assert stops == [True]
+        assert "::error::Budget exceeded ($2.2500, limit $2.00)" in output.getvalue()
+
+    def test_process_stream_reads_step_finish(self):
+        stream = io.StringIO(json.dumps(step_finish(10, 0.1)) + "\n")
+        budget = BudgetGovernor()
+        output = io.StringIO()
+        process_stream(stream, output, budget=budget)
+        assert budget.steps == 1
+        assert output.getvalue() == ""
+
+
+class TestParseLimit:
+    def test_empty(self):
+        assert parse_limit("X", "") is None
+        assert parse_limit("X", None) is None
+
+    def test_zero_disables(self):
+        assert parse_limit("X", "0") is None
+
+    def test_values(self):
+        assert parse_limit("X", "5000") == 5000
+        assert parse_limit("X", "1.5", float) == 1.5
+
+    def test_invalid(self, capsys):
+        assert parse_limit("BUDGET_TOKENS_HARD", "lots") is None
+        assert "Invalid BUDGET_TOKENS_HARD" in capsys.readouterr().err
+
+
+class TestLoadBudget:
+    BUDGET_VARS = (
+        "BUDGET_TOKENS_SOFT",
+        "BUDGET_TOKENS_HARD",
+        "BUDGET_COST_SOFT",
+        "BUDGET_COST_HARD",
+        "GITHUB_OUTPUT",
+        "GITHUB_STEP_SUMMARY",
+    )
+
+    def clear(self, monkeypatch):
+        for name in self.BUDGET_VARS:
+            monkeypatch.delenv(name, raising=False)
+
+    def test_nothing_to_do(self, monkeypatch):
+        """Test step_finish parsing is skipped without limits or outputs."""
+        self.clear(monkeypatch)
+        assert load_budget() is None
+
+    def test_limits(self, monkeypatch):
+        self.clear(monkeypatch)
+        monkeypatch.setenv("BUDGET_COST_HARD", "2.5")
+        budget = load_budget()
+        assert budget.hard_cost == 2.5
+        assert budget.limited
+
+    def test_usage_outputs(self, monkeypatch, tmp_path):
+        self.clear(monkeypatch)
+        monkeypatch.setenv("GITHUB_STEP_SUMMARY", str(tmp_path / "summary"))
+        budget = load_budget()
+        assert budget is not None
+        assert not budget.limited
+
+
+class TestWriteUsage:
+    def test_outputs(self, tmp_path, monkeypatch):
+        github_output = tmp_path / "output"
+        monkeypatch.setenv("GITHUB_OUTPUT", str(github_output))
+        monkeypatch.delenv("GITHUB_STEP_SUMMARY", raising=False)
+        budget = BudgetGovernor(soft_tokens=10)
+        budget.record_step(step_finish(20, 0.5)["part"], io.StringIO())
+
+        write_usage(budget)
+
+        outputs = dict(
+            line.split("=", 1) for line in github_output.read_text().splitlines()
+        )
+        assert outputs["tokens_total"] == "20"
+        assert outputs["cost_total"] == "0.5"
+        assert outputs["budget_status"] == "soft"
+        assert json.loads(outputs["usage"])["steps"] == 1
+
+
+class TestRunOpencodeBudget:
+    def test_hard_limit_stops_process(self, monkeypatch):
+        popen = subprocess.Popen
+
+        def fake_popen(cmd, **kwargs):
+            return popen([sys.executable, "-c", FAKE_OPENCODE], **kwargs)
+
+        monkeypatch.setattr("format_output.subprocess.Popen", fake_popen)
+        budget = BudgetGovernor(hard_tokens=300)
+        output = io.StringIO()
+
+        exit_code = run_opencode("prompt", output, budget=budget)
+
+        assert exit_code != 0
+        assert budget.status == "hard"
+        assert budget.total_tokens >= 300
+        assert "::error::Budget exceeded" in output.getvalue()
+
+
+# Stands in for a hung `opencode run`: one event, then a child that ignores
+# SIGTERM and never exits, holding the output pipe open
+HUNG_OPENCODE = """
+import json, signal, subprocess, sys, time
+print(json.dumps({"type": "text", "part": {"text": "Working"}}), flush=True)
+child = subprocess.Popen([
+    sys.executable, "-c",
+    "import signal, time; signal.signal(signal.SIGTERM, signal.SIG_IGN); "
+    "print(flush=True); time.sleep(60)",
+])
+time.sleep(60)
+"""
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestWatchdog:
+    def make(self, **kwargs):
+        watchdog = Watchdog(**kwargs)
+        watchdog.clock = FakeClock()
+        watchdog.started = watchdog.last_event = 0.0
+        return watchdog
+
+    def test_idle_timeout(self):
+        stops = []
+        watchdog = self.make(idle=10)
+        watchdog.stop = lambda: stops.append(True)
+        watchdog.clock.now = 8
+        watchdog.touch()
+        watchdog.clock.now = 15
+        assert not watchdog.check()
+        watchdog.clock.now = 18
+        assert watchdog.check()
+        assert watchdog.expired == "idle"
+        assert watchdog.check()
+        assert stops == [True]
+        assert watchdog.state()["idle_seconds"] == 10
+
+    def test_total_timeout(self):
+        watchdog = self.make(total=60, idle=30)
+        for now in range(0, 60, 10):
+            watchdog.clock.now = now
+            watchdog.touch()
+            assert not watchdog.check()
+        watchdog.clock.now = 60
+        assert watchdog.check()
+        assert watchdog.expired == "total"
+        assert watchdog.message() == "Agent reached the 1m00s time limit"
+
+    def test_disabled(self):
+        watchdog = self.make()
+        watchdog.clock.now = 1e9
+        assert not watchdog.enabled
+        assert not watchdog.check()
+
+    def test_watched_stream_touches(self):
+        watchdog = self.make(idle=10)
+        stream = WatchedStream(io.StringIO("line\n"), watchdog)
+        watchdog.clock.now = 5
+        assert stream.readline() == "line\n"
+        assert watchdog.last_event == 5
+
+
+class TestWriteRunState:
+    def test_merges_existing(self, tmp_path):
+        path = tmp_path / "state.json"
+        path.write_text(json.dumps({"branch": "agent/1"}))
+        write_run_state({"failed": True}, str(path))
+        assert json.loads(path.read_text()) == {"branch": "agent/1", "failed": True}
+
+    def test_creates_file(self, tmp_path):
+        path = tmp_path / "state.json"
+        write_run_state({"failed": True}, str(path))
+        assert json.loads(path.read_text()) == {"failed": True}
+
+
+class TestRunOpencodeWatchdog:
+    def test_idle_timeout_stops_process_group(self, tmp_path, monkeypatch):
+        popen = subprocess.Popen
+
+        def fake_popen(cmd, **kwargs):
+            return popen([sys.executable, "-c", HUNG_OPENCODE], **kwargs)
+
+        monkeypatch.setattr("format_output.subprocess.Popen", fake_popen)
+        monkeypatch.setattr("format_output.STOP_GRACE_SECONDS", 0.5)
+        monkeypatch.chdir(tmp_path)
+        watchdog = Watchdog(idle=1.0, poll=0.1)
+        output = io.StringIO()
+
+        exit_code = run_opencode("prompt", output, watchdog=watchdog)
+
+        assert exit_code == TIMEOUT_EXIT_CODE
+        assert "Working" in output.getvalue()
+        assert "::error::Agent produced no output for 1.0s" in output.getvalue()
+        state = json.loads((tmp_path / ".dobbyphus-state.json").read_text())
+        assert state["failed"] is True
+        assert state["timeout"]["reason"] == "idle"
+        # Returning at all means the output pipe reached EOF, so the child that
+        # ignored SIGTERM was killed along with the rest of the group
+
+
+class TestTranscript:
+    def test_records_raw_lines(self, tmp_path):
+        path = str(tmp_path / "transcript.jsonl.gz")
+        recorder = TranscriptRecorder(path)
+        stream = io.StringIO(
+            '{"type":"step_start","part":{}}\n'
+            "not json\n"
+            '{"type":"text","part":{"text":"Hi"}}\n'
+        )
+        process_stream(stream, io.StringIO(), recorder=recorder)
+        recorder.close()
+
+        with gzip.open(path, "rt") as f:
+            entries = [json.loads(line) for line in f]
+        assert entries[0]["version"] == 1
+        assert [entry["line"] for entry in entries[1:]] == [
+            '{"type":"step_start","part":{}}',
+            "not json",
+            '{"type":"text","part":{"text":"Hi"}}',
+        ]
+        offsets = [entry["t"] for entry in entries[1:]]
+        assert offsets == sorted(offsets)
+
+    def test_cut_lines_recorded(self, tmp_path):
+        path = str(tmp_path / "transcript.jsonl.gz")
+        recorder = TranscriptRecorder(path)
+        process_stream(
+            io.StringIO("x" * 50 + "\n"),
+            io.StringIO(),
+            max_line_chars=20,
+            recorder=recorder,
+        )
+        recorder.close()
+        with gzip.open(path, "rt") as f:
+            entry = [json.loads(line) for line in f][1]
+        assert entry == {"t": entry["t"], "line": "x" * 20, "cut": 30}
+
+    def test_queue_bound_drops_lines(self, tmp_path):
+        path = str(tmp_path / "transcript.jsonl.gz")
+        recorder = TranscriptRecorder(path, max_pending=10)
+        recorder.record("x" * 11)
+        recorder.close()
+        assert recorder.lost == 1
+        assert list(read_transcript(path)) == []
+
+    def test_replay_round_trip(self, tmp_path, capsys):
+        path = str(tmp_path / "transcript.jsonl.gz")
+        recorder = TranscriptRecorder(path)
+        tool_use = (
+            '{"type":"tool_use","part":{"tool":"bash","state":'
+            '{"input":{"command":"ls"},"output":"a.py"}}}'
+        )
+        for line in (tool_use, '{"type":"text","part":{"text":"Done"}}'):
+            recorder.record(line)
+        recorder.close()
+
+        output = io.StringIO()
+        lines, seconds = replay_transcript(path, output)
+
+        assert lines == 2
+        assert seconds >= 0
+        assert output.getvalue() == (
+            "::group::🔨 Bash: ls\n$ ls\na.py\n::endgroup::\nDone\n"
+        )
+
+    def test_replay_cut_lines_like_live_run(self, tmp_path):
+        """Test lines cut live take the same skip and partial paths on replay."""
+        path = str(tmp_path / "transcript.jsonl.gz")
+        recorder = TranscriptRecorder(path)
+        stream = io.StringIO(
+            tool_use_line("bash", {"command": "make"}, "x" * 1000)
+            + "\n"
+            + json.dumps({"type": "text", "part": {"text": "y" * 1000}})
+            + "\n"
+            + json.dumps({"type": "text", "part": {"text": "Done"}})
+            + "\n"
+        )
+        live = io.StringIO()
+        process_stream(stream, live, max_line_chars=200, recorder=recorder)
+        recorder.close()
+
+        replayed = io.StringIO()
+        process_stream(
+            TranscriptStream(read_transcript(path)), replayed, max_line_chars=200
+        )
+
+        assert "Skipped a text line of 1" in live.getvalue()
+        assert "(output cut)" in live.getvalue()
+        assert replayed.getvalue() == live.getvalue()
+
+
+class TestTranscriptStream:
+    def test_real_time_pacing(self):
+        sleeps = []
+        clock = FakeClock()
+        stream = TranscriptStream(iter([(0.0, "a", 0), (2.0, "b", 0)]), speed=2.0)
+        stream.clock = clock
+        stream.sleep = sleeps.append
+        lines = stream.read_lines()
+        assert next(lines) == ("a\n", 0)
+        clock.now = 0.25
+        assert next(lines) == ("b\n", 0)
+        assert sleeps == [0.75]
+        assert next(lines, None) is None
+
+    def test_as_fast_as_possible(self):
+        stream = TranscriptStream(iter([(0.0, "a", 0), (100.0, "b", 0)]))
+        stream.sleep = lambda delay: pytest.fail("slept")
+        assert list(stream.read_lines()) == [("a\n", 0), ("b\n", 0)]
+        assert stream.lines == 2
+
+    def test_cut_passed_through(self):
+        stream = TranscriptStream(iter([(0.0, "abcd", 30)]))
+        assert list(stream.read_lines()) == [("abcd", 30)]
+
+    def test_max_chars(self):
+        stream = TranscriptStream(iter([(0.0, "abcdef", 0), (0.0, "abcdef", 3)]))
+        assert list(stream.read_lines(4)) == [("abcd", 2), ("abcd", 5)]
+
+
+def bash_event(call_id: str, lines: int) -> dict:
+    return {
+        "type": "tool_use",
+        "part": {
+            "callID": call_id,
+            "tool": "bash",
+            "state": {
+                "input": {"command": "make"},
+                "output": "\n".join(f"out {n}" for n in range(lines)),
+            },
+        },
+    }
+
+
+class TestLogGovernor:
+    def run(self, events, governor):
+        stream = io.StringIO("".join(json.dumps(event) + "\n" for event in events))
+        output = io.StringIO()
+        process_stream(stream, output, governor=governor)
+        governor.write_index()
+        return output.getvalue()
+
+    def test_short_output_stays_in_log(self, tmp_path):
+        governor = LogGovernor(str(tmp_path / "out"))
+        result = self.run([bash_event("c1", 3)], governor)
+        assert "out 2" in result
+        assert "Full output" not in result
+        assert not (tmp_path / "out").exists()
+
+    def test_long_output_spilled(self, tmp_path):
+        governor = LogGovernor(str(tmp_path / "out"))
+        result = self.run([bash_event("call/1", 80)], governor)
+
+        assert "out 49" in result
+        assert "out 50" not in result
+        path = tmp_path / "out" / "0001-bash-call_1.txt"
+        assert f"Full output (80 lines): {path}\n::endgroup::" in result
+        assert path.read_text().endswith("out 79")
+        index = json.loads((tmp_path / "out" / "index.json").read_text())
+        assert index["calls"] == [
+            {
+                "call_id": "call/1",
+                "tool": "bash",
+                "summary": "make",
+                "file": "0001-bash-call_1.txt",
+                "bytes": path.stat().st_size,
+            }
+        ]
+
+    def test_large_output_spilled_whole(self, tmp_path):
+        """Test output over PARTIAL_PARSE_CHARS reaches the file in full."""
+        governor = LogGovernor(str(tmp_path / "out"), max_bytes=None)
+        event = bash_event("c1", 20_000)
+        assert len(json.dumps(event)) > PARTIAL_PARSE_CHARS
+        result = self.run([event], governor)
+
+        path = tmp_path / "out" / "0001-bash-c1.txt"
+        assert path.read_text() == event["part"]["state"]["output"]
+        assert f"Full output (20000 lines): {path}" in result
+        assert "out 49\n" in result
+        assert "out 19999" not in result
+
+    def test_single_long_line_cut_in_log(self, tmp_path):
+        governor = LogGovernor(str(tmp_path / "out"), max_bytes=None)
+        event = bash_event("c1", 1)
+        event["part"]["state"]["output"] = "x" * (PARTIAL_PARSE_CHARS * 2)
+        result = self.run([event], governor)
+
+        assert len(result) < PARTIAL_PARSE_CHARS * 2
+        assert "... (output cut)" in result
+        spilled = (tmp_path / "out" / "0001-bash-c1.txt").read_text()
+        assert spilled == "x" * (PARTIAL_PARSE_CHARS * 2)
+
+    def test_suppressed_tool_line_not_decoded(self, tmp_path, monkeypatch):
+        """Test long read lines stay on the head-parse path when spilling."""
+        decoded = []
+        loads = json.loads
+        monkeypatch.setattr(
+            "format_output.json.loads",
+            lambda text, **kwargs: decoded.append(len(text)) or loads(text, **kwargs),
+        )
+        governor = LogGovernor(str(tmp_path / "out"), max_bytes=None)
+        event = bash_event("c1", 50_000)
+        event["part"]["tool"] = "read"
+        event["part"]["state"]["input"] = {"filePath": "big.txt"}
+        assert len(json.dumps(event)) > PARTIAL_PARSE_CHARS
+        result = self.run([event], governor)
+
+        assert "Read: big.txt" in result
+        assert decoded == []
+        assert governor.index == []
+
+    def test_cut_line_spill_marked_partial(self, tmp_path):
+        governor = LogGovernor(str(tmp_path / "out"), max_bytes=None)
+        stream = io.StringIO(json.dumps(bash_event("c1", 20_000)) + "\n")
+        result = io.StringIO()
+        process_stream(stream, result, max_line_chars=100_000, governor=governor)
+
+        assert "Partial output (" in result.getvalue()
+        spilled = (tmp_path / "out" / "0001-bash-c1.txt").read_text()
+        assert len(spilled) > PARTIAL_PARSE_CHARS
+        assert spilled.endswith("... (output cut)")
+
+    def test_budget_moves_output_out_of_log(self, tmp_path):
+        governor = LogGovernor(str(tmp_path / "out"), max_bytes=200)
+        result = self.run([bash_event("c1", 5), bash_event("c2", 40)], governor)
+
+        assert "out 4" in result
+        assert "out 39" not in result
+        assert result.count("::warning::Log budget of 200 bytes reached") == 1
+        assert "$ make\nFull output (40 lines):" in result
+        assert (tmp_path / "out" / "0001-bash-c2.txt").exists()
+
+    def test_budget_without_directory(self):
+        governor = LogGovernor(None, max_bytes=10)
+        result = self.run([bash_event("c1", 40)], governor)
+        assert "out 0" not in result
+        assert "(output omitted: log budget reached)" in result
+
+    def test_suppressed_output_not_spilled(self, tmp_path):
+        governor = LogGovernor(str(tmp_path / "out"), max_bytes=10)
+        event = bash_event("c1", 100)
+        event["part"]["tool"] = "read"
+        self.run([event], governor)
+        assert governor.index == []
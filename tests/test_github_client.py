@@ -0,0 +1,285 @@
+"""Tests for github_client.py"""
+
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import ClassVar
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+
+from github_client import (
+    MAX_RETRIES,
+    GitHubClient,
+    GitHubError,
+    RateLimiter,
+    get_proxy,
+    graphql_url,
+    select_path,
+    use_gh_cli,
+)
+
+
+class FakeGitHub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = 0
+    requests: ClassVar[list[dict]] = []
+    responses: ClassVar[dict[str, tuple[int, dict]]] = {}
+    # Responses served before the ones in `responses`, with extra headers
+    queued: ClassVar[list[tuple[int, dict, dict]]] = []
+
+    def setup(self):
+        super().setup()
+        type(self).connections += 1
+
+    def log_message(self, *args):
+        pass
+
+    def handle_any(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        type(self).requests.append(
+            {
+                "method": self.command,
+                "path": self.path,
+                "auth": self.headers.get("Authorization"),
+                "proxy_auth": self.headers.get("Proxy-Authorization"),
+                "body": json.loads(body) if body else None,
+            }
+        )
+        extra_headers: dict = {}
+        if type(self).queued:
+            status, payload, extra_headers = type(self).queued.pop(0)
+        else:
+            status, payload = type(self).responses.get(self.path, (200, {"ok": True}))
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in extra_headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PATCH = handle_any
+
+
+PROXY_VARS = ("HTTPS_PROXY", "HTTP_PROXY", "NO_PROXY", "ALL_PROXY")
+
+
+@pytest.fixture(autouse=True)
+def no_proxy_env(monkeypatch):
+    for name in PROXY_VARS:
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.lower(), raising=False)
+
+
+@pytest.fixture
+def server():
+    FakeGitHub.connections = 0
+    FakeGitHub.requests = []
+    FakeGitHub.responses = {}
+    FakeGitHub.queued = []
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeGitHub)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{httpd.server_address[1]}"
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestGitHubClient:
+    def test_reuses_connection(self, server):
+        client = GitHubClient("token", server)
+        for _ in range(5):
+            assert client.rest("repos/owner/repo").ok
+        assert FakeGitHub.connections == 1
+        assert FakeGitHub.requests[0]["auth"] == "Bearer token"
+        assert FakeGitHub.requests[0]["path"] == "/repos/owner/repo"
+
+    def test_sends_json_body(self, server):
+        client = GitHubClient("token", server)
+        client.rest("repos/owner/repo/git/blobs", method="POST", data={"a": 1})
+        assert FakeGitHub.requests[0]["method"] == "POST"
+        assert FakeGitHub.requests[0]["body"] == {"a": 1}
+
+    def test_error_status_returned(self, server):
+        FakeGitHub.responses["/missing"] = (404, {"message": "Not Found"})
+        response = GitHubClient("token", server).rest("missing")
+        assert response.status == 404
+        assert not response.ok
+        assert response.json() == {"message": "Not Found"}
+
+    def test_graphql_returns_payload_with_errors(self, server):
+        FakeGitHub.responses["/graphql"] = (
+            200,
+            {"data": None, "errors": [{"message": "bad"}]},
+        )
+        payload = GitHubClient("token", server).graphql("query { x }", {"a": "b"})
+        assert payload["errors"] == [{"message": "bad"}]
+        assert FakeGitHub.requests[0]["body"] == {
+            "query": "query { x }",
+            "variables": {"a": "b"},
+        }
+
+    def test_graphql_http_failure_raises(self, server):
+        FakeGitHub.responses["/graphql"] = (401, {"message": "Bad credentials"})
+        with pytest.raises(GitHubError, match="Bad credentials"):
+            GitHubClient("token", server).graphql("query { x }", {})
+
+    def test_connection_refused_raises(self):
+        client = GitHubClient("token", "http://127.0.0.1:1", timeout=1)
+        with pytest.raises(GitHubError):
+            client.rest("repos/owner/repo")
+
+
+class TestProxy:
+    def test_http_request_sent_through_proxy(self, server, monkeypatch):
+        monkeypatch.setenv(
+            "HTTP_PROXY", server.replace("127.0.0.1", "user:pw@127.0.0.1")
+        )
+        client = GitHubClient("token", "http://api.example.invalid")
+        assert client.rest("repos/owner/repo").ok
+        assert FakeGitHub.requests[0]["path"] == (
+            "http://api.example.invalid/repos/owner/repo"
+        )
+        assert FakeGitHub.requests[0]["proxy_auth"] == "Basic dXNlcjpwdw=="
+
+    def test_https_tunnels_through_proxy(self, monkeypatch):
+        monkeypatch.setenv("HTTPS_PROXY", "proxy.internal:3128")
+        client = GitHubClient("token")
+        conn = client._connection("https", "api.github.com")
+        assert (conn.host, conn.port) == ("proxy.internal", 3128)
+        assert conn._tunnel_host == "api.github.com"
+
+    def test_no_proxy(self, monkeypatch):
+        monkeypatch.setenv("HTTPS_PROXY", "http://proxy.internal:3128")
+        monkeypatch.setenv("NO_PROXY", "github.com")
+        assert get_proxy("https", "api.github.com") is None
+        assert get_proxy("https", "ghe.example.com").hostname == "proxy.internal"
+
+    def test_no_proxy_configured(self):
+        assert get_proxy("https", "api.github.com") is None
+
+
+class TestRateLimitRetries:
+    def test_retries_after_secondary_limit(self, server):
+        FakeGitHub.queued = [
+            (403, {"message": "You have exceeded a secondary rate limit"}, {}),
+            (429, {"message": "Too many requests"}, {"Retry-After": "2"}),
+        ]
+        client = GitHubClient("token", server)
+        sleeps = []
+        client.limiter.sleep = sleeps.append
+
+        response = client.rest("repos/owner/repo")
+
+        assert response.ok
+        assert len(FakeGitHub.requests) == 3
+        assert len(sleeps) == 2
+        assert 1.9 < sleeps[1] <= 2
+
+    def test_gives_up_after_max_retries(self, server):
+        FakeGitHub.responses["/busy"] = (429, {"message": "slow down"})
+        client = GitHubClient("token", server)
+        client.limiter.sleep = lambda delay: None
+
+        response = client.rest("busy")
+
+        assert response.status == 429
+        assert len(FakeGitHub.requests) == MAX_RETRIES + 1
+
+    def test_plain_forbidden_not_retried(self, server):
+        FakeGitHub.responses["/private"] = (403, {"message": "Resource not accessible"})
+        client = GitHubClient("token", server)
+        assert client.rest("private").status == 403
+        assert len(FakeGitHub.requests) == 1
+
+
+class TestRateLimiter:
+    def test_records_budget(self):
+        limiter = RateLimiter()
+        limiter.record(200, {"x-ratelimit-remaining": "120", "x-ratelimit-reset": "99"})
+        assert limiter.remaining == 120
+        assert limiter.reset_at == 99
+
+    def test_concurrency_follows_quota(self):
+        limiter = RateLimiter()
+        assert limiter.concurrency(8) == 8
+        limiter.record(200, {"x-ratelimit-remaining": "120"})
+        assert limiter.concurrency(8) == 2
+        limiter.record(200, {"x-ratelimit-remaining": "3"})
+        assert limiter.concurrency(8) == 1
+
+    def test_secondary_limit_halves_concurrency(self):
+        limiter = RateLimiter(max_in_flight=8)
+        limiter.record(403, {}, "You have exceeded a secondary rate limit")
+        assert limiter.concurrency(8) == 4
+        limiter.record(200, {})
+        assert limiter.concurrency(8) == 5
+
+    def test_primary_limit_waits_for_reset(self):
+        limiter = RateLimiter()
+        limiter.clock = lambda: 1000.0
+        limiter.record(403, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "1010"})
+        delay = limiter.retry_delay(403, {"x-ratelimit-remaining": "0"}, "", 0)
+        assert delay == 11
+
+    def test_long_reset_not_retried(self):
+        limiter = RateLimiter()
+        limiter.clock = lambda: 1000.0
+        limiter.record(403, {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "9999"})
+        assert limiter.retry_delay(403, {"x-ratelimit-remaining": "0"}, "", 0) is None
+
+    def test_backoff_has_jitter_bound(self):
+        limiter = RateLimiter()
+        for attempt in range(3):
+            delay = limiter.retry_delay(429, {}, "", attempt)
+            assert 0 <= delay <= 2**attempt
+
+    def test_success_not_retried(self):
+        assert RateLimiter().retry_delay(200, {}, "", 0) is None
+
+
+class TestGraphqlUrl:
+    def test_github_com(self):
+        assert graphql_url("https://api.github.com") == "https://api.github.com/graphql"
+
+    def test_enterprise_server(self):
+        assert (
+            graphql_url("https://ghe.example.com/api/v3/")
+            == "https://ghe.example.com/api/graphql"
+        )
+
+
+class TestSelectPath:
+    def test_string_is_raw(self):
+        assert select_path({"a": {"b": "main"}}, ".a.b") == "main"
+
+    def test_bool(self):
+        data = {"commit": {"verification": {"verified": True}}}
+        assert select_path(data, ".commit.verification.verified") == "true"
+
+    def test_missing_is_null(self):
+        assert select_path({"message": "Not Found"}, ".object.sha") == "null"
+
+
+class TestUseGhCli:
+    def test_auto_with_token(self, monkeypatch):
+        monkeypatch.delenv("GITHUB_API_TRANSPORT", raising=False)
+        monkeypatch.setenv("GH_TOKEN", "token")
+        assert use_gh_cli() is False
+
+    def test_auto_without_token(self, monkeypatch):
+        monkeypatch.delenv("GITHUB_API_TRANSPORT", raising=False)
+        monkeypatch.delenv("GH_TOKEN", raising=False)
+        monkeypatch.delenv("GITHUB_TOKEN", raising=False)
+        assert use_gh_cli() is True
+
+    def test_forced_gh(self, monkeypatch):
+        monkeypatch.setenv("GITHUB_API_TRANSPORT", "gh")
+        monkeypatch.setenv("GH_TOKEN", "token")
+        assert use_gh_cli() is True
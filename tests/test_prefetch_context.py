@@ -0,0 +1,163 @@
+"""Tests for prefetch_context.py"""
+
+import json
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
+
+from fetch_threads import fetch_unresolved_threads
+from prefetch_context import build_query, load_context, prefetch_context
+
+THREAD = {
+    "id": "thread1",
+    "isResolved": False,
+    "path": "src/main.py",
+    "line": 3,
+    "startLine": None,
+    "viewerCanResolve": True,
+    "comments": {
+        "totalCount": 1,
+        "pageInfo": {"hasNextPage": False, "endCursor": "1"},
+        "nodes": [
+            {
+                "id": "c1",
+                "databaseId": 1,
+                "author": {"login": "reviewer"},
+                "body": "Rename this",
+                "createdAt": "2025-01-01T00:00:00Z",
+            }
+        ],
+    },
+}
+
+REVIEW_THREADS = {
+    "totalCount": 1,
+    "pageInfo": {"hasNextPage": False, "endCursor": "1"},
+    "nodes": [THREAD],
+}
+
+PR_RESPONSE = {
+    "data": {
+        "repository": {
+            "defaultBranchRef": {"name": "main"},
+            "item": {
+                "__typename": "PullRequest",
+                "title": "Add feature",
+                "author": {"login": "octocat"},
+                "labels": {"nodes": [{"name": "bug"}]},
+                "headRefName": "feature",
+                "headRefOid": "h" * 40,
+                "baseRefName": "main",
+                "baseRefOid": "b" * 40,
+                "reviewThreads": REVIEW_THREADS,
+            },
+        },
+        "opencode": {"latestRelease": {"tagName": "v1.2.3"}},
+    }
+}
+
+
+class TestBuildQuery:
+    """Tests for build_query function."""
+
+    def test_full_threads(self):
+        query = build_query(thread_index=False)
+        assert "fragment ThreadPage" in query
+        assert "fragment CommentPage" in query
+
+    def test_thread_index(self):
+        query = build_query(thread_index=True)
+        assert "fragment ThreadPage" in query
+        # Unused fragments are a GraphQL validation error
+        assert "fragment CommentPage" not in query
+
+
+class TestPrefetchContext:
+    """Tests for prefetch_context function."""
+
+    def test_pull_request(self, monkeypatch):
+        calls = []
+
+        def mock_run_graphql(query, variables):
+            calls.append(variables)
+            return PR_RESPONSE
+
+        monkeypatch.setattr("prefetch_context.run_graphql", mock_run_graphql)
+
+        context = prefetch_context("owner", "repo", 7, releases=(True, False))
+
+        assert len(calls) == 1
+        assert calls[0]["hasNumber"] is True
+        assert calls[0]["opencode"] is True
+        assert calls[0]["ohMyOpencode"] is False
+        assert context["repository"] == "owner/repo"
+        assert context["default_branch"] == "main"
+        assert context["type"] == "PullRequest"
+        assert context["title"] == "Add feature"
+        assert context["author"] == "octocat"
+        assert context["labels"] == ["bug"]
+        assert context["head_sha"] == "h" * 40
+        assert context["base_ref"] == "main"
+        assert context["thread_fields"] == "full"
+        assert context["review_threads"] == REVIEW_THREADS
+        assert context["versions"] == {"opencode": "v1.2.3", "oh_my_opencode": None}
+
+    def test_without_number(self, monkeypatch):
+        def mock_run_graphql(query, variables):
+            assert variables["hasNumber"] is False
+            return {"data": {"repository": {"defaultBranchRef": {"name": "main"}}}}
+
+        monkeypatch.setattr("prefetch_context.run_graphql", mock_run_graphql)
+
+        context = prefetch_context("owner", "repo", None)
+
+        assert context["default_branch"] == "main"
+        assert "title" not in context
+
+    def test_failure_returns_none(self, monkeypatch):
+        monkeypatch.setattr("prefetch_context.run_graphql", lambda q, v: None)
+        assert prefetch_context("owner", "repo", 7) is None
+
+
+class TestLoadContext:
+    """Tests for load_context function."""
+
+    def write(self, tmp_path, monkeypatch, context) -> None:
+        path = tmp_path / "context.json"
+        path.write_text(json.dumps(context))
+        monkeypatch.setenv("DOBBYPHUS_CONTEXT_FILE", str(path))
+
+    def test_no_file(self, monkeypatch):
+        monkeypatch.delenv("DOBBYPHUS_CONTEXT_FILE", raising=False)
+        assert load_context() == {}
+
+    def test_matching(self, tmp_path, monkeypatch):
+        self.write(tmp_path, monkeypatch, {"repository": "owner/repo", "number": 7})
+        assert load_context("owner/repo", "7")["number"] == 7
+
+    def test_other_issue_ignored(self, tmp_path, monkeypatch):
+        self.write(tmp_path, monkeypatch, {"repository": "owner/repo", "number": 7})
+        assert load_context("owner/repo", 8) == {}
+        assert load_context("other/repo") == {}
+
+    def test_corrupt_file_ignored(self, tmp_path, monkeypatch):
+        path = tmp_path / "context.json"
+        path.write_text("{")
+        monkeypatch.setenv("DOBBYPHUS_CONTEXT_FILE", str(path))
+        assert load_context() == {}
+
+
+class TestPrefetchedThreads:
+    """Tests for fetch_threads reusing the prefetched first page."""
+
+    def test_first_page_not_refetched(self, monkeypatch):
+        def fail(query, variables):
+            raise AssertionError("unexpected request")
+
+        monkeypatch.setattr("fetch_threads.run_graphql", fail)
+
+        result = fetch_unresolved_threads("owner", "repo", 7, first_page=REVIEW_THREADS)
+
+        assert [t["id"] for t in result] == ["thread1"]
+        assert result[0]["comments"][0]["body"] == "Rename this"
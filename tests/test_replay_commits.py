@@ -1,12 +1,63 @@
 #!/usr/bin/env python3
 
+import base64
+import hashlib
+import io
+import json
+import subprocess
 import sys
+import threading
+import time
+from contextlib import nullcontext
 from pathlib import Path
 from unittest.mock import patch
 
+import pytest
+
 sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
 
-from replay_commits import body_has_issue_reference, is_commit_signed
+from replay_commits import (
+    BLOB_CHUNK_SIZE,
+    DEFAULT_REPLAY_MODE,
+    DEFAULT_UPLOAD_WORKERS,
+    GRAPHQL_MAX_FILES,
+    GRAPHQL_MAX_PAYLOAD_BYTES,
+    RETRY_EXIT_CODE,
+    Config,
+    FileChange,
+    ReplayJournal,
+    ReplayState,
+    blob_json_length,
+    body_has_issue_reference,
+    create_blob_from_object,
+    create_commit_graphql,
+    create_tree_from_changes,
+    filter_new_commits,
+    fits_graphql_commit,
+    get_commit_body,
+    get_commit_changes,
+    get_commit_info,
+    get_commit_message,
+    get_commit_subject,
+    get_default_branch,
+    get_issue_title,
+    get_signed_commits,
+    hash_blob,
+    http_api,
+    is_commit_signed,
+    iter_blob_json,
+    load_commit_info,
+    main,
+    parse_replay_backend,
+    parse_replay_mode,
+    parse_signing_format,
+    parse_upload_workers,
+    replay_commit_local,
+    replay_commit_objects,
+    signing_config,
+    sync_remote_ref,
+    upload_blobs,
+)
 
 
 class TestIsCommitSigned:
@@ -95,3 +146,953 @@ class TestBodyHasIssueReference:
     def test_in_middle_of_text(self):
         body = "This PR fixes #42 by updating the logic"
         assert body_has_issue_reference(body, "42") is True
+
+
+def write_files(directory: Path, contents: dict[str, str]) -> list[str]:
+    paths = []
+    for name, content in contents.items():
+        path = directory / name
+        path.write_text(content)
+        paths.append(str(path))
+    return paths
+
+
+class TestHashBlob:
+    def test_matches_git_hash_object(self, tmp_path):
+        path = tmp_path / "file.txt"
+        path.write_bytes(b"hello\nworld\n\x00binary")
+        expected = subprocess.run(
+            ["git", "hash-object", str(path)],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        assert hash_blob(str(path)) == expected
+
+    def test_empty_file(self, tmp_path):
+        path = tmp_path / "empty"
+        path.write_bytes(b"")
+        assert hash_blob(str(path)) == "e69de29bb2d1d6434b8b29ae775ad8c2e48c5391"
+
+    def test_missing_file(self, tmp_path):
+        assert hash_blob(str(tmp_path / "missing")) is None
+
+
+class TestUploadBlobs:
+    @patch("replay_commits.create_blob")
+    def test_preserves_file_order(self, mock_create_blob, tmp_path):
+        files = write_files(tmp_path, {f"f{i}": f"content {i}" for i in range(5)})
+
+        def fake_create_blob(repo, file_path):
+            # Finish later files first to prove ordering is not completion order
+            time.sleep(0.01 * (5 - files.index(file_path)))
+            return hash_blob(file_path)
+
+        mock_create_blob.side_effect = fake_create_blob
+        assert upload_blobs("owner/repo", files, workers=5) == [
+            hash_blob(f) for f in files
+        ]
+
+    @patch("replay_commits.create_blob")
+    def test_deleted_files_return_none(self, mock_create_blob, tmp_path):
+        a, b = write_files(tmp_path, {"a": "a", "b": "b"})
+        mock_create_blob.side_effect = lambda repo, path: hash_blob(path)
+        gone = str(tmp_path / "gone")
+        assert upload_blobs("owner/repo", [a, gone, b], workers=3) == [
+            hash_blob(a),
+            None,
+            hash_blob(b),
+        ]
+
+    @patch("replay_commits.create_blob")
+    def test_bounded_concurrency(self, mock_create_blob, tmp_path):
+        files = write_files(tmp_path, {f"f{i}": f"content {i}" for i in range(12)})
+        lock = threading.Lock()
+        active = 0
+        peak = 0
+
+        def fake_create_blob(repo, file_path):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.01)
+            with lock:
+                active -= 1
+            return hash_blob(file_path)
+
+        mock_create_blob.side_effect = fake_create_blob
+        upload_blobs("owner/repo", files, workers=3)
+        assert 1 < peak <= 3
+
+    @patch("replay_commits.create_blob")
+    def test_single_worker_is_sequential(self, mock_create_blob, tmp_path):
+        files = write_files(tmp_path, {"a": "a", "b": "b"})
+        mock_create_blob.side_effect = lambda repo, path: hash_blob(path)
+        upload_blobs("owner/repo", files, workers=1)
+        assert mock_create_blob.call_count == 2
+
+    @patch("replay_commits.create_blob")
+    def test_skips_known_blobs(self, mock_create_blob, tmp_path):
+        old, new = write_files(tmp_path, {"renamed": "old", "new": "new"})
+        mock_create_blob.side_effect = lambda repo, path: hash_blob(path)
+        known = {hash_blob(old)}
+
+        result = upload_blobs("owner/repo", [old, new], known_blobs=known)
+
+        assert result == [hash_blob(old), hash_blob(new)]
+        mock_create_blob.assert_called_once_with("owner/repo", new)
+        assert known == {hash_blob(old), hash_blob(new)}
+
+    @patch("replay_commits.create_blob")
+    def test_duplicate_content_uploaded_once(self, mock_create_blob, tmp_path):
+        files = write_files(tmp_path, {"a": "same", "b": "same"})
+        mock_create_blob.side_effect = lambda repo, path: hash_blob(path)
+
+        result = upload_blobs("owner/repo", files, workers=4)
+
+        assert result[0] == result[1] == hash_blob(files[0])
+        assert mock_create_blob.call_count == 1
+
+    @patch("replay_commits.create_blob")
+    def test_known_blobs_shared_across_commits(self, mock_create_blob, tmp_path):
+        (path,) = write_files(tmp_path, {"reverted": "v1"})
+        mock_create_blob.side_effect = lambda repo, p: hash_blob(p)
+        known: set[str] = set()
+
+        upload_blobs("owner/repo", [path], known_blobs=known)
+        upload_blobs("owner/repo", [path], known_blobs=known)
+
+        assert mock_create_blob.call_count == 1
+
+
+class TestParseUploadWorkers:
+    def test_default_when_unset(self):
+        assert parse_upload_workers(None) == DEFAULT_UPLOAD_WORKERS
+        assert parse_upload_workers("  ") == DEFAULT_UPLOAD_WORKERS
+
+    def test_valid_value(self):
+        assert parse_upload_workers("16") == 16
+
+    def test_minimum_is_one(self):
+        assert parse_upload_workers("0") == 1
+
+    def test_invalid_value(self):
+        assert parse_upload_workers("many") == DEFAULT_UPLOAD_WORKERS
+
+
+def git_in(repo: Path, *args: str) -> str:
+    return subprocess.run(
+        ["git", *args], cwd=repo, capture_output=True, text=True, check=True
+    ).stdout.strip()
+
+
+@pytest.fixture
+def git_repo(tmp_path, monkeypatch):
+    git_in(tmp_path, "init", "-q")
+    git_in(tmp_path, "config", "user.name", "test")
+    git_in(tmp_path, "config", "user.email", "test@example.com")
+    (tmp_path / "keep.txt").write_text("keep")
+    (tmp_path / "remove.txt").write_text("remove")
+    (tmp_path / "edit.txt").write_text("v1")
+    git_in(tmp_path, "add", ".")
+    git_in(tmp_path, "commit", "-q", "-m", "initial")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+class TestGetCommitChanges:
+    def test_reads_changes_from_object_database(self, git_repo):
+        (git_repo / "edit.txt").write_text("v2")
+        (git_repo / "remove.txt").unlink()
+        (git_repo / "new dir").mkdir()
+        (git_repo / "new dir" / "script.sh").write_text("#!/bin/sh\n")
+        (git_repo / "new dir" / "script.sh").chmod(0o755)
+        git_in(git_repo, "add", "-A")
+        git_in(git_repo, "commit", "-q", "-m", "change")
+        sha = git_in(git_repo, "rev-parse", "HEAD")
+
+        # The working tree no longer matters once the commit exists
+        git_in(git_repo, "reset", "-q", "--hard", "HEAD^")
+
+        changes = {c.path: c for c in get_commit_changes(sha)}
+        assert set(changes) == {"edit.txt", "remove.txt", "new dir/script.sh"}
+        assert changes["edit.txt"].sha == git_in(
+            git_repo, "rev-parse", f"{sha}:edit.txt"
+        )
+        assert changes["remove.txt"].sha is None
+        assert changes["new dir/script.sh"].mode == "100755"
+
+    def test_empty_commit(self, git_repo):
+        git_in(git_repo, "commit", "-q", "--allow-empty", "-m", "empty")
+        assert get_commit_changes(git_in(git_repo, "rev-parse", "HEAD")) == []
+
+
+class TestCreateTreeFromChanges:
+    @patch("replay_commits.gh_api")
+    @patch("replay_commits.create_blob_from_object")
+    def test_uploads_only_unknown_blobs(self, mock_upload, mock_gh_api):
+        mock_upload.side_effect = lambda repo, sha: sha
+        mock_gh_api.return_value = '{"sha": "tree123"}'
+        changes = [
+            FileChange(path="moved.txt", mode="100644", sha="a" * 40),
+            FileChange(path="new.txt", mode="100644", sha="b" * 40),
+            FileChange(path="copy.txt", mode="100644", sha="b" * 40),
+            FileChange(path="gone.txt", mode="100644", sha=None),
+            FileChange(path="sub", mode="160000", sha="c" * 40),
+        ]
+        known = {"a" * 40}
+
+        tree = create_tree_from_changes("owner/repo", "base", changes, 4, known)
+
+        assert tree == "tree123"
+        mock_upload.assert_called_once_with("owner/repo", "b" * 40)
+        assert known == {"a" * 40, "b" * 40}
+        payload = mock_gh_api.call_args.kwargs["input_data"]
+        assert payload["base_tree"] == "base"
+        assert [e["path"] for e in payload["tree"]] == [c.path for c in changes]
+        assert payload["tree"][3]["sha"] is None
+        assert payload["tree"][4]["type"] == "commit"
+
+
+class TestParseReplayMode:
+    def test_default_when_unset(self):
+        assert parse_replay_mode(None) == DEFAULT_REPLAY_MODE
+
+    def test_valid_modes(self):
+        assert parse_replay_mode("worktree") == "worktree"
+        assert parse_replay_mode(" Objects ") == "objects"
+
+    def test_invalid_mode(self):
+        assert parse_replay_mode("rebase") == DEFAULT_REPLAY_MODE
+
+
+def make_config(**overrides) -> Config:
+    values = {
+        "repo": "owner/repo",
+        "start_sha": "start",
+        "start_branch": "main",
+        "current_branch": "feature",
+        "default_branch": "main",
+        "issue_number": "",
+        "issue_title": "",
+    }
+    values.update(overrides)
+    return Config(**values)
+
+
+class TestFitsGraphqlCommit:
+    @patch("replay_commits.get_blob_sizes")
+    def test_small_regular_files(self, mock_sizes):
+        mock_sizes.return_value = {"a" * 40: 100}
+        changes = [
+            FileChange(path="a.txt", mode="100644", sha="a" * 40),
+            FileChange(path="b.txt", mode="100644", sha=None),
+        ]
+        assert fits_graphql_commit(changes) is True
+
+    @patch("replay_commits.get_blob_sizes")
+    def test_executable_requires_rest(self, mock_sizes):
+        mock_sizes.return_value = {}
+        changes = [FileChange(path="run.sh", mode="100755", sha="a" * 40)]
+        assert fits_graphql_commit(changes) is False
+
+    @patch("replay_commits.get_blob_sizes")
+    def test_too_many_files(self, mock_sizes):
+        mock_sizes.return_value = {}
+        changes = [
+            FileChange(path=f"f{i}", mode="100644", sha=None)
+            for i in range(GRAPHQL_MAX_FILES + 1)
+        ]
+        assert fits_graphql_commit(changes) is False
+
+    @patch("replay_commits.get_blob_sizes")
+    def test_payload_too_large(self, mock_sizes):
+        mock_sizes.return_value = {"a" * 40: GRAPHQL_MAX_PAYLOAD_BYTES}
+        changes = [FileChange(path="big.bin", mode="100644", sha="a" * 40)]
+        assert fits_graphql_commit(changes) is False
+
+
+class TestCreateCommitGraphql:
+    @patch("replay_commits.read_blob")
+    @patch("replay_commits.graphql")
+    def test_builds_mutation_input(self, mock_graphql, mock_read_blob):
+        mock_read_blob.return_value = b"hello"
+        mock_graphql.return_value = {
+            "createCommitOnBranch": {
+                "commit": {"oid": "c" * 40, "tree": {"oid": "t" * 40}}
+            }
+        }
+        changes = [
+            FileChange(path="new.txt", mode="100644", sha="a" * 40),
+            FileChange(path="old.txt", mode="100644", sha=None),
+        ]
+
+        result = create_commit_graphql(
+            "owner/repo", "feature", "Subject\n\nBody text\n", changes, "p" * 40
+        )
+
+        assert result == ("c" * 40, "t" * 40)
+        variables = mock_graphql.call_args.args[1]["input"]
+        assert variables["branch"] == {
+            "repositoryNameWithOwner": "owner/repo",
+            "branchName": "feature",
+        }
+        assert variables["expectedHeadOid"] == "p" * 40
+        assert variables["message"] == {"headline": "Subject", "body": "Body text"}
+        assert variables["fileChanges"] == {
+            "additions": [{"path": "new.txt", "contents": "aGVsbG8="}],
+            "deletions": [{"path": "old.txt"}],
+        }
+
+
+class TestSyncRemoteRef:
+    @patch("replay_commits.update_ref")
+    @patch("replay_commits.create_ref")
+    def test_creates_missing_branch(self, mock_create, mock_update):
+        state = ReplayState("p" * 40, "t", None, set())
+        sync_remote_ref("owner/repo", "feature", state)
+        mock_create.assert_called_once_with("owner/repo", "feature", "p" * 40)
+        mock_update.assert_not_called()
+        assert state.remote_head == "p" * 40
+
+    @patch("replay_commits.update_ref")
+    @patch("replay_commits.create_ref")
+    def test_updates_existing_branch(self, mock_create, mock_update):
+        state = ReplayState("p" * 40, "t", "r" * 40, set())
+        sync_remote_ref("owner/repo", "feature", state)
+        mock_update.assert_called_once_with("owner/repo", "feature", "p" * 40)
+        mock_create.assert_not_called()
+
+    @patch("replay_commits.update_ref")
+    @patch("replay_commits.create_ref")
+    def test_noop_when_in_sync(self, mock_create, mock_update):
+        state = ReplayState("p" * 40, "t", "p" * 40, set())
+        sync_remote_ref("owner/repo", "feature", state)
+        mock_create.assert_not_called()
+        mock_update.assert_not_called()
+
+
+class TestReplayJournal:
+    def test_round_trip(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = ReplayJournal.open(path, "owner/repo", "feature")
+        journal.record_blobs({"b" * 40})
+        journal.record_commit("orig", "p" * 40, "c" * 40, "t" * 40)
+        journal.record_created_branch()
+
+        reloaded = ReplayJournal.open(path, "owner/repo", "feature")
+
+        assert reloaded.commits == {("orig", "p" * 40): ("c" * 40, "t" * 40)}
+        assert reloaded.blobs == {"b" * 40}
+        assert reloaded.created_branch is True
+
+    def test_other_branch_discarded(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = ReplayJournal.open(path, "owner/repo", "feature")
+        journal.record_commit("orig", "p" * 40, "c" * 40, "t" * 40)
+
+        reloaded = ReplayJournal.open(path, "owner/repo", "other")
+
+        assert reloaded.commits == {}
+        assert json.loads(path.read_text()) == {
+            "type": "header",
+            "repo": "owner/repo",
+            "branch": "other",
+        }
+
+    def test_truncated_line_ignored(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        journal = ReplayJournal.open(path, "owner/repo", "feature")
+        journal.record_commit("orig", "p" * 40, "c" * 40, "t" * 40)
+        with path.open("a") as f:
+            f.write('{"type": "commit", "orig')
+
+        reloaded = ReplayJournal.open(path, "owner/repo", "feature")
+
+        assert list(reloaded.commits) == [("orig", "p" * 40)]
+
+    def test_clear(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        ReplayJournal.open(path, "owner/repo", "feature").clear()
+        assert not path.exists()
+
+    def test_head_kept_from_first_attempt(self, tmp_path):
+        path = tmp_path / "journal.jsonl"
+        ReplayJournal.open(path, "owner/repo", "feature", "a" * 40)
+        reloaded = ReplayJournal.open(path, "owner/repo", "feature", "b" * 40)
+        assert reloaded.head == "a" * 40
+
+
+class TestReplayCommitObjects:
+    def setup_method(self):
+        self.changes = [FileChange(path="a.txt", mode="100644", sha="a" * 40)]
+
+    @patch("replay_commits.get_commit_subject", return_value="Subject")
+    @patch("replay_commits.get_commit_message", return_value="Subject")
+    @patch("replay_commits.sync_remote_ref")
+    @patch("replay_commits.create_commit_graphql")
+    @patch("replay_commits.fits_graphql_commit", return_value=True)
+    @patch("replay_commits.get_commit_changes")
+    def test_small_commit_uses_graphql(
+        self, mock_changes, _fits, mock_graphql, mock_sync, *_
+    ):
+        mock_changes.return_value = self.changes
+        mock_graphql.return_value = ("c" * 40, "t" * 40)
+        state = ReplayState("p" * 40, "base", "p" * 40, set())
+
+        assert replay_commit_objects(make_config(), "orig", state) is True
+
+        mock_sync.assert_called_once()
+        assert state.parent_sha == state.remote_head == "c" * 40
+        assert state.base_tree == "t" * 40
+        assert "a" * 40 in state.known_blobs
+
+    @patch("replay_commits.get_commit_subject", return_value="Subject")
+    @patch("replay_commits.get_commit_message", return_value="Subject")
+    @patch("replay_commits.create_commit", return_value="c" * 40)
+    @patch("replay_commits.create_tree_from_changes", return_value="t" * 40)
+    @patch("replay_commits.fits_graphql_commit", return_value=False)
+    @patch("replay_commits.get_commit_changes")
+    def test_large_commit_uses_rest(self, mock_changes, _fits, mock_tree, *_):
+        mock_changes.return_value = self.changes
+        state = ReplayState("p" * 40, "base", "r" * 40, set())
+
+        assert replay_commit_objects(make_config(), "orig", state) is True
+
+        assert mock_tree.call_args.args[1] == "base"
+        assert state.parent_sha == "c" * 40
+        assert state.remote_head == "r" * 40
+
+    @patch("replay_commits.get_commit_subject", return_value="Subject")
+    @patch("replay_commits.get_commit_message", return_value="Subject")
+    @patch("replay_commits.create_commit", return_value="c" * 40)
+    @patch("replay_commits.create_tree_from_changes", return_value="t" * 40)
+    @patch("replay_commits.fits_graphql_commit")
+    @patch("replay_commits.get_commit_changes")
+    def test_rest_backend_skips_graphql(self, mock_changes, mock_fits, *_):
+        mock_changes.return_value = self.changes
+        state = ReplayState("p" * 40, "base", None, set())
+
+        replay_commit_objects(make_config(replay_backend="rest"), "orig", state)
+
+        mock_fits.assert_not_called()
+
+    @patch("replay_commits.get_commit_subject", return_value="Subject")
+    @patch("replay_commits.get_commit_message", return_value="Subject")
+    @patch("replay_commits.sync_remote_ref")
+    @patch("replay_commits.create_commit_graphql")
+    @patch("replay_commits.fits_graphql_commit", return_value=True)
+    @patch("replay_commits.get_commit_changes")
+    def test_records_commit_in_journal(
+        self, mock_changes, _fits, mock_graphql, _sync, _message, _subject, tmp_path
+    ):
+        mock_changes.return_value = self.changes
+        mock_graphql.return_value = ("c" * 40, "t" * 40)
+        journal = ReplayJournal.open(tmp_path / "j.jsonl", "owner/repo", "feature")
+        state = ReplayState("p" * 40, "base", "p" * 40, set(), journal)
+
+        replay_commit_objects(make_config(), "orig", state)
+
+        reloaded = ReplayJournal.open(tmp_path / "j.jsonl", "owner/repo", "feature")
+        assert reloaded.commits == {("orig", "p" * 40): ("c" * 40, "t" * 40)}
+        assert reloaded.blobs == {"a" * 40}
+
+    @patch("replay_commits.get_commit_subject", return_value="Subject")
+    @patch("replay_commits.get_commit_message", return_value="Subject")
+    @patch("replay_commits.get_commit_changes")
+    def test_resumes_from_journal(self, mock_changes, _message, _subject, tmp_path):
+        journal = ReplayJournal.open(tmp_path / "j.jsonl", "owner/repo", "feature")
+        journal.record_commit("orig", "p" * 40, "c" * 40, "t" * 40)
+        state = ReplayState("p" * 40, "base", "r" * 40, set(), journal)
+
+        assert replay_commit_objects(make_config(), "orig", state) is True
+
+        mock_changes.assert_not_called()
+        assert state.parent_sha == "c" * 40
+        assert state.base_tree == "t" * 40
+
+    @patch("replay_commits.get_commit_subject", return_value="Subject")
+    @patch("replay_commits.get_commit_message", return_value="Subject")
+    @patch("replay_commits.get_commit_changes", return_value=[])
+    def test_empty_commit_skipped(self, *_):
+        state = ReplayState("p" * 40, "base", None, set())
+        assert replay_commit_objects(make_config(), "orig", state) is False
+        assert state.parent_sha == "p" * 40
+
+
+class TestParseReplayBackend:
+    def test_default_when_unset(self):
+        assert parse_replay_backend("") == "auto"
+
+    def test_rest(self):
+        assert parse_replay_backend("REST") == "rest"
+
+    def test_invalid_backend(self):
+        assert parse_replay_backend("soap") == "auto"
+
+
+class TestGetSignedCommits:
+    @patch("replay_commits.graphql")
+    def test_single_aliased_query(self, mock_graphql):
+        mock_graphql.return_value = {
+            "repository": {
+                "c0": {"signature": {"isValid": True}},
+                "c1": {"signature": None},
+                "c2": None,
+            }
+        }
+
+        assert get_signed_commits("owner/repo", ["a", "b", "c"]) == {"a"}
+
+        mock_graphql.assert_called_once()
+        query, variables = mock_graphql.call_args.args
+        assert "c2: object(oid: $c2)" in query
+        assert variables == {
+            "owner": "owner",
+            "name": "repo",
+            "c0": "a",
+            "c1": "b",
+            "c2": "c",
+        }
+
+    @patch("replay_commits.SIGNATURE_QUERY_CHUNK", 2)
+    @patch("replay_commits.graphql")
+    def test_chunks_large_lists(self, mock_graphql):
+        mock_graphql.return_value = {"repository": {}}
+        get_signed_commits("owner/repo", ["a", "b", "c"])
+        assert mock_graphql.call_count == 2
+
+    @patch("replay_commits.graphql")
+    def test_error_treated_as_unsigned(self, mock_graphql):
+        mock_graphql.side_effect = RuntimeError("GraphQL error: boom")
+        assert get_signed_commits("owner/repo", ["a"]) == set()
+
+
+class TestFilterNewCommits:
+    @patch("replay_commits.get_signed_commits")
+    @patch("replay_commits.git")
+    def test_uses_single_rev_list(self, mock_git, mock_signed):
+        mock_git.return_value = "a\nb"
+        mock_signed.return_value = {"a"}
+
+        result = filter_new_commits("owner/repo", ["a", "b", "c"], "origin/x", "s")
+
+        assert result == ["b", "c"]
+        mock_git.assert_called_once_with("rev-list", "origin/x", "^s", check=False)
+        mock_signed.assert_called_once_with("owner/repo", ["a", "b"])
+
+    @patch("replay_commits.get_signed_commits")
+    @patch("replay_commits.git")
+    def test_no_remote_commits_skips_query(self, mock_git, mock_signed):
+        mock_git.return_value = ""
+        assert filter_new_commits("owner/repo", ["a"], "origin/x") == ["a"]
+        mock_signed.assert_not_called()
+
+
+@pytest.fixture
+def empty_commit_memo(monkeypatch):
+    monkeypatch.setattr("replay_commits._commit_info", {})
+
+
+@pytest.mark.usefixtures("empty_commit_memo")
+class TestCommitInfo:
+    def commit(self, repo: Path, message: str) -> str:
+        git_in(repo, "commit", "-q", "--allow-empty", "-m", message)
+        return git_in(repo, "rev-parse", "HEAD")
+
+    def test_matches_git_log(self, git_repo):
+        first = self.commit(git_repo, "First subject\n\nFirst body\nmore")
+        second = self.commit(git_repo, "Second subject")
+
+        load_commit_info([first, second])
+
+        for sha in (first, second):
+            for fmt, getter in (
+                ("%B", get_commit_message),
+                ("%s", get_commit_subject),
+                ("%b", get_commit_body),
+            ):
+                assert getter(sha) == git_in(
+                    git_repo, "log", "-1", f"--format={fmt}", sha
+                )
+
+    @patch("replay_commits.git")
+    def test_loads_all_commits_in_one_process(self, mock_git):
+        mock_git.return_value = (
+            "a\0N\0n@example.com\0D\0A\0\0A\n\0"
+            "b\0N\0n@example.com\0D\0B\0body\0B\n\nbody\n"
+        )
+
+        load_commit_info(["a", "b"])
+
+        assert get_commit_subject("a") == "A"
+        assert get_commit_body("b") == "body"
+        assert get_commit_message("b") == "B\n\nbody"
+        assert get_commit_info("a").author_email == "n@example.com"
+        mock_git.assert_called_once()
+
+    def test_memoizes_lookups(self, git_repo):
+        sha = self.commit(git_repo, "Subject")
+        get_commit_subject(sha)
+        with patch("replay_commits.git") as mock_git:
+            assert get_commit_message(sha) == "Subject"
+            mock_git.assert_not_called()
+
+    def test_abbreviated_sha(self, git_repo):
+        sha = self.commit(git_repo, "Subject")
+        assert get_commit_subject(sha[:10]) == "Subject"
+
+
+class TestHttpApi:
+    class FakeClient:
+        def __init__(self, response):
+            self.response = response
+
+        def rest(self, endpoint, method="GET", data=None):
+            return self.response
+
+    def use_response(self, monkeypatch, status, body):
+        from github_client import Response
+
+        client = self.FakeClient(Response(status=status, body=body))
+        monkeypatch.setattr("replay_commits.get_client", lambda: client)
+
+    def test_applies_jq_path(self, monkeypatch):
+        self.use_response(monkeypatch, 200, '{"default_branch": "main"}')
+        assert http_api("repos/o/r", jq=".default_branch") == "main"
+
+    def test_error_raises_when_checked(self, monkeypatch):
+        self.use_response(monkeypatch, 404, '{"message": "Not Found"}')
+        with pytest.raises(subprocess.CalledProcessError):
+            http_api("repos/o/r/issues/1", jq=".title")
+
+    def test_error_returns_body_when_unchecked(self, monkeypatch):
+        self.use_response(monkeypatch, 404, '{"message": "Not Found"}')
+        assert http_api("repos/o/r/git/refs/heads/x", check=False) == (
+            '{"message": "Not Found"}'
+        )
+        assert (
+            http_api("repos/o/r/git/refs/heads/x", jq=".object.sha", check=False) == ""
+        )
+
+
+class TrickleReader(io.BytesIO):
+    """A reader that returns short chunks, like a pipe."""
+
+    def read(self, size=-1):
+        return super().read(min(size, 7) if size and size > 0 else 7)
+
+
+class TestIterBlobJson:
+    def test_round_trips_content(self):
+        data = bytes(range(256)) * 41
+        body = b"".join(iter_blob_json(lambda: nullcontext(io.BytesIO(data)), 30))
+        payload = json.loads(body)
+        assert payload["encoding"] == "base64"
+        assert base64.b64decode(payload["content"]) == data
+        assert len(body) == blob_json_length(len(data))
+
+    def test_short_reads_keep_padding_at_end(self):
+        data = b"x" * 1001
+        body = b"".join(iter_blob_json(lambda: nullcontext(TrickleReader(data)), 30))
+        assert base64.b64decode(json.loads(body)["content"]) == data
+        assert len(body) == blob_json_length(len(data))
+
+    def test_empty_content(self):
+        body = b"".join(iter_blob_json(lambda: nullcontext(io.BytesIO(b""))))
+        assert json.loads(body) == {"encoding": "base64", "content": ""}
+        assert len(body) == blob_json_length(0)
+
+    def test_chunks_are_bounded(self):
+        data = b"y" * (BLOB_CHUNK_SIZE * 3 + 5)
+        chunks = list(iter_blob_json(lambda: nullcontext(io.BytesIO(data))))
+        assert max(len(c) for c in chunks) <= BLOB_CHUNK_SIZE // 3 * 4
+
+
+class TestCreateBlobFromObject:
+    class StreamingClient:
+        def __init__(self):
+            self.body = b""
+            self.length = 0
+
+        def stream(self, method, endpoint, open_body, length):
+            from github_client import Response
+
+            self.body = b"".join(open_body())
+            self.length = length
+            sha = hashlib.sha1(
+                f"blob {len(self.content)}\0".encode() + self.content
+            ).hexdigest()
+            return Response(status=201, body=json.dumps({"sha": sha}))
+
+        @property
+        def content(self):
+            return base64.b64decode(json.loads(self.body)["content"])
+
+    def test_streams_object_content(self, git_repo, monkeypatch):
+        client = self.StreamingClient()
+        monkeypatch.setattr("replay_commits.use_gh_cli", lambda: False)
+        monkeypatch.setattr("replay_commits.get_client", lambda: client)
+        blob = git_in(git_repo, "rev-parse", "HEAD:edit.txt")
+
+        assert create_blob_from_object("owner/repo", blob) == blob
+        assert client.content == b"v1"
+        assert client.length == len(client.body)
+
+
+class TestParseSigningFormat:
+    def test_default(self):
+        assert parse_signing_format(None) == "ssh"
+
+    def test_gpg_alias(self):
+        assert parse_signing_format("GPG") == "openpgp"
+
+    def test_invalid_falls_back(self, capsys):
+        assert parse_signing_format("x509") == "ssh"
+        assert "Invalid REPLAY_SIGNING_FORMAT" in capsys.readouterr().err
+
+
+class TestSigningConfig:
+    def test_ssh_key_contents_written_to_private_file(self):
+        with signing_config("PRIVATE KEY", "ssh") as options:
+            key_path = Path(options[-1].split("=", 1)[1])
+            assert key_path.read_text() == "PRIVATE KEY\n"
+            assert key_path.stat().st_mode & 0o777 == 0o600
+        assert not key_path.exists()
+        assert options[:2] == ["-c", "gpg.format=ssh"]
+
+    def test_openpgp_key_id(self):
+        with signing_config("ABCDEF", "openpgp") as options:
+            assert options == [
+                "-c",
+                "gpg.format=openpgp",
+                "-c",
+                "user.signingkey=ABCDEF",
+            ]
+
+
+@pytest.fixture
+def signing_key(tmp_path):
+    key = tmp_path / "keys" / "id_ed25519"
+    key.parent.mkdir()
+    subprocess.run(
+        ["ssh-keygen", "-q", "-t", "ed25519", "-N", "", "-f", str(key)], check=True
+    )
+    return key
+
+
+@pytest.fixture
+def local_remote(git_repo, tmp_path):
+    """A bare origin with main pushed, and a feature branch checked out."""
+    remote = tmp_path / "remote.git"
+    git_in(tmp_path, "init", "-q", "--bare", str(remote))
+    git_in(git_repo, "branch", "-M", "main")
+    git_in(git_repo, "remote", "add", "origin", str(remote))
+    git_in(git_repo, "push", "-q", "origin", "main")
+    git_in(git_repo, "checkout", "-q", "-b", "feature")
+    return remote
+
+
+def is_signed(repo: Path, sha: str) -> bool:
+    return "gpgsig" in git_in(repo, "cat-file", "commit", sha)
+
+
+@pytest.mark.usefixtures("empty_commit_memo")
+class TestReplayCommitLocal:
+    def test_signs_commit_with_original_tree_and_author(self, git_repo, signing_key):
+        base = git_in(git_repo, "rev-parse", "HEAD")
+        (git_repo / "edit.txt").write_text("v2")
+        (git_repo / "remove.txt").unlink()
+        git_in(git_repo, "add", "-A")
+        git_in(
+            git_repo,
+            "commit",
+            "-q",
+            "--author",
+            "Agent <agent@example.com>",
+            "-m",
+            "Edit\n\nBody",
+        )
+        original = git_in(git_repo, "rev-parse", "HEAD")
+        state = ReplayState(
+            base, git_in(git_repo, "rev-parse", "HEAD~^{tree}"), None, set()
+        )
+
+        with signing_config(str(signing_key), "ssh") as signing:
+            assert replay_commit_local(original, state, signing) is True
+
+        signed = state.parent_sha
+        assert signed != original
+        assert is_signed(git_repo, signed)
+        assert git_in(git_repo, "rev-parse", f"{signed}^{{tree}}") == git_in(
+            git_repo, "rev-parse", f"{original}^{{tree}}"
+        )
+        assert git_in(git_repo, "log", "-1", "--format=%an <%ae>%n%B", signed) == (
+            "Agent <agent@example.com>\nEdit\n\nBody"
+        )
+        assert git_in(git_repo, "rev-parse", f"{signed}^") == base
+
+    def test_empty_commit_skipped(self, git_repo, signing_key):
+        base = git_in(git_repo, "rev-parse", "HEAD")
+        git_in(git_repo, "commit", "-q", "--allow-empty", "-m", "empty")
+        original = git_in(git_repo, "rev-parse", "HEAD")
+        state = ReplayState(
+            base, git_in(git_repo, "rev-parse", "HEAD^{tree}"), None, set()
+        )
+
+        with signing_config(str(signing_key), "ssh") as signing:
+            assert replay_commit_local(original, state, signing) is False
+        assert state.parent_sha == base
+
+
+@pytest.mark.usefixtures("empty_commit_memo")
+class TestLocalReplayMain:
+    def run_main(self, monkeypatch, start_sha, signing_key):
+        monkeypatch.setattr(sys, "argv", ["replay_commits.py", start_sha, "main", "7"])
+        monkeypatch.setenv("GITHUB_REPOSITORY", "owner/repo")
+        monkeypatch.setenv("REPLAY_MODE", "local")
+        monkeypatch.setenv("REPLAY_SIGNING_KEY", signing_key.read_text())
+        monkeypatch.delenv("REPLAY_JOURNAL", raising=False)
+        with (
+            patch("replay_commits.get_default_branch", return_value="main"),
+            patch("replay_commits.get_issue_title", return_value="Issue"),
+            patch("replay_commits.get_remote_branch_sha") as mock_remote,
+            patch("replay_commits.gh_api") as mock_api,
+            patch("replay_commits.create_pull_request") as mock_pr,
+        ):
+            mock_remote.side_effect = lambda repo, branch: (
+                git_in(Path.cwd(), "ls-remote", "origin", f"refs/heads/{branch}").split(
+                    "\t"
+                )[0]
+                or None
+            )
+            assert main() == 0
+        return mock_api, mock_pr
+
+    def test_pushes_signed_branch_and_opens_pr(
+        self, git_repo, local_remote, signing_key, monkeypatch
+    ):
+        start = git_in(git_repo, "rev-parse", "HEAD")
+        for content in ("one", "two"):
+            (git_repo / "edit.txt").write_text(content)
+            git_in(git_repo, "commit", "-qam", f"Write {content}")
+
+        mock_api, mock_pr = self.run_main(monkeypatch, start, signing_key)
+
+        head = git_in(local_remote, "rev-parse", "refs/heads/feature")
+        assert git_in(git_repo, "rev-parse", "HEAD") == head
+        shas = git_in(local_remote, "rev-list", f"{start}..{head}").split()
+        assert len(shas) == 2
+        assert all(is_signed(local_remote, sha) for sha in shas)
+        assert git_in(local_remote, "show", f"{head}:edit.txt") == "two"
+        mock_api.assert_not_called()
+        assert mock_pr.call_args.args[1] == head
+
+    def test_rerun_appends_only_new_commits(
+        self, git_repo, local_remote, signing_key, monkeypatch
+    ):
+        start = git_in(git_repo, "rev-parse", "HEAD")
+        (git_repo / "edit.txt").write_text("one")
+        git_in(git_repo, "commit", "-qam", "First")
+        self.run_main(monkeypatch, start, signing_key)
+        first = git_in(local_remote, "rev-parse", "refs/heads/feature")
+
+        (git_repo / "edit.txt").write_text("two")
+        git_in(git_repo, "commit", "-qam", "Second")
+        _, mock_pr = self.run_main(monkeypatch, start, signing_key)
+
+        head = git_in(local_remote, "rev-parse", "refs/heads/feature")
+        assert git_in(local_remote, "rev-parse", f"{head}^") == first
+        assert is_signed(local_remote, head)
+        mock_pr.assert_not_called()
+
+
+@pytest.mark.usefixtures("empty_commit_memo")
+class TestWorktreeReplayMain:
+    def run_main(self, monkeypatch, start_sha, replay_commit):
+        monkeypatch.setattr(sys, "argv", ["replay_commits.py", start_sha, "main"])
+        monkeypatch.setenv("GITHUB_REPOSITORY", "owner/repo")
+        monkeypatch.setenv("REPLAY_MODE", "worktree")
+        monkeypatch.delenv("REPLAY_JOURNAL", raising=False)
+        with (
+            patch("replay_commits.get_default_branch", return_value="main"),
+            patch("replay_commits.get_remote_branch_sha", return_value=None),
+            patch("replay_commits.replay_commit", side_effect=replay_commit),
+            patch("replay_commits.sync_remote_ref"),
+            patch("replay_commits.create_pull_request", return_value="url"),
+        ):
+            return main()
+
+    def test_retry_resumes_from_original_head(
+        self, git_repo, local_remote, monkeypatch
+    ):
+        """Test a retry replays the commits a failed worktree replay reset away."""
+        start = git_in(git_repo, "rev-parse", "HEAD")
+        originals = []
+        for content in ("one", "two", "three"):
+            (git_repo / "edit.txt").write_text(content)
+            git_in(git_repo, "commit", "-qam", f"Write {content}")
+            originals.append(git_in(git_repo, "rev-parse", "HEAD"))
+        replayed = []
+
+        def replay_commit(repo, original_sha, parent_sha, workers, known_blobs):
+            if original_sha == originals[1] and not replayed.count(original_sha):
+                replayed.append(original_sha)
+                raise subprocess.CalledProcessError(1, ["gh", "api"])
+            replayed.append(original_sha)
+            tree = git_in(git_repo, "rev-parse", f"{original_sha}^{{tree}}")
+            signed = git_in(git_repo, "commit-tree", tree, "-p", parent_sha, "-m", "s")
+            git_in(git_repo, "reset", "-q", "--hard", signed)
+            return signed
+
+        assert self.run_main(monkeypatch, start, replay_commit) == RETRY_EXIT_CODE
+        assert git_in(git_repo, "rev-parse", "HEAD") not in originals
+
+        assert self.run_main(monkeypatch, start, replay_commit) == 0
+        assert replayed == [originals[0], originals[1], originals[1], originals[2]]
+        assert git_in(git_repo, "show", "HEAD:edit.txt") == "three"
+        assert not (git_repo / ".git" / "dobbyphus-replay.jsonl").exists()
+
+    def test_default_branch_not_retried(self, git_repo, local_remote, monkeypatch):
+        start = git_in(git_repo, "rev-parse", "HEAD")
+        git_in(git_repo, "commit", "-q", "--allow-empty", "-m", "change")
+        git_in(git_repo, "checkout", "-q", "-B", "main")
+
+        assert self.run_main(monkeypatch, start, lambda *args: None) == 1
+
+
+class TestPrefetchedContext:
+    def write_context(self, tmp_path, monkeypatch, context) -> None:
+        path = tmp_path / "context.json"
+        path.write_text(json.dumps(context))
+        monkeypatch.setenv("DOBBYPHUS_CONTEXT_FILE", str(path))
+
+    @patch("replay_commits.gh_api")
+    def test_default_branch_from_context(self, mock_gh_api, tmp_path, monkeypatch):
+        self.write_context(
+            tmp_path,
+            monkeypatch,
+            {"repository": "owner/repo", "number": 7, "default_branch": "trunk"},
+        )
+        assert get_default_branch("owner/repo") == "trunk"
+        mock_gh_api.assert_not_called()
+
+    @patch("replay_commits.gh_api")
+    def test_issue_title_from_context(self, mock_gh_api, tmp_path, monkeypatch):
+        self.write_context(
+            tmp_path,
+            monkeypatch,
+            {"repository": "owner/repo", "number": 7, "title": "Fix bug"},
+        )
+        assert get_issue_title("owner/repo", "7") == "Fix bug"
+        mock_gh_api.assert_not_called()
+
+    @patch("replay_commits.gh_api", return_value="Other")
+    def test_other_issue_uses_api(self, mock_gh_api, tmp_path, monkeypatch):
+        self.write_context(
+            tmp_path,
+            monkeypatch,
+            {"repository": "owner/repo", "number": 7, "title": "Fix bug"},
+        )
+        assert get_issue_title("owner/repo", "8") == "Other"
@@ -1,11 +1,24 @@
 """Tests for resolve_thread.py"""
 
+import io
 import sys
 from pathlib import Path
 
+import pytest
+
 sys.path.insert(0, str(Path(__file__).parent.parent / "scripts"))
 
-from resolve_thread import resolve_thread, unresolve_thread
+from resolve_thread import (
+    BATCH_SIZE,
+    main,
+    read_replies,
+    read_thread_ids,
+    reply_and_resolve,
+    reply_and_resolve_threads,
+    resolve_thread,
+    set_threads_resolved,
+    unresolve_thread,
+)
 
 
 class TestResolveThread:
@@ -143,3 +156,226 @@ class TestUnresolveThread:
 
         result = unresolve_thread("thread123")
         assert result is False
+
+
+def batch_responder(calls: list, fail: set[str] = frozenset(), resolved: bool = True):
+    """Fake run_graphql answering aliased (un)resolve mutations."""
+
+    def mock_run_graphql(query, variables, partial=False):
+        calls.append((query, variables, partial))
+        data, errors = {}, []
+        for alias, thread_id in variables.items():
+            if thread_id in fail:
+                data[alias] = None
+                errors.append({"message": "Could not resolve", "path": [alias]})
+            else:
+                data[alias] = {"thread": {"id": thread_id, "isResolved": resolved}}
+        return {"data": data, "errors": errors} if errors else {"data": data}
+
+    return mock_run_graphql
+
+
+class TestSetThreadsResolved:
+    """Tests for set_threads_resolved function."""
+
+    def test_one_request_for_many_threads(self, monkeypatch):
+        """Test 60 threads are resolved with a single mutation document."""
+        calls = []
+        monkeypatch.setattr("resolve_thread.run_graphql", batch_responder(calls))
+        ids = [f"PRRT_{i}" for i in range(60)]
+
+        results = set_threads_resolved(ids)
+
+        assert results == dict.fromkeys(ids, True)
+        assert len(calls) == 1
+        query, variables, partial = calls[0]
+        assert query.count("resolveReviewThread(") == 60
+        assert variables["t59"] == "PRRT_59"
+        assert partial is True
+
+    def test_chunks_large_batches(self, monkeypatch):
+        """Test batches larger than BATCH_SIZE are split."""
+        calls = []
+        monkeypatch.setattr("resolve_thread.run_graphql", batch_responder(calls))
+
+        results = set_threads_resolved([f"PRRT_{i}" for i in range(BATCH_SIZE + 1)])
+
+        assert all(results.values())
+        assert [len(variables) for _, variables, _ in calls] == [BATCH_SIZE, 1]
+
+    def test_partial_failure(self, monkeypatch, capsys):
+        """Test one failing thread doesn't fail the others."""
+        calls = []
+        monkeypatch.setattr(
+            "resolve_thread.run_graphql", batch_responder(calls, fail={"PRRT_b"})
+        )
+
+        results = set_threads_resolved(["PRRT_a", "PRRT_b", "PRRT_c"])
+
+        assert results == {"PRRT_a": True, "PRRT_b": False, "PRRT_c": True}
+        assert "for PRRT_b: Could not resolve" in capsys.readouterr().err
+
+    def test_unresolve(self, monkeypatch):
+        """Test unresolving uses unresolveReviewThread."""
+        calls = []
+        monkeypatch.setattr(
+            "resolve_thread.run_graphql", batch_responder(calls, resolved=False)
+        )
+
+        assert set_threads_resolved(["PRRT_a"], resolved=False) == {"PRRT_a": True}
+        assert "unresolveReviewThread(" in calls[0][0]
+
+    def test_request_failure(self, monkeypatch):
+        """Test a failed request marks every thread in the chunk as failed."""
+        monkeypatch.setattr("resolve_thread.run_graphql", lambda *a, **k: None)
+        assert set_threads_resolved(["PRRT_a", "PRRT_b"]) == {
+            "PRRT_a": False,
+            "PRRT_b": False,
+        }
+
+    def test_duplicates_sent_once(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr("resolve_thread.run_graphql", batch_responder(calls))
+        set_threads_resolved(["PRRT_a", "PRRT_a"])
+        assert calls[0][1] == {"t0": "PRRT_a"}
+
+
+class TestReadThreadIds:
+    """Tests for read_thread_ids function."""
+
+    def test_args(self):
+        assert read_thread_ids(["PRRT_a", "PRRT_b"], []) == ["PRRT_a", "PRRT_b"]
+
+    def test_stdin(self):
+        stdin = ["PRRT_a PRRT_b\n", "\n", "PRRT_c\n"]
+        assert read_thread_ids(["-"], stdin) == ["PRRT_a", "PRRT_b", "PRRT_c"]
+
+
+class TestMain:
+    """Tests for the resolve_thread.py entry point."""
+
+    def test_no_args_prints_usage(self, monkeypatch, capsys):
+        """Test piped stdin is ignored without an explicit `-`."""
+        calls = []
+        monkeypatch.setattr("resolve_thread.run_graphql", batch_responder(calls))
+        monkeypatch.setattr(sys, "argv", ["resolve_thread.py"])
+        monkeypatch.setattr(sys, "stdin", io.StringIO("PRRT_a\n"))
+
+        with pytest.raises(SystemExit) as exc_info:
+            main()
+
+        assert exc_info.value.code == 1
+        assert "Usage:" in capsys.readouterr().err
+        assert calls == []
+
+    def test_dash_reads_stdin(self, monkeypatch, capsys):
+        calls = []
+        monkeypatch.setattr("resolve_thread.run_graphql", batch_responder(calls))
+        monkeypatch.setattr(sys, "argv", ["resolve_thread.py", "-"])
+        monkeypatch.setattr(sys, "stdin", io.StringIO("PRRT_a\n"))
+
+        main()
+
+        assert calls[0][1] == {"t0": "PRRT_a"}
+        assert "Resolved thread: PRRT_a" in capsys.readouterr().out
+
+
+def reply_responder(calls: list, fail_reply: set[str] = frozenset()):
+    """Fake run_graphql answering aliased reply-and-resolve documents."""
+
+    def mock_run_graphql(query, variables, partial=False):
+        calls.append((query, variables))
+        if "unresolveReviewThread(" in query:
+            return batch_responder([], resolved=False)(query, variables, partial)
+        data, errors = {}, []
+        for alias, thread_id in variables.items():
+            if not alias.startswith("t"):
+                continue
+            index = alias[1:]
+            if thread_id in fail_reply:
+                data[f"r{index}"] = None
+                errors.append({"message": "Body is too long", "path": [f"r{index}"]})
+            else:
+                data[f"r{index}"] = {"comment": {"databaseId": 1}}
+            data[alias] = {"thread": {"id": thread_id, "isResolved": True}}
+        return {"data": data, "errors": errors}
+
+    return mock_run_graphql
+
+
+class TestReplyAndResolve:
+    """Tests for reply_and_resolve and reply_and_resolve_threads."""
+
+    def test_single_request(self, monkeypatch):
+        """Test the reply and the resolve go in one document, reply first."""
+        calls = []
+        monkeypatch.setattr("resolve_thread.run_graphql", reply_responder(calls))
+
+        assert reply_and_resolve("PRRT_a", "Fixed!") is True
+
+        assert len(calls) == 1
+        query, variables = calls[0]
+        assert variables == {"t0": "PRRT_a", "b0": "Fixed!"}
+        assert query.index("addPullRequestReviewThreadReply") < query.index(
+            "resolveReviewThread"
+        )
+
+    def test_batch(self, monkeypatch, capsys):
+        """Test per-thread results when one reply fails."""
+        calls = []
+        monkeypatch.setattr(
+            "resolve_thread.run_graphql", reply_responder(calls, fail_reply={"PRRT_b"})
+        )
+
+        results = reply_and_resolve_threads([("PRRT_a", "one"), ("PRRT_b", "two")])
+
+        assert results == {
+            "PRRT_a": {"replied": True, "resolved": True},
+            "PRRT_b": {"replied": False, "resolved": False},
+        }
+        assert "for PRRT_b: Body is too long" in capsys.readouterr().err
+
+    def test_failed_reply_unresolves_thread(self, monkeypatch):
+        """Test a thread resolved without its reply is reopened in one request."""
+        calls = []
+        monkeypatch.setattr(
+            "resolve_thread.run_graphql",
+            reply_responder(calls, fail_reply={"PRRT_b", "PRRT_c"}),
+        )
+
+        reply_and_resolve_threads([("PRRT_a", "1"), ("PRRT_b", "2"), ("PRRT_c", "3")])
+
+        assert len(calls) == 2
+        query, variables = calls[1]
+        assert "unresolveReviewThread(" in query
+        assert variables == {"t0": "PRRT_b", "t1": "PRRT_c"}
+
+    def test_no_unresolve_when_replies_succeed(self, monkeypatch):
+        calls = []
+        monkeypatch.setattr("resolve_thread.run_graphql", reply_responder(calls))
+        reply_and_resolve_threads([("PRRT_a", "1"), ("PRRT_b", "2")])
+        assert len(calls) == 1
+
+    def test_request_failure(self, monkeypatch):
+        monkeypatch.setattr("resolve_thread.run_graphql", lambda *a, **k: None)
+        assert reply_and_resolve("PRRT_a", "Fixed!") is False
+
+
+class TestReadReplies:
+    """Tests for read_replies function."""
+
+    def test_valid(self):
+        stdin = '[{"thread_id": "PRRT_a", "body": "Fixed"}]'
+        assert read_replies(stdin) == [("PRRT_a", "Fixed")]
+
+    def test_invalid_json(self):
+        with pytest.raises(ValueError, match="Invalid JSON"):
+            read_replies("[")
+
+    def test_not_a_list(self):
+        with pytest.raises(TypeError, match="JSON list"):
+            read_replies('{"thread_id": "PRRT_a", "body": "Fixed"}')
+
+    def test_missing_body(self):
+        with pytest.raises(ValueError, match="thread_id and body"):
+            read_replies('[{"thread_id": "PRRT_a"}]')